@@ -13,9 +13,20 @@ __author__ = "Your Name"
 """
 API Routers for the Data Collection Agents application.
 """
-from app.routers.auth import router as auth_router
-from app.routers.agents import router as agents_router
-from app.routers.conversations import router as conversations_router
-from app.routers.analytics import router as analytics_router
+# Routers are resolved on first access so that importing a leaf module such as
+# app.metrics does not pull in FastAPI, pandas and every router.
+_ROUTER_MODULES = {
+    "auth_router": "app.routers.auth",
+    "agents_router": "app.routers.agents",
+    "conversations_router": "app.routers.conversations",
+    "analytics_router": "app.routers.analytics",
+}
 
-__all__ = ["auth_router", "agents_router", "conversations_router", "analytics_router"]
\ No newline at end of file
+__all__ = ["auth_router", "agents_router", "conversations_router", "analytics_router"]
+
+
+def __getattr__(name):
+    if name in _ROUTER_MODULES:
+        import importlib
+        return importlib.import_module(_ROUTER_MODULES[name]).router
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
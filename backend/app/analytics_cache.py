@@ -0,0 +1,156 @@
+"""
+Versioned caching for analytics responses.
+
+Each agent carries a `data_version` that is bumped in the same transaction
+as any change to its conversations that analytics can observe. Analytics
+responses are keyed by (endpoint, agent, version, params): they carry a
+strong ETag derived from that key, answer If-None-Match with 304, and the
+rendered body is kept in a bounded LRU cache so a repeated dashboard load
+costs only the agent lookup the ownership check already does.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, func, inspect, update
+from sqlalchemy.orm import Session
+
+from . import models, serialization
+
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "512"))
+
+# Conversation attributes that feed analytics; changes to other columns
+# (e.g. the transcript on every turn) do not invalidate cached results
+VERSIONED_FIELDS = {
+    "agent_id",
+    "participant_name",
+    "participant_age",
+    "participant_gender",
+    "participant_location",
+    "created_at",
+    "completed_at",
+    "duration_seconds",
+}
+
+
+class ResponseCache:
+    """Thread-safe LRU of rendered response bodies"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Tuple, body: bytes):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache()
+
+
+def data_version(agent: models.Agent) -> int:
+    return agent.data_version or 0
+
+
+def make_etag(namespace: str, scope, version, params: Optional[Dict] = None) -> str:
+    digest = ""
+    if params:
+        digest = "-" + hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return f'"{namespace}-{scope}-v{version}{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    # Weak comparison is fine for If-None-Match (RFC 9110 13.1.2)
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def cached_response(request: Request, namespace: str, agent: models.Agent,
+                    compute: Callable[[], object], params: Optional[Dict] = None) -> Response:
+    """Serve `compute()` for an agent with ETag/304 handling and server-side caching"""
+    return serve_versioned(request, namespace, agent.id, data_version(agent), compute, params)
+
+
+def agents_version(agents: List[models.Agent]) -> str:
+    """Combined version of several agents; changes when any of them (or the set) changes"""
+    state = ",".join(f"{agent.id}:{data_version(agent)}" for agent in sorted(agents, key=lambda a: a.id))
+    return hashlib.sha1(state.encode()).hexdigest()[:16]
+
+
+def serve_versioned(request: Request, namespace: str, scope, version, compute: Callable[[], object],
+                    params: Optional[Dict] = None) -> Response:
+    etag = make_etag(namespace, scope, version, params)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (namespace, scope, version, json.dumps(params or {}, sort_keys=True, default=str))
+    body = response_cache.get(key)
+    if body is None:
+        body = serialization.dumps_bytes(jsonable_encoder(compute()))
+        response_cache.put(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _conversation_touches_analytics(conversation: models.Conversation) -> bool:
+    state = inspect(conversation)
+    return any(state.attrs[field].history.has_changes() for field in VERSIONED_FIELDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_agent_versions(session: Session, flush_context):
+    """Bump data_version of agents whose conversations changed in this flush"""
+    agent_ids = set()
+    for obj in session.new:
+        if isinstance(obj, models.Conversation) and obj.agent_id is not None:
+            agent_ids.add(obj.agent_id)
+    for obj in session.deleted:
+        if isinstance(obj, models.Conversation) and obj.agent_id is not None:
+            agent_ids.add(obj.agent_id)
+    for obj in session.dirty:
+        if isinstance(obj, models.Conversation) and obj.agent_id is not None \
+                and _conversation_touches_analytics(obj):
+            agent_ids.add(obj.agent_id)
+    if agent_ids:
+        bump_versions(session, agent_ids)
+
+
+def bump_versions(session: Session, agent_ids):
+    """Invalidate cached analytics for the given agents (for writes that bypass the ORM)"""
+    agents = models.Agent.__table__
+    session.connection().execute(
+        update(agents)
+        .where(agents.c.id.in_(sorted(agent_ids)))
+        .values(data_version=func.coalesce(agents.c.data_version, 0) + 1)
+    )
@@ -0,0 +1,272 @@
+"""
+Cold storage for transcripts of old completed conversations.
+
+Transcripts are the bulk of a conversation row, yet once a conversation is
+finished only its stats columns are read by live traffic and analytics.
+Conversations completed more than ARCHIVE_AFTER_DAYS ago have their
+transcript compressed into conversation_archives; the hot row keeps its
+metadata and stats, gets `archived_at` set and `full_conversation` cleared.
+
+Readers that need the transcript go through `get_transcript`, which
+rehydrates archived ones transparently; exports preload a whole batch with
+`preload_transcripts`. A conversation that is resumed is restored to the
+hot table first.
+
+Archiving runs every ARCHIVE_INTERVAL_MINUTES in the API process (0 turns
+that off), or from cron:
+
+    python -m app.archive run [--days N]   # archive eligible conversations
+    python -m app.archive restore ID       # move one transcript back
+    python -m app.archive stats
+
+Transcripts are compressed with zstd (the `zstandard` package from
+requirements.txt). The codec is stored per row; zlib is only read, for rows
+archived before zstd was required.
+"""
+import argparse
+import logging
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, null, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from . import conversation_stats, metrics, models, serialization
+
+try:
+    import zstandard
+except ImportError:  # missing install; archived zlib rows stay readable
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_MINUTES = float(os.getenv("ARCHIVE_INTERVAL_MINUTES", "60"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+
+CODEC = "zstd"
+
+# Instance attribute holding a preloaded archived transcript
+_TRANSCRIPT_ATTR = "_archived_transcript"
+
+
+def compress(data: bytes) -> bytes:
+    if zstandard is None:
+        raise RuntimeError("Archiving transcripts needs zstandard; install requirements.txt")
+    return zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(data)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archived transcript is zstd-compressed; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown archive codec {codec!r}")
+
+
+def _decode(row: models.ConversationArchive) -> List[Dict]:
+    return serialization.loads(decompress(row.codec, row.transcript))
+
+
+def load_transcripts(db: Session, conversation_ids: Iterable[int]) -> Dict[int, List[Dict]]:
+    """Archived transcripts by conversation id, in one query"""
+    ids = list(conversation_ids)
+    if not ids:
+        return {}
+    rows = db.query(models.ConversationArchive).filter(models.ConversationArchive.conversation_id.in_(ids))
+    return {row.conversation_id: _decode(row) for row in rows}
+
+
+def preload_transcripts(db: Session, conversations: List[models.Conversation]):
+    """Fetch the archived transcripts of a batch so get_transcript needs no query per row"""
+    archived = [conversation for conversation in conversations if conversation.archived_at is not None]
+    transcripts = load_transcripts(db, [conversation.id for conversation in archived])
+    for conversation in archived:
+        setattr(conversation, _TRANSCRIPT_ATTR, transcripts.get(conversation.id, []))
+
+
+def get_transcript(conversation: models.Conversation) -> List[Dict]:
+    """The conversation's transcript, from the hot row or the archive"""
+    if conversation.archived_at is None:
+        return conversation.full_conversation or []
+    transcript = getattr(conversation, _TRANSCRIPT_ATTR, None)
+    if transcript is None:
+        transcript = load_transcripts(object_session(conversation), [conversation.id]).get(conversation.id, [])
+        setattr(conversation, _TRANSCRIPT_ATTR, transcript)
+    return transcript
+
+
+def restore(db: Session, conversation: models.Conversation) -> bool:
+    """Move an archived transcript back into the hot row; returns whether it was archived"""
+    if conversation.archived_at is None:
+        return False
+    conversation.full_conversation = get_transcript(conversation)
+    conversation.archived_at = None
+    db.query(models.ConversationArchive).filter(
+        models.ConversationArchive.conversation_id == conversation.id
+    ).delete(synchronize_session=False)
+    db.commit()
+    metrics.archive_conversations_total.inc(direction="restored")
+    return True
+
+
+def archive_conversations(db: Session, older_than_days: float = ARCHIVE_AFTER_DAYS,
+                          batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Archive transcripts of conversations completed more than `older_than_days` ago"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    query = db.query(models.Conversation).filter(
+        models.Conversation.completed_at < cutoff,
+        models.Conversation.archived_at.is_(None),
+        models.Conversation.full_conversation.isnot(None)
+    ).order_by(models.Conversation.id)
+
+    total = 0
+    last_id = 0
+    while True:
+        batch = query.filter(models.Conversation.id > last_id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        ids = [conversation.id for conversation in batch]
+        archived = _archive_batch(db, batch)
+        if archived is None:
+            # Another process archived some of these meanwhile: retry the
+            # ones that are still hot
+            rest = query.filter(models.Conversation.id.in_(ids)).all()
+            archived = _archive_batch(db, rest) if rest else 0
+            if archived is None:
+                logger.info("Skipped a batch of conversations archived concurrently")
+                archived = 0
+        db.expunge_all()
+        total += archived
+    return total
+
+
+def _archive_batch(db: Session, batch: List[models.Conversation]) -> Optional[int]:
+    """Archive and commit a batch; None (rolled back) if another process archived one of them first"""
+    now = datetime.utcnow()
+    ids = []
+    for conversation in batch:
+        # Stats must not depend on the transcript once it is cold
+        conversation_stats.ensure_stats(conversation)
+        raw = serialization.dumps_bytes(conversation.full_conversation)
+        db.add(models.ConversationArchive(
+            conversation_id=conversation.id,
+            codec=CODEC,
+            transcript=compress(raw),
+            raw_bytes=len(raw),
+            archived_at=now
+        ))
+        ids.append(conversation.id)
+    try:
+        # Archiving is not a change of the conversation: keep updated_at
+        # so delta exports do not pick the rows up again
+        db.execute(
+            update(models.Conversation)
+            .where(models.Conversation.id.in_(ids), models.Conversation.archived_at.is_(None))
+            .values(full_conversation=null(), archived_at=now,
+                    updated_at=models.Conversation.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    metrics.archive_conversations_total.inc(len(ids), direction="archived")
+    return len(ids)
+
+
+def archive_stats(db: Session) -> Dict:
+    count, raw_bytes, stored_bytes = db.query(
+        func.count(models.ConversationArchive.conversation_id),
+        func.coalesce(func.sum(models.ConversationArchive.raw_bytes), 0),
+        func.coalesce(func.sum(func.length(models.ConversationArchive.transcript)), 0)
+    ).one()
+    hot = db.query(func.count(models.Conversation.id)).filter(models.Conversation.archived_at.is_(None)).scalar()
+    return {
+        "archived_conversations": count,
+        "hot_conversations": hot,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "compression_ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else None,
+        "codec": CODEC,
+    }
+
+
+class Archiver:
+    """Background thread archiving old transcripts every ARCHIVE_INTERVAL_MINUTES"""
+
+    def __init__(self, interval_minutes: float = ARCHIVE_INTERVAL_MINUTES):
+        self.interval = interval_minutes * 60
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self) -> int:
+        from .database import SessionLocal
+        with SessionLocal() as db:
+            archived = archive_conversations(db)
+        if archived:
+            logger.info("Archived %s conversation transcripts", archived)
+        return archived
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Archiving transcripts failed")
+
+
+archiver = Archiver()
+
+
+def main(argv: Optional[List[str]] = None):
+    from .database import SessionLocal, engine
+    from .migrations import upgrade_schema
+
+    parser = argparse.ArgumentParser(description="Move old conversation transcripts to cold storage")
+    parser.add_argument("command", choices=["run", "restore", "stats"])
+    parser.add_argument("conversation_id", type=int, nargs="?")
+    parser.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS,
+                        help="archive conversations completed more than this many days ago")
+    args = parser.parse_args(argv)
+
+    models.Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    with SessionLocal() as db:
+        if args.command == "run":
+            print(f"Archived {archive_conversations(db, older_than_days=args.days)} conversations")
+        elif args.command == "restore":
+            if args.conversation_id is None:
+                parser.error("restore needs a conversation id")
+            conversation = db.get(models.Conversation, args.conversation_id)
+            if conversation is None:
+                parser.error(f"conversation {args.conversation_id} not found")
+            print("Restored" if restore(db, conversation) else "Conversation is not archived")
+        else:
+            for key, value in archive_stats(db).items():
+                print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
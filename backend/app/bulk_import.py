@@ -0,0 +1,248 @@
+"""
+Bulk import of existing conversations from JSONL.
+
+Each line is one conversation, validated with schemas.ConversationImport:
+
+    {"participant": {"name": "Ana", "age": 34, "gender": "female", "location": "Lima, Peru"},
+     "messages": [{"sender": "agent", "message": "...", "timestamp": "2023-05-01T10:00:00"},
+                  {"sender": "user", "message": "..."}],
+     "created_at": "2023-05-01T10:00:00", "completed_at": "2023-05-01T10:20:00",
+     "summary": "...", "session_id": "optional, must be unique"}
+
+Valid lines are inserted IMPORT_BATCH_SIZE at a time: one multi-row
+INSERT for the conversations (with their stats and coordinates computed
+up front), one executemany for their message rows and one commit per
+batch. Invalid lines are skipped and reported with their line number.
+
+    python -m app.bulk_import AGENT_ID conversations.jsonl
+"""
+import argparse
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, IO, Iterable, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import analytics_cache, conversation_stats, geocoding, models, schemas, search, timeseries
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Errors listed in a result; the rest are only counted
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+SENDERS = ("user", "agent")
+
+# Conversation columns written by an import
+CONVERSATION_COLUMNS = [
+    "agent_id", "session_id", "participant_name", "participant_age", "participant_gender",
+    "participant_location", "participant_info", "full_conversation", "summary", "key_terms",
+    "created_at", "completed_at", "updated_at",
+    "total_message_count", "user_message_count", "agent_message_count", "first_user_message",
+    "last_user_message", "last_agent_message", "themes", "topic_word_counts", "duration_seconds",
+    "location_latitude", "location_longitude", "geocoded_location",
+]
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.started = time.perf_counter()
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> Dict:
+        seconds = time.perf_counter() - self.started
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "conversations_per_second": round(self.imported / seconds) if seconds else None,
+        }
+
+
+def _validation_message(error: ValidationError) -> str:
+    details = error.errors()
+    first = details[0]
+    location = ".".join(str(part) for part in first.get("loc", ()))
+    message = f"{location}: {first['msg']}" if location else first["msg"]
+    if len(details) > 1:
+        message += f" (and {len(details) - 1} more)"
+    return message
+
+
+def parse_line(raw: Union[str, bytes]) -> schemas.ConversationImport:
+    record = schemas.ConversationImport.model_validate_json(raw)
+    for position, message in enumerate(record.messages):
+        if message.sender not in SENDERS:
+            raise ValueError(f"messages.{position}.sender: must be 'user' or 'agent'")
+    return record
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, as the rest of the application stores timestamps"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def build_conversation(agent_id: int, record: schemas.ConversationImport, now: datetime) -> SimpleNamespace:
+    """Column values of a conversation, with stats and coordinates filled in.
+
+    A plain namespace rather than a Conversation instance: the stats and
+    geocoding helpers only read and set attributes, and skipping ORM
+    instrumentation keeps imports fast.
+    """
+    participant = record.participant
+    transcript = [
+        {
+            "sender": message.sender,
+            "message": message.message,
+            "timestamp": _utc(message.timestamp).isoformat() if message.timestamp else None,
+            "type": "text",
+        }
+        for message in record.messages
+    ]
+    conversation = SimpleNamespace(**dict.fromkeys(CONVERSATION_COLUMNS))
+    conversation.agent_id = agent_id
+    conversation.session_id = record.session_id or str(uuid.uuid4())
+    conversation.participant_name = participant.name
+    conversation.participant_age = participant.age
+    conversation.participant_gender = participant.gender
+    conversation.participant_location = participant.location
+    conversation.participant_info = participant.additional_info or {}
+    conversation.full_conversation = transcript
+    conversation.summary = record.summary
+    conversation.key_terms = record.key_terms or {}
+    conversation.created_at = _utc(record.created_at) or now
+    conversation.completed_at = _utc(record.completed_at)
+    conversation.updated_at = now
+    conversation_stats.compute_stats(conversation)
+    geocoding.apply_to_conversation(conversation)
+    return conversation
+
+
+def _existing_session_ids(db: Session, session_ids: List[str]) -> set:
+    rows = db.query(models.Conversation.session_id).filter(models.Conversation.session_id.in_(session_ids))
+    return {session_id for (session_id,) in rows}
+
+
+def _insert_batch(db: Session, agent_id: int, batch: List[Tuple[int, schemas.ConversationImport]],
+                  result: ImportResult):
+    now = datetime.utcnow()
+    conversations = [(line, record, build_conversation(agent_id, record, now)) for line, record in batch]
+
+    # Session ids must stay unique, within the file as well as against the database
+    taken = _existing_session_ids(db, [conversation.session_id for _, _, conversation in conversations])
+    accepted = []
+    for line, record, conversation in conversations:
+        if conversation.session_id in taken:
+            result.error(line, f"session_id {conversation.session_id!r} already exists")
+            continue
+        taken.add(conversation.session_id)
+        accepted.append((line, record, conversation))
+    if not accepted:
+        return
+
+    # Core statements on the session's connection: no ORM bookkeeping per row
+    connection = db.connection()
+    try:
+        ids = connection.execute(
+            insert(models.Conversation.__table__).returning(
+                models.Conversation.__table__.c.id, sort_by_parameter_order=True
+            ),
+            [vars(conversation) for _, _, conversation in accepted]
+        ).scalars().all()
+        message_rows = [
+            {
+                "conversation_id": conversation_id,
+                "agent_id": agent_id,
+                "sender": message.sender,
+                "message": message.message,
+                "timestamp": _utc(message.timestamp) or conversation.created_at,
+            }
+            for conversation_id, (_, record, conversation) in zip(ids, accepted)
+            for message in record.messages
+        ]
+        if message_rows:
+            connection.execute(insert(models.ConversationMessage.__table__), message_rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        for line, _, _ in accepted:
+            result.error(line, f"database error: {e}")
+        return
+    result.imported += len(accepted)
+
+
+def import_conversations(db: Session, agent_id: int, lines: Iterable[Union[str, bytes]],
+                         batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    """Validate and insert JSONL conversations for an agent"""
+    result = ImportResult()
+    batch: List[Tuple[int, schemas.ConversationImport]] = []
+    for line_number, raw in enumerate(lines, start=1):
+        if not raw.strip():
+            continue
+        try:
+            batch.append((line_number, parse_line(raw)))
+        except ValidationError as e:
+            result.error(line_number, _validation_message(e))
+            continue
+        except ValueError as e:
+            result.error(line_number, str(e))
+            continue
+        if len(batch) >= batch_size:
+            _insert_batch(db, agent_id, batch, result)
+            batch = []
+    if batch:
+        _insert_batch(db, agent_id, batch, result)
+
+    if result.imported:
+        # Core inserts bypass the ORM hooks that bump the agent's versions;
+        # the bumps invalidate cached analytics and (backdated) timeseries
+        # buckets in every process
+        analytics_cache.bump_versions(db, [agent_id])
+        timeseries.bump_versions(db, [agent_id])
+        db.commit()
+    return result
+
+
+def import_file(db: Session, agent_id: int, file: IO[bytes], batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    return import_conversations(db, agent_id, iter(file.readline, b""), batch_size=batch_size)
+
+
+def main(argv: Optional[List[str]] = None):
+    from .database import SessionLocal, engine
+    from .migrations import upgrade_schema
+
+    parser = argparse.ArgumentParser(description="Import conversations for an agent from a JSONL file")
+    parser.add_argument("agent_id", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    models.Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    search.init_search_index(engine)
+    with SessionLocal() as db:
+        if db.get(models.Agent, args.agent_id) is None:
+            parser.error(f"agent {args.agent_id} not found")
+        with open(args.path, "rb") as file:
+            result = import_file(db, args.agent_id, file, batch_size=args.batch_size).to_dict()
+    for error in result["errors"]:
+        print(f"line {error['line']}: {error['error']}")
+    print(f"Imported {result['imported']} conversations, {result['failed']} failed "
+          f"({result['conversations_per_second']} conversations/s)")
+
+
+if __name__ == "__main__":
+    main()
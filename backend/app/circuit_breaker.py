@@ -0,0 +1,140 @@
+"""
+Circuit breakers for upstream APIs (LLM endpoints, ElevenLabs).
+
+A breaker starts closed. After CIRCUIT_FAILURE_THRESHOLD consecutive
+failures (connection errors, timeouts, 429/5xx responses) it opens and
+callers skip the upstream and go straight to their fallback path. After
+CIRCUIT_RECOVERY_SECONDS it turns half-open and lets CIRCUIT_HALF_OPEN_PROBES
+requests through at a time: CIRCUIT_SUCCESS_THRESHOLD successes close it
+again, any failure re-opens it for another recovery period.
+
+Breakers are used from the event loop only, so state changes need no locks.
+"""
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+CIRCUIT_SUCCESS_THRESHOLD = int(os.getenv("CIRCUIT_SUCCESS_THRESHOLD", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def is_failure_status(status_code: int) -> bool:
+    """Responses that say the upstream is unhealthy (as opposed to a bad request)"""
+    return status_code == 429 or status_code >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS,
+                 half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+                 success_threshold: int = CIRCUIT_SUCCESS_THRESHOLD):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.success_threshold = max(1, success_threshold)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.half_open_successes = 0
+        self.probes_in_flight = 0
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+        metrics.circuit_breaker_state.set(STATE_VALUES[CLOSED], upstream=name)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        metrics.circuit_breaker_state.set(STATE_VALUES[state], upstream=self.name)
+        metrics.circuit_breaker_transitions_total.inc(upstream=self.name, state=state)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self.half_open_successes = 0
+            self.probes_in_flight = 0
+        else:
+            self.opened_at = None
+            self.consecutive_failures = 0
+
+    def allow(self) -> bool:
+        """Whether a request may go out now; reserves a probe slot when half-open.
+
+        Every allowed request must be followed by record_success,
+        record_failure or release.
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_seconds:
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self.probes_in_flight < self.half_open_probes:
+            self.probes_in_flight += 1
+            return True
+        self.rejected += 1
+        metrics.circuit_breaker_rejections_total.inc(upstream=self.name)
+        return False
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            self.half_open_successes += 1
+            if self.half_open_successes >= self.success_threshold:
+                self._transition(CLOSED)
+        else:
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        self.consecutive_failures += 1
+        if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._transition(OPEN)
+
+    def release(self):
+        """An allowed request ended without a verdict (e.g. it was cancelled)"""
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def snapshot(self) -> Dict:
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = max(0.0, round(self.recovery_seconds - (time.monotonic() - self.opened_at), 1))
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "retry_in_seconds": retry_in,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker for an upstream, created on first use"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def snapshot() -> List[Dict]:
+    return [breaker.snapshot() for breaker in list(_breakers.values())]
+
+
+def any_open() -> bool:
+    return any(breaker.state == OPEN for breaker in list(_breakers.values()))
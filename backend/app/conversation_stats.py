@@ -0,0 +1,190 @@
+"""
+Per-conversation statistics maintained at write time.
+
+Message counts, first/last messages, detected themes, topic word counts and
+duration are stored as columns on Conversation and updated incrementally
+as turns arrive, so summary and export endpoints read them in O(1) instead
+of rescanning `full_conversation`.
+
+    python -m app.conversation_stats backfill   # fill stats for existing rows
+"""
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Stored message excerpts keep one character past the longest display
+# truncation (200) so readers can still tell whether to append "..."
+EXCERPT_CHARS = 201
+
+THEMES = {
+    "health": ["health", "medical", "doctor", "hospital", "medicine", "treatment", "symptoms"],
+    "agriculture": ["farm", "crop", "farming", "agriculture", "harvest", "soil", "plant"],
+    "education": ["school", "learn", "education", "teacher", "student", "study", "knowledge"],
+    "technology": ["computer", "software", "digital", "internet", "app", "technology"],
+    "finance": ["money", "bank", "investment", "finance", "budget", "income", "expense"],
+    "social": ["family", "community", "social", "friends", "society", "culture", "relationship"]
+}
+
+COMMON_WORDS = {'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
+
+
+def has_stats(conversation: models.Conversation) -> bool:
+    return conversation.total_message_count is not None
+
+
+def reset_stats(conversation: models.Conversation):
+    conversation.total_message_count = 0
+    conversation.user_message_count = 0
+    conversation.agent_message_count = 0
+    conversation.first_user_message = None
+    conversation.last_user_message = None
+    conversation.last_agent_message = None
+    conversation.themes = []
+    conversation.topic_word_counts = {}
+
+
+def apply_messages(conversation: models.Conversation, messages: List[Dict]):
+    """Fold newly stored transcript entries into the conversation's stats"""
+    if not has_stats(conversation):
+        compute_stats(conversation)
+        return
+
+    themes = set(conversation.themes or [])
+    word_counts = dict(conversation.topic_word_counts or {})
+    for msg in messages:
+        conversation.total_message_count += 1
+        sender = msg.get("sender")
+        text = msg.get("message", "") or ""
+        if sender == "user":
+            conversation.user_message_count += 1
+            if conversation.first_user_message is None:
+                conversation.first_user_message = text[:EXCERPT_CHARS]
+            conversation.last_user_message = text[:EXCERPT_CHARS]
+            lowered = text.lower()
+            for theme, keywords in THEMES.items():
+                if theme not in themes and any(keyword in lowered for keyword in keywords):
+                    themes.add(theme)
+            for word in lowered.split():
+                if len(word) > 3 and word not in COMMON_WORDS:
+                    word_counts[word] = word_counts.get(word, 0) + 1
+        elif sender == "agent":
+            conversation.agent_message_count += 1
+            conversation.last_agent_message = text[:EXCERPT_CHARS]
+
+    # Reassign so SQLAlchemy sees the JSON columns as changed
+    conversation.themes = [theme for theme in THEMES if theme in themes]
+    conversation.topic_word_counts = word_counts
+
+
+def compute_stats(conversation: models.Conversation):
+    """Recompute all stats from the stored transcript"""
+    reset_stats(conversation)
+    apply_messages(conversation, conversation.full_conversation or [])
+    update_duration(conversation)
+
+
+def update_duration(conversation: models.Conversation):
+    if conversation.created_at and conversation.completed_at:
+        created_at = conversation.created_at
+        completed_at = conversation.completed_at
+        if (created_at.tzinfo is None) != (completed_at.tzinfo is None):
+            created_at = created_at.replace(tzinfo=None)
+            completed_at = completed_at.replace(tzinfo=None)
+        conversation.duration_seconds = (completed_at - created_at).total_seconds()
+
+
+def mark_completed(conversation: models.Conversation, completed_at: Optional[datetime] = None):
+    conversation.completed_at = completed_at or datetime.utcnow()
+    update_duration(conversation)
+
+
+def _truncate(text: Optional[str], limit: int) -> str:
+    if not text:
+        return ""
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def summary_text(conversation: models.Conversation) -> str:
+    """Same output as analytics.extract_conversation_summary, from stored stats"""
+    if not conversation.total_message_count:
+        return "No conversation data available"
+    if not conversation.user_message_count:
+        return "No user responses recorded"
+
+    summary_parts = [f"Conversation with {conversation.user_message_count} user responses"]
+    if conversation.themes:
+        summary_parts.append(f"Main themes: {', '.join(conversation.themes)}")
+    summary_parts.append(f"Opening topic: {_truncate(conversation.first_user_message, 100)}")
+    if conversation.user_message_count > 1:
+        summary_parts.append(f"Closing topic: {_truncate(conversation.last_user_message, 100)}")
+    return " | ".join(summary_parts)
+
+
+def first_user_response(conversation: models.Conversation) -> str:
+    return _truncate(conversation.first_user_message, 200)
+
+
+def last_agent_response(conversation: models.Conversation) -> str:
+    return _truncate(conversation.last_agent_message, 200)
+
+
+def key_topics(conversation: models.Conversation, limit: int = 5) -> List[Dict]:
+    word_counts = conversation.topic_word_counts or {}
+    top = sorted(word_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
+    return [{"topic": topic, "frequency": freq} for topic, freq in top]
+
+
+def duration_minutes(conversation: models.Conversation) -> Optional[float]:
+    if conversation.duration_seconds is None:
+        update_duration(conversation)
+    if conversation.duration_seconds is None:
+        return None
+    return conversation.duration_seconds / 60
+
+
+def ensure_stats(conversation: models.Conversation):
+    """Compute stats for rows written before the stats columns existed"""
+    if not has_stats(conversation):
+        compute_stats(conversation)
+
+
+def backfill_stats(db: Session, batch_size: int = 500) -> int:
+    """Fill stats for conversations that do not have them yet"""
+    total = 0
+    last_id = 0
+    while True:
+        batch = db.query(models.Conversation).filter(
+            models.Conversation.total_message_count.is_(None),
+            models.Conversation.id > last_id
+        ).order_by(models.Conversation.id).limit(batch_size).all()
+        if not batch:
+            break
+        for conversation in batch:
+            compute_stats(conversation)
+        last_id = batch[-1].id
+        total += len(batch)
+        db.commit()
+        db.expunge_all()
+    return total
+
+
+def main(argv: Optional[List[str]] = None):
+    from .database import SessionLocal, engine
+    from .migrations import upgrade_schema
+
+    args = argv if argv is not None else sys.argv[1:]
+    if args and args[0] != "backfill":
+        print("usage: python -m app.conversation_stats [backfill]")
+        sys.exit(2)
+    models.Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    with SessionLocal() as db:
+        print(f"Backfilled stats for {backfill_stats(db)} conversations")
+
+
+if __name__ == "__main__":
+    main()
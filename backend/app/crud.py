@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from . import models, schemas
+from sqlalchemy import func, case
+from . import models, schemas, search, conversation_stats, geocoding
+from . import analytics_cache  # noqa: F401 - registers agent data_version bumping
 from passlib.context import CryptContext
 import uuid
 import json
@@ -81,17 +82,30 @@ def create_conversation(db: Session, agent_id: int, participant_data: schemas.Pa
         full_conversation=[],
         key_terms={}
     )
+    geocoding.apply_to_conversation(db_conversation)
     db.add(db_conversation)
     db.commit()
     db.refresh(db_conversation)
     return db_conversation
 
-def update_conversation(db: Session, conversation_id: int, messages: List[Dict], summary: str = None):
+def apply_conversation_update(db: Session, conversation: models.Conversation, messages: List[Dict],
+                              summary: str = None, new_messages: Optional[List[Dict]] = None):
+    """Stage a transcript update in `db` without committing"""
+    conversation.full_conversation = messages
+    if summary:
+        conversation.summary = summary
+    if new_messages:
+        conversation_stats.apply_messages(conversation, new_messages)
+        db.add_all(search.message_rows(conversation, new_messages))
+    else:
+        conversation_stats.compute_stats(conversation)
+
+def update_conversation(db: Session, conversation_id: int, messages: List[Dict], summary: str = None,
+                        new_messages: Optional[List[Dict]] = None):
+    """Store the transcript; `new_messages` are also written as searchable message rows"""
     conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
     if conversation:
-        conversation.full_conversation = messages
-        if summary:
-            conversation.summary = summary
+        apply_conversation_update(db, conversation, messages, summary=summary, new_messages=new_messages)
         db.commit()
         db.refresh(conversation)
     return conversation
@@ -160,4 +174,91 @@ def get_location_data(db: Session, agent_id: int = None):
         location = conv.participant_location
         location_counts[location] = location_counts.get(location, 0) + 1
     
-    return [{"location": k, "count": v} for k, v in location_counts.items()]
\ No newline at end of file
+    return [{"location": k, "count": v} for k, v in location_counts.items()]
+
+AGE_RANGES = ["18-25", "26-35", "36-45", "46-55", "56+"]
+
+def _age_range_expression():
+    # Same buckets as get_age_distribution, everything else counts as 56+
+    age = models.Conversation.participant_age
+    return case(
+        (age.between(18, 25), "18-25"),
+        (age.between(26, 35), "26-35"),
+        (age.between(36, 45), "36-45"),
+        (age.between(46, 55), "46-55"),
+        else_="56+"
+    )
+
+def _breakdowns(age_counts: Dict[str, int], gender_counts: Dict[str, int], location_counts: Dict[str, int]):
+    total = sum(gender_counts.values())
+    return {
+        "age_distribution": [{"age_range": k, "count": age_counts.get(k, 0)} for k in AGE_RANGES],
+        "gender_breakdown": [
+            {"gender": gender, "count": count, "percentage": round(count / total * 100, 2) if total > 0 else 0}
+            for gender, count in gender_counts.items()
+        ],
+        "location_data": [
+            {"location": location, "count": count}
+            for location, count in sorted(location_counts.items(), key=lambda item: item[1], reverse=True)
+        ],
+    }
+
+def get_portfolio_analytics(db: Session, agents: List[models.Agent]):
+    """Volumes and demographics for several agents from one grouped pass over their conversations"""
+    conversation = models.Conversation
+    age_range = _age_range_expression()
+    rows = db.query(
+        conversation.agent_id,
+        age_range,
+        conversation.participant_gender,
+        conversation.participant_location,
+        func.count(conversation.id),
+        func.count(conversation.completed_at),
+        func.sum(conversation.duration_seconds),
+        func.count(conversation.duration_seconds),
+        func.sum(conversation.user_message_count),
+        func.count(conversation.user_message_count),
+    ).filter(
+        conversation.agent_id.in_([agent.id for agent in agents])
+    ).group_by(
+        conversation.agent_id, age_range, conversation.participant_gender, conversation.participant_location
+    ).all()
+    
+    def empty_totals():
+        return {"conversations": 0, "completed": 0, "duration_sum": 0.0, "duration_count": 0,
+                "turns_sum": 0, "turns_count": 0, "ages": {}, "genders": {}, "locations": {}}
+    
+    per_agent = {agent.id: empty_totals() for agent in agents}
+    overall = empty_totals()
+    for agent_id, age, gender, location, count, completed, duration_sum, duration_count, turns_sum, turns_count in rows:
+        gender = gender or "unknown"
+        location = location or "Unknown"
+        for totals in (per_agent[agent_id], overall):
+            totals["conversations"] += count
+            totals["completed"] += completed
+            totals["duration_sum"] += duration_sum or 0
+            totals["duration_count"] += duration_count
+            totals["turns_sum"] += turns_sum or 0
+            totals["turns_count"] += turns_count
+            totals["ages"][age] = totals["ages"].get(age, 0) + count
+            totals["genders"][gender] = totals["genders"].get(gender, 0) + count
+            totals["locations"][location] = totals["locations"].get(location, 0) + count
+    
+    def summarize(totals):
+        return {
+            "total_conversations": totals["conversations"],
+            "completed_conversations": totals["completed"],
+            "avg_duration_seconds": round(totals["duration_sum"] / totals["duration_count"], 2)
+            if totals["duration_count"] else None,
+            "avg_turns": round(totals["turns_sum"] / totals["turns_count"], 2) if totals["turns_count"] else None,
+            **_breakdowns(totals["ages"], totals["genders"], totals["locations"]),
+        }
+    
+    return {
+        "total_agents": len(agents),
+        **summarize(overall),
+        "agents": [
+            {"agent_id": agent.id, "name": agent.name, "is_active": agent.is_active, **summarize(per_agent[agent.id])}
+            for agent in agents
+        ],
+    }
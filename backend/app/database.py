@@ -1,16 +1,63 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+from . import query_stats, serialization
 
 # Create SQLite database in the project directory
 SQLALCHEMY_DATABASE_URL = "sqlite:///./data_collection_agents.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
+# Analytics and exports read through their own engine: a read replica when
+# DATABASE_READ_URL is set, otherwise read-only connections to the same
+# SQLite file, so long reads never take write locks or wait behind turns
+DATABASE_READ_URL = os.getenv(
+    "DATABASE_READ_URL",
+    "sqlite:///file:./data_collection_agents.db?mode=ro&uri=true"
 )
+READ_DB_MMAP_BYTES = int(os.getenv("READ_DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+READ_DB_CACHE_KB = int(os.getenv("READ_DB_CACHE_KB", str(64 * 1024)))
+
+
+def _create_engine(url: str):
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    new_engine = create_engine(
+        url,
+        connect_args=connect_args,
+        json_serializer=serialization.dumps,
+        json_deserializer=serialization.loads
+    )
+    query_stats.instrument_engine(new_engine)
+    return new_engine
+
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = _create_engine(DATABASE_READ_URL)
+
+
+@event.listens_for(engine, "connect")
+def _set_write_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers keep their snapshot while turns are committed
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+
+@event.listens_for(read_engine, "connect")
+def _set_read_pragmas(dbapi_connection, connection_record):
+    if read_engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA mmap_size={READ_DB_MMAP_BYTES}")
+    cursor.execute(f"PRAGMA cache_size={-READ_DB_CACHE_KB}")
+    cursor.execute("PRAGMA query_only=1")
+    cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Never flushed or committed; anything that writes must use SessionLocal
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -19,4 +66,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,188 @@
+"""
+Live conversation events for owner dashboards.
+
+`websocket_endpoint` publishes an event per agent when a turn is stored,
+when participant data is complete and when a conversation is finalized.
+Owners subscribe per agent over SSE or a WebSocket (see
+routers/analytics.py), so live monitoring needs no polling and no
+analytics queries.
+
+The transport is pluggable through EVENTS_BACKEND:
+
+- "memory" (default): in-process queues; enough for a single worker.
+- "redis": Redis pub/sub at REDIS_URL, so subscribers see events from every
+  worker process. Needs the optional `redis` package.
+
+Publishing never blocks a turn: each subscriber has a bounded queue and
+the oldest events are dropped for consumers that fall behind.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Set
+
+from . import metrics, serialization
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # optional dependency
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "200"))
+EVENTS_CHANNEL_PREFIX = os.getenv("EVENTS_CHANNEL_PREFIX", "agent-events:")
+# SSE comment sent on idle streams so proxies keep them open and dead clients are noticed
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+TURN_STORED = "turn_stored"
+PARTICIPANT_COMPLETED = "participant_completed"
+CONVERSATION_FINALIZED = "conversation_finalized"
+
+
+def _offer(queue: asyncio.Queue, event: Dict):
+    """Enqueue without blocking, dropping the oldest event if the subscriber is behind"""
+    if queue.full():
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        metrics.events_dropped_total.inc()
+    queue.put_nowait(event)
+
+
+class MemoryBackend:
+    """Fan-out to subscribers in this process"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def publish(self, channel: str, event: Dict):
+        for queue in list(self._subscribers.get(channel, ())):
+            _offer(queue, event)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self._subscribers.setdefault(channel, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(channel)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in list(self._subscribers.values()))
+
+    async def aclose(self):
+        pass
+
+
+class RedisBackend:
+    """Redis pub/sub, shared by all worker processes"""
+
+    def __init__(self, url: str = REDIS_URL):
+        if redis_asyncio is None:
+            raise RuntimeError("EVENTS_BACKEND=redis needs the redis package (pip install redis)")
+        self.url = url
+        self._client = None
+        self._pending: Set[asyncio.Task] = set()
+        self._subscribers = 0
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = redis_asyncio.from_url(self.url)
+        return self._client
+
+    def publish(self, channel: str, event: Dict):
+        # Fire and forget, keeping a reference until the publish has finished
+        task = asyncio.ensure_future(self._publish(channel, serialization.dumps(event)))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish(self, channel: str, payload: str):
+        try:
+            await self._get_client().publish(channel, payload)
+        except Exception as e:
+            logger.warning("Publishing event to %s failed: %s", channel, e)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        pubsub = self._get_client().pubsub()
+        await pubsub.subscribe(channel)
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _offer(queue, serialization.loads(message["data"]))
+
+        reader = asyncio.ensure_future(pump())
+        self._subscribers += 1
+        try:
+            yield queue
+        finally:
+            self._subscribers -= 1
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    def subscriber_count(self) -> int:
+        return self._subscribers
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "redis": RedisBackend,
+}
+
+
+class EventBus:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def channel(agent_id: int) -> str:
+        return f"{EVENTS_CHANNEL_PREFIX}{agent_id}"
+
+    def publish(self, event_type: str, agent_id: int, conversation_id: Optional[int] = None,
+                session_id: Optional[str] = None, **data):
+        """Publish an event for an agent's subscribers; never blocks and never raises"""
+        event = {
+            "type": event_type,
+            "agent_id": agent_id,
+            "conversation_id": conversation_id,
+            "session_id": session_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "data": data,
+        }
+        try:
+            self.backend.publish(self.channel(agent_id), event)
+            metrics.events_published_total.inc(type=event_type)
+        except Exception as e:
+            logger.warning("Publishing %s event failed: %s", event_type, e)
+
+    def subscribe(self, agent_id: int):
+        """Async context manager yielding a queue of the agent's events"""
+        return self.backend.subscribe(self.channel(agent_id))
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+
+event_bus = EventBus(BACKENDS[EVENTS_BACKEND]() if EVENTS_BACKEND in BACKENDS else MemoryBackend())
+
+metrics.events_subscribers.set_function(event_bus.backend.subscriber_count)
@@ -0,0 +1,114 @@
+"""
+Cursor-based incremental exports.
+
+A cursor is an opaque token for the position (updated_at, id) reached in
+an agent's completed conversations. `updated_at` is set on completion and
+on every later change, so passing the previous export's cursor as `since`
+returns exactly the conversations completed or changed since then; a
+changed conversation is delivered again and consumers upsert by
+conversation_id. Rows written in the last DELTA_SETTLE_SECONDS are left for
+the next pull, so a transaction that commits slightly out of timestamp
+order cannot be skipped.
+"""
+import base64
+import binascii
+import os
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from . import archive, models
+
+DELTA_SETTLE_SECONDS = float(os.getenv("EXPORT_DELTA_SETTLE_SECONDS", "5"))
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(cursor: Optional[Cursor]) -> Optional[str]:
+    if cursor is None:
+        return None
+    updated_at, conversation_id = cursor
+    raw = f"{updated_at.isoformat()}|{conversation_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    """Parse a cursor token; raises ValueError if it is malformed"""
+    if not isinstance(token, str):
+        raise ValueError("Invalid export cursor")
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        updated_at, conversation_id = raw.split("|")
+        return datetime.fromisoformat(updated_at), int(conversation_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid export cursor") from e
+
+
+class ExportBatches:
+    """Conversations to export in keyset batches, tracking the cursor to resume from"""
+
+    def __init__(self, db: Session, agent_id: int, since: Optional[Cursor] = None,
+                 batch_size: int = 500, now: Optional[datetime] = None):
+        self.db = db
+        self.agent_id = agent_id
+        self.since = since
+        self.batch_size = batch_size
+        self.cutoff = (now or datetime.utcnow()) - timedelta(seconds=DELTA_SETTLE_SECONDS)
+        self.next_cursor: Optional[Cursor] = since
+
+    def query(self):
+        Conversation = models.Conversation
+        query = self.db.query(Conversation).filter(Conversation.agent_id == self.agent_id)
+        if self.since is not None:
+            updated_at, conversation_id = self.since
+            query = query.filter(
+                Conversation.completed_at.isnot(None),
+                Conversation.updated_at < self.cutoff,
+                or_(
+                    Conversation.updated_at > updated_at,
+                    and_(Conversation.updated_at == updated_at, Conversation.id > conversation_id),
+                ),
+            )
+        return query
+
+    def count(self) -> int:
+        return self.query().count()
+
+    def __iter__(self) -> Iterator[List[models.Conversation]]:
+        Conversation = models.Conversation
+        position = None
+        while True:
+            query = self.query()
+            if self.since is None:
+                # Full export: plain id order, as before cursors existed
+                if position is not None:
+                    query = query.filter(Conversation.id > position)
+                query = query.order_by(Conversation.id)
+            else:
+                if position is not None:
+                    query = query.filter(or_(
+                        Conversation.updated_at > position[0],
+                        and_(Conversation.updated_at == position[0], Conversation.id > position[1]),
+                    ))
+                query = query.order_by(Conversation.updated_at, Conversation.id)
+            batch = query.limit(self.batch_size).all()
+            if not batch:
+                return
+            for conversation in batch:
+                self._advance(conversation)
+            last = batch[-1]
+            position = last.id if self.since is None else (last.updated_at, last.id)
+            # Exports include transcripts; fetch the archived ones of the batch at once
+            archive.preload_transcripts(self.db, batch)
+            yield batch
+
+    def _advance(self, conversation: models.Conversation):
+        # Only settled, completed rows move the cursor; anything newer is
+        # picked up (again) by the next pull
+        updated_at = conversation.updated_at
+        if conversation.completed_at is None or updated_at is None or updated_at >= self.cutoff:
+            return
+        if self.next_cursor is None or (updated_at, conversation.id) > self.next_cursor:
+            self.next_cursor = (updated_at, conversation.id)
@@ -0,0 +1,345 @@
+"""
+Background CSV export jobs.
+
+An export is submitted as a job, built on a worker thread with its own
+database session and written to a file under EXPORT_DIR, so the HTTP
+request returns immediately and a client disconnect cannot lose the work.
+Each job keeps a JSON sidecar next to its artifact with status and
+progress, which lets any worker process answer status polls and serve
+downloads (with HTTP Range support for resuming). The sidecar records the
+process building the job; an unfinished job is reported as failed only
+once that process is gone. Finished artifacts are
+deleted once EXPORT_RETENTION_HOURS have passed.
+"""
+import csv
+import json
+import logging
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from . import export_delta, models, serialization
+from .database import ReadSessionLocal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "exports"))
+EXPORT_RETENTION_HOURS = float(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# Running jobs of another host whose sidecar has not been touched for this
+# long belong to a process that died; they are reported as failed. Jobs of
+# this host are checked by process id instead
+STALE_JOB_SECONDS = 600
+# Rows written to the CSV between sidecar saves, so a long write phase keeps it fresh
+HEARTBEAT_ROWS = 10000
+CLEANUP_INTERVAL_SECONDS = 60
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+RowBuilder = Callable[[models.Conversation, models.Agent], Dict]
+
+
+class ExportJob:
+    """Status of one export; persisted as `<id>.json` next to the artifact"""
+
+    def __init__(self, job_id: str, agent_id: int, owner_id: int, status: str = "queued",
+                 total: int = 0, processed: int = 0, size_bytes: Optional[int] = None,
+                 error: Optional[str] = None, created_at: Optional[str] = None,
+                 updated_at: Optional[str] = None, finished_at: Optional[str] = None,
+                 expires_at: Optional[str] = None, filename: Optional[str] = None,
+                 since: Optional[str] = None, next_cursor: Optional[str] = None,
+                 host: Optional[str] = None, pid: Optional[int] = None):
+        self.id = job_id
+        self.agent_id = agent_id
+        self.owner_id = owner_id
+        self.status = status
+        self.total = total
+        self.processed = processed
+        self.size_bytes = size_bytes
+        self.error = error
+        now = datetime.utcnow().isoformat()
+        self.created_at = created_at or now
+        self.updated_at = updated_at or now
+        self.finished_at = finished_at
+        self.expires_at = expires_at
+        self.filename = filename or f"agent_{agent_id}_conversations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        # Delta exports: the cursor this export started from and the one to pass next time
+        self.since = since
+        self.next_cursor = next_cursor
+        # Process building the job
+        self.host = host
+        self.pid = pid
+
+    @property
+    def artifact_path(self) -> Path:
+        return EXPORT_DIR / f"{self.id}.csv"
+
+    @property
+    def sidecar_path(self) -> Path:
+        return EXPORT_DIR / f"{self.id}.json"
+
+    @property
+    def progress(self) -> float:
+        if self.status == "completed":
+            return 1.0
+        return round(self.processed / self.total, 4) if self.total else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "agent_id": self.agent_id,
+            "owner_id": self.owner_id,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "progress": self.progress,
+            "size_bytes": self.size_bytes,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "finished_at": self.finished_at,
+            "expires_at": self.expires_at,
+            "filename": self.filename,
+            "since": self.since,
+            "next_cursor": self.next_cursor,
+            "host": self.host,
+            "pid": self.pid,
+        }
+
+    def save(self):
+        self.updated_at = datetime.utcnow().isoformat()
+        tmp_path = self.sidecar_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(self.to_dict()))
+        os.replace(tmp_path, self.sidecar_path)
+
+    @classmethod
+    def load(cls, job_id: str) -> Optional["ExportJob"]:
+        path = EXPORT_DIR / f"{job_id}.json"
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        data.pop("progress", None)
+        return cls(job_id=data.pop("job_id"), **data)
+
+    def is_expired(self, now: datetime) -> bool:
+        if self.expires_at:
+            return datetime.fromisoformat(self.expires_at) <= now
+        # Never finished (the process died): expire relative to the last update
+        abandoned_at = datetime.fromisoformat(self.updated_at) + timedelta(seconds=STALE_JOB_SECONDS)
+        return abandoned_at + timedelta(hours=EXPORT_RETENTION_HOURS) <= now
+
+    def owner_gone(self, now: datetime) -> bool:
+        """Whether the process building this unfinished job has died"""
+        if self.host == socket.gethostname() and self.pid:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+            return False
+        # Another host (shared EXPORT_DIR): only running jobs keep the sidecar fresh
+        if self.status != "running":
+            return False
+        return now - datetime.fromisoformat(self.updated_at) > timedelta(seconds=STALE_JOB_SECONDS)
+
+
+class ExportJobManager:
+    """Runs export jobs on a small thread pool and tracks them through their sidecars"""
+
+    def __init__(self, workers: int = EXPORT_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running: Dict[str, ExportJob] = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+    def init_storage(self):
+        """Create the export directory and drop expired artifacts; called from the application lifespan"""
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        self.cleanup()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+            return self._executor
+
+    def submit(self, agent: models.Agent, owner_id: int, row_builder: RowBuilder,
+               since: Optional[export_delta.Cursor] = None) -> ExportJob:
+        self.maybe_cleanup()
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        job = ExportJob(job_id=uuid.uuid4().hex, agent_id=agent.id, owner_id=owner_id,
+                        since=export_delta.encode_cursor(since), host=socket.gethostname(), pid=os.getpid())
+        job.save()
+        with self._lock:
+            self._running[job.id] = job
+        self._get_executor().submit(self._run, job, row_builder, since)
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        self.maybe_cleanup()
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        with self._lock:
+            job = self._running.get(job_id)
+        if job is not None:
+            return job
+        job = ExportJob.load(job_id)
+        if job and job.status in ("queued", "running") and job.owner_gone(datetime.utcnow()):
+            job.status = "failed"
+            job.error = "Export was interrupted"
+        return job
+
+    def delete(self, job: ExportJob):
+        for path in (job.artifact_path, job.sidecar_path):
+            path.unlink(missing_ok=True)
+
+    def _run(self, job: ExportJob, row_builder: RowBuilder, since: Optional[export_delta.Cursor] = None):
+        spool_path = None
+        try:
+            job.status = "running"
+            job.save()
+            with ReadSessionLocal() as db:
+                agent = db.query(models.Agent).filter(models.Agent.id == job.agent_id).first()
+                batches = export_delta.ExportBatches(db, agent_id=job.agent_id, since=since,
+                                                     batch_size=EXPORT_BATCH_SIZE)
+                job.total = batches.count()
+                job.save()
+
+                # Rows can carry different extra columns (participant info, key
+                # terms), so spool them first and write the CSV once the ordered
+                # union of columns is known
+                columns: Dict[str, None] = {}
+                fd, spool_path = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".spool")
+                with os.fdopen(fd, "w", encoding="utf-8") as spool:
+                    for batch in batches:
+                        for conversation in batch:
+                            row = row_builder(conversation, agent)
+                            columns.update(dict.fromkeys(row))
+                            spool.write(serialization.dumps(row, default=str) + "\n")
+                        job.processed += len(batch)
+                        job.save()
+                        db.expunge_all()
+                job.next_cursor = export_delta.encode_cursor(batches.next_cursor)
+
+            partial_path = job.artifact_path.with_suffix(".csv.part")
+            with open(spool_path, encoding="utf-8") as spool, \
+                    open(partial_path, "w", encoding="utf-8", newline="") as output:
+                # An empty delta produces an empty file
+                if columns:
+                    writer = csv.DictWriter(output, fieldnames=list(columns), lineterminator="\n")
+                    writer.writeheader()
+                    for written, line in enumerate(spool, start=1):
+                        writer.writerow(serialization.loads(line))
+                        if written % HEARTBEAT_ROWS == 0:
+                            job.save()
+            os.replace(partial_path, job.artifact_path)
+
+            finished_at = datetime.utcnow()
+            job.status = "completed"
+            job.size_bytes = job.artifact_path.stat().st_size
+            job.finished_at = finished_at.isoformat()
+            job.expires_at = (finished_at + timedelta(hours=EXPORT_RETENTION_HOURS)).isoformat()
+            job.save()
+            logger.info("Export %s finished: %s rows, %s bytes", job.id, job.processed, job.size_bytes)
+        except Exception as e:
+            logger.exception("Export %s failed", job.id)
+            finished_at = datetime.utcnow()
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = finished_at.isoformat()
+            job.expires_at = (finished_at + timedelta(hours=EXPORT_RETENTION_HOURS)).isoformat()
+            job.save()
+        finally:
+            if spool_path:
+                Path(spool_path).unlink(missing_ok=True)
+            with self._lock:
+                self._running.pop(job.id, None)
+
+    def maybe_cleanup(self):
+        if time.monotonic() - self._last_cleanup >= CLEANUP_INTERVAL_SECONDS:
+            self.cleanup()
+
+    def cleanup(self) -> int:
+        """Delete expired jobs and their artifacts; returns the number removed"""
+        self._last_cleanup = time.monotonic()
+        if not EXPORT_DIR.exists():
+            return 0
+        now = datetime.utcnow()
+        removed = 0
+        for sidecar in EXPORT_DIR.glob("*.json"):
+            job = ExportJob.load(sidecar.stem)
+            if job is None or job.id in self._running or not job.is_expired(now):
+                continue
+            self.delete(job)
+            removed += 1
+        if removed:
+            logger.info("Removed %s expired export jobs", removed)
+        return removed
+
+
+export_jobs = ExportJobManager()
+
+
+def _iter_file(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(DOWNLOAD_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def download_response(request: Request, job: ExportJob) -> Response:
+    """Serve a finished artifact, honouring single byte-range requests for resumed downloads"""
+    path = job.artifact_path
+    size = path.stat().st_size
+    etag = f'"{job.id}-{size}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f"attachment; filename={job.filename}",
+    }
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        match = _RANGE_RE.match(range_header.strip())
+        if not match or match.groups() == ("", ""):
+            raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{size}"})
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        if start >= size or start > end:
+            raise HTTPException(status_code=416, detail="Range not satisfiable",
+                                headers={"Content-Range": f"bytes */{size}"})
+        length = end - start + 1
+        headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+        return StreamingResponse(_iter_file(path, start, length), status_code=206,
+                                 media_type="text/csv", headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size), media_type="text/csv", headers=headers)
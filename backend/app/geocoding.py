@@ -0,0 +1,410 @@
+"""
+Offline geocoding of free-text participant locations.
+
+Places come from a bundled gazetteer (`app/data/gazetteer.tsv`). On first
+use it is compiled into a compact binary index of fixed-width records
+sorted by normalized name, which is memory-mapped and binary searched, so
+lookups need no network and the working set is shared between workers.
+Lookups are memoized per distinct location string and the coordinates are
+persisted on the conversation, so heatmaps only geocode strings they have
+not seen before.
+
+    python -m app.geocoding build              # (re)compile the index
+    python -m app.geocoding lookup "Westlands, Nairobi"
+    python -m app.geocoding backfill           # geocode stored conversations
+"""
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, func, or_, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(DATA_DIR, "gazetteer.tsv"))
+GAZETTEER_INDEX_PATH = os.getenv("GAZETTEER_INDEX_PATH", os.path.splitext(GAZETTEER_PATH)[0] + ".idx")
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "65536"))
+
+# Shortest token the fuzzy prefix search will try; shorter prefixes match too much
+MIN_PREFIX_CHARS = 4
+# Fuzzy matches may add or drop at most this many trailing characters
+# ("Nairob" -> Nairobi, "Kampalaa" -> Kampala) and keep at least
+# FUZZY_MIN_RATIO of the token, so "Mars" does not become Marseille
+MAX_FUZZY_EDIT = 2
+FUZZY_MIN_RATIO = 0.8
+# Filler words never matched fuzzily ("somewhere in the north")
+FUZZY_STOPWORDS = {
+    "the", "and", "near", "from", "live", "living", "city", "town", "village", "somewhere",
+    "around", "outside", "area", "region", "district", "province", "state", "country", "county",
+    "north", "south", "east", "west", "central", "northern", "southern", "eastern", "western",
+    "rural", "urban", "here", "there", "home",
+}
+# Upper bound on records scanned per prefix lookup
+MAX_PREFIX_SCAN = 256
+
+# Index layout: header, fixed-width records sorted by key, then a string blob
+_MAGIC = b"GZT1"
+_HEADER = struct.Struct("<4sII")  # magic, record count, string blob offset
+# key offset, key length, display offset, display length, lat, lon, population, kind
+_RECORD = struct.Struct("<IHIHffIB3x")
+KIND_CITY = 0
+KIND_COUNTRY = 1
+
+UNRESOLVED = {"", "unknown", "n a", "na", "none", "null", "not sure", "prefer not to say"}
+
+Place = namedtuple("Place", ["name", "country", "latitude", "longitude", "kind"])
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    # Apostrophes join words ("N'Djamena"); other punctuation separates them
+    stripped = stripped.replace("'", "").replace("’", "")
+    return " ".join(_NON_WORD_RE.sub(" ", stripped.lower()).split())
+
+
+def read_gazetteer(path: str) -> List[Dict]:
+    """Rows of the tab separated gazetteer file"""
+    places = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            name, country, kind, latitude, longitude, population = fields[:6]
+            aliases = [alias for alias in (fields[6] if len(fields) > 6 else "").split("|") if alias]
+            places.append({
+                "name": name,
+                "country": country,
+                "kind": KIND_COUNTRY if kind == "country" else KIND_CITY,
+                "latitude": float(latitude),
+                "longitude": float(longitude),
+                "population": int(population),
+                "aliases": aliases,
+            })
+    return places
+
+
+def build_index(source_path: str = GAZETTEER_PATH, index_path: str = GAZETTEER_INDEX_PATH) -> int:
+    """Compile the gazetteer into the binary index; returns the number of keys"""
+    entries = []
+    for place in read_gazetteer(source_path):
+        display = place["name"] if place["kind"] == KIND_COUNTRY else f"{place['name']}, {place['country']}"
+        keys = set()
+        for name in [place["name"]] + place["aliases"]:
+            keys.add(normalize(name))
+            if place["kind"] == KIND_CITY:
+                keys.add(normalize(f"{name} {place['country']}"))
+        for key in keys:
+            if key:
+                entries.append((key.encode("utf-8"), -place["population"], display, place))
+    # Equal keys keep the most populous place first
+    entries.sort(key=lambda entry: (entry[0], entry[1]))
+
+    blob = bytearray()
+    string_offsets: Dict[bytes, int] = {}
+
+    def intern(value: bytes) -> int:
+        if value not in string_offsets:
+            string_offsets[value] = len(blob)
+            blob.extend(value)
+        return string_offsets[value]
+
+    records = bytearray()
+    for key, _, display, place in entries:
+        display_bytes = display.encode("utf-8")
+        records.extend(_RECORD.pack(
+            intern(key), len(key), intern(display_bytes), len(display_bytes),
+            place["latitude"], place["longitude"], place["population"], place["kind"],
+        ))
+
+    blob_offset = _HEADER.size + len(records)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as handle:
+        handle.write(_HEADER.pack(_MAGIC, len(entries), blob_offset))
+        handle.write(records)
+        handle.write(blob)
+    os.replace(tmp_path, index_path)
+    return len(entries)
+
+
+class Gazetteer:
+    """Read-only view over a memory-mapped gazetteer index"""
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._blob_offset = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{index_path} is not a gazetteer index")
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, position: int):
+        return _RECORD.unpack_from(self._map, _HEADER.size + position * _RECORD.size)
+
+    def _key(self, position: int) -> bytes:
+        key_offset, key_length = self._record(position)[:2]
+        start = self._blob_offset + key_offset
+        return self._map[start:start + key_length]
+
+    def _place(self, position: int) -> Place:
+        _, _, display_offset, display_length, latitude, longitude, _, kind = self._record(position)
+        start = self._blob_offset + display_offset
+        display = self._map[start:start + display_length].decode("utf-8")
+        name, _, country = display.partition(", ")
+        return Place(name, country or name, round(latitude, 4), round(longitude, 4),
+                     "country" if kind == KIND_COUNTRY else "city")
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def exact(self, key: str) -> List[Place]:
+        """Places whose normalized name equals `key`, most populous first"""
+        encoded = key.encode("utf-8")
+        position = self._lower_bound(encoded)
+        places = []
+        while position < self.count and self._key(position) == encoded:
+            places.append(self._place(position))
+            position += 1
+        return places
+
+    def prefix(self, key: str, limit: int = MAX_PREFIX_SCAN) -> List[Place]:
+        """Places whose normalized name starts with `key`, most populous first"""
+        encoded = key.encode("utf-8")
+        position = self._lower_bound(encoded)
+        matches = []
+        while position < self.count and len(matches) < limit and self._key(position).startswith(encoded):
+            population = self._record(position)[6]
+            matches.append((population, position))
+            position += 1
+        matches.sort(reverse=True)
+        return [self._place(position) for _, position in matches]
+
+    def close(self):
+        self._map.close()
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def _index_is_current(index_path: str) -> bool:
+    return os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(GAZETTEER_PATH)
+
+
+def get_gazetteer() -> Gazetteer:
+    """Shared gazetteer, compiling the index on first use if it is missing or stale"""
+    global _gazetteer
+    if _gazetteer is not None:
+        return _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            index_path = GAZETTEER_INDEX_PATH
+            if not _index_is_current(index_path):
+                try:
+                    build_index(GAZETTEER_PATH, index_path)
+                except OSError:
+                    # Read-only install; keep the compiled index in the temp dir instead
+                    index_path = os.path.join(tempfile.gettempdir(), os.path.basename(GAZETTEER_INDEX_PATH))
+                    if not _index_is_current(index_path):
+                        build_index(GAZETTEER_PATH, index_path)
+                logger.info("Compiled gazetteer index at %s", index_path)
+            _gazetteer = Gazetteer(index_path)
+    return _gazetteer
+
+
+def _pick(places: List[Place], country: Optional[str]) -> Optional[Place]:
+    """Cities over countries; with a country hint only places inside it qualify"""
+    if country:
+        places = [place for place in places if place.country == country]
+    if not places:
+        return None
+    cities = [place for place in places if place.kind == "city"]
+    return (cities or places)[0]
+
+
+def _close_prefix(name: str, token: str) -> bool:
+    """One is a prefix of the other and they differ by at most MAX_FUZZY_EDIT characters"""
+    if abs(len(name) - len(token)) > MAX_FUZZY_EDIT or len(name) < len(token) * FUZZY_MIN_RATIO:
+        return False
+    return name.startswith(token) or token.startswith(name)
+
+
+@lru_cache(maxsize=GEOCODE_CACHE_SIZE)
+def _geocode_normalized(key: str) -> Optional[Place]:
+    gazetteer = get_gazetteer()
+
+    place = _pick(gazetteer.exact(key), None)
+    if place:
+        return place
+
+    tokens = key.split()
+
+    # A trailing country name ("..., Kenya") disambiguates the city part
+    country = None
+    for start in range(len(tokens)):
+        countries = [p for p in gazetteer.exact(" ".join(tokens[start:])) if p.kind == "country"]
+        if countries:
+            country = countries[0].name
+            break
+
+    # Longest run of words naming a known place ("Westlands Nairobi" -> Nairobi)
+    for size in range(len(tokens) - 1, 0, -1):
+        for start in range(len(tokens) - size + 1):
+            place = _pick(gazetteer.exact(" ".join(tokens[start:start + size])), country)
+            if place and place.kind == "city":
+                return place
+
+    # Fuzzy prefix: "Nairob" -> Nairobi, "Kampalaa" -> Kampala
+    for token in sorted(tokens, key=len, reverse=True):
+        if len(token) < MIN_PREFIX_CHARS or token in FUZZY_STOPWORDS:
+            continue
+        shortest = max(MIN_PREFIX_CHARS, math.ceil(len(token) * FUZZY_MIN_RATIO), len(token) - MAX_FUZZY_EDIT)
+        candidates = [
+            place for place in gazetteer.prefix(token[:shortest])
+            if _close_prefix(normalize(place.name), token)
+        ]
+        place = _pick(candidates, country)
+        if place:
+            return place
+
+    if country:
+        return _pick(gazetteer.exact(normalize(country)), None)
+    return None
+
+
+def geocode(location: Optional[str]) -> Optional[Place]:
+    """Resolve a free-text location to a gazetteer place, or None"""
+    key = normalize(location or "")
+    if key in UNRESOLVED:
+        return None
+    return _geocode_normalized(key)
+
+
+def apply_to_conversation(conversation: models.Conversation):
+    """Store coordinates for the conversation's current participant_location"""
+    place = geocode(conversation.participant_location)
+    conversation.location_latitude = place.latitude if place else None
+    conversation.location_longitude = place.longitude if place else None
+    conversation.geocoded_location = conversation.participant_location
+
+
+def _needs_geocoding():
+    Conversation = models.Conversation
+    return and_(
+        Conversation.participant_location.isnot(None),
+        or_(
+            Conversation.geocoded_location.is_(None),
+            Conversation.geocoded_location != Conversation.participant_location,
+        ),
+    )
+
+
+def location_points(db: Session, agent_id: int, writer: Optional[Session] = None) -> List[Dict]:
+    """Per-location counts with coordinates, geocoding and persisting unseen locations.
+
+    `db` may be a read-only session; coordinates are then persisted through
+    `writer`, which defaults to `db`.
+    """
+    writer = writer if writer is not None else db
+    Conversation = models.Conversation
+    rows = db.query(
+        Conversation.participant_location,
+        func.count(Conversation.id),
+        func.max(Conversation.location_latitude),
+        func.max(Conversation.location_longitude),
+        func.sum(case((_needs_geocoding(), 1), else_=0)),
+    ).filter(
+        Conversation.agent_id == agent_id
+    ).group_by(Conversation.participant_location).all()
+
+    points = []
+    pending = False
+    for location, count, latitude, longitude, stale in rows:
+        if stale:
+            place = geocode(location)
+            latitude = place.latitude if place else None
+            longitude = place.longitude if place else None
+            writer.execute(
+                update(Conversation)
+                .where(Conversation.agent_id == agent_id,
+                       Conversation.participant_location == location,
+                       _needs_geocoding())
+                .values(location_latitude=latitude, location_longitude=longitude,
+                        geocoded_location=location,
+                        # Derived data only; must not make rows reappear in delta exports
+                        updated_at=Conversation.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            pending = True
+        points.append({
+            "location": location,
+            "count": count,
+            "latitude": latitude,
+            "longitude": longitude,
+        })
+    if pending:
+        writer.commit()
+    return points
+
+
+def backfill_locations(db: Session) -> int:
+    """Geocode every stored conversation whose coordinates are missing or stale"""
+    agent_ids = [row[0] for row in db.query(models.Conversation.agent_id).filter(
+        _needs_geocoding()).distinct()]
+    total = 0
+    for agent_id in agent_ids:
+        total += len(location_points(db, agent_id))
+    return total
+
+
+def main(argv: Optional[List[str]] = None):
+    args = argv if argv is not None else sys.argv[1:]
+    command = args[0] if args else "build"
+    if command == "build":
+        print(f"Indexed {build_index()} gazetteer keys into {GAZETTEER_INDEX_PATH}")
+    elif command == "lookup" and len(args) > 1:
+        print(geocode(" ".join(args[1:])))
+    elif command == "backfill":
+        from .database import SessionLocal, engine
+        from .migrations import upgrade_schema
+
+        models.Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine)
+        with SessionLocal() as db:
+            print(f"Geocoded {backfill_locations(db)} distinct locations")
+    else:
+        print("usage: python -m app.geocoding [build|lookup <text>|backfill]")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Chat completions routed over an ordered list of LLM endpoints.
+
+Endpoints come from LLM_ENDPOINTS, a JSON list such as
+
+    [{"name": "cerebras", "base_url": "https://api.cerebras.ai/v1", "model": "llama3.1-8b"},
+     {"name": "backup", "base_url": "http://10.0.0.5:8000/v1", "model": "llama3.1-8b",
+      "api_key": "..."}]
+
+and default to the single Cerebras endpoint (CEREBRAS_BASE_URL,
+CEREBRAS_API_KEY, LLM_MODEL). A request goes to the first endpoint. If no
+answer has arrived after that endpoint's hedge delay, a duplicate request
+is sent to the next endpoint (or the same one when only one is
+configured), up to LLM_MAX_ATTEMPTS in flight; a failed attempt moves on
+to the next endpoint immediately. The first successful answer wins and the
+remaining attempts are cancelled.
+
+The hedge delay of each endpoint follows the LLM_HEDGE_PERCENTILE (p95) of
+its recent latencies, clamped to [LLM_HEDGE_MIN_MS, LLM_HEDGE_MAX_MS], so
+only the slowest few percent of requests are duplicated. Hedges are also
+capped at LLM_HEDGE_MAX_FRACTION of recent requests, so a slow upstream
+does not get double the load.
+
+Everything can be exercised against local stubs:
+
+    python -m loadtest.stub_llm --port 9100 --latency-ms 300 --hang-rate 0.05 --hang-ms 5000
+    python -m loadtest.stub_llm --port 9101 --latency-ms 400
+    LLM_ENDPOINTS='[{"name": "a", "base_url": "http://127.0.0.1:9100/v1", "model": "m"},
+                    {"name": "b", "base_url": "http://127.0.0.1:9101/v1", "model": "m"}]' \\
+        python -m app.llm_router probe --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import httpx
+
+from . import circuit_breaker, metrics
+
+logger = logging.getLogger(__name__)
+
+CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY", "csk-ymtphj83pp5p9x42cwycj8rrxv9dw2d664fdjxmvv2p88n4")
+CEREBRAS_BASE_URL = os.getenv("CEREBRAS_BASE_URL", "https://api.cerebras.ai/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1-8b")
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "2"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+# Used until an endpoint has LATENCY_MIN_SAMPLES measurements
+LLM_HEDGE_INITIAL_MS = float(os.getenv("LLM_HEDGE_INITIAL_MS", "2000"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "100"))
+LLM_HEDGE_MAX_MS = float(os.getenv("LLM_HEDGE_MAX_MS", "10000"))
+LLM_HEDGE_MAX_FRACTION = float(os.getenv("LLM_HEDGE_MAX_FRACTION", "0.2"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+HEDGE_WINDOW = 100
+
+PLACEHOLDER_API_KEYS = {"", "your-cerebras-api-key"}
+
+
+class LLMUnavailable(Exception):
+    """No endpoint produced an answer in time"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpen(LLMUnavailable):
+    """Every endpoint's circuit is open; no request was sent"""
+
+
+class LatencyTracker:
+    """Sliding window of request latencies for one endpoint"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.hedge_delay = LLM_HEDGE_INITIAL_MS / 1000
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        if len(self.samples) >= LATENCY_MIN_SAMPLES:
+            delay = self.percentile(LLM_HEDGE_PERCENTILE)
+            self.hedge_delay = min(max(delay, LLM_HEDGE_MIN_MS / 1000), LLM_HEDGE_MAX_MS / 1000)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Endpoint:
+    def __init__(self, name: str, base_url: str, model: str, api_key: Optional[str] = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key if api_key is not None else CEREBRAS_API_KEY
+        self.latency = LatencyTracker()
+        self.breaker = circuit_breaker.get_breaker(name)
+        self.requests = 0
+        self.wins = 0
+        self.errors = 0
+
+    @property
+    def configured(self) -> bool:
+        return self.api_key not in PLACEHOLDER_API_KEYS
+
+    def stats(self) -> Dict:
+        p50, p95 = self.latency.percentile(0.5), self.latency.percentile(0.95)
+        return {
+            "name": self.name,
+            "model": self.model,
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "wins": self.wins,
+            "errors": self.errors,
+            "samples": len(self.latency.samples),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge_delay_ms": round(self.latency.hedge_delay * 1000, 1),
+            "circuit": self.breaker.state,
+        }
+
+
+def load_endpoints() -> List[Endpoint]:
+    raw = os.getenv("LLM_ENDPOINTS")
+    if not raw:
+        return [Endpoint("cerebras", CEREBRAS_BASE_URL, LLM_MODEL)]
+    try:
+        entries = json.loads(raw)
+        return [
+            Endpoint(entry.get("name") or f"endpoint{position}", entry["base_url"],
+                     entry.get("model", LLM_MODEL), entry.get("api_key"))
+            for position, entry in enumerate(entries)
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"LLM_ENDPOINTS must be a JSON list of {{name, base_url, model, api_key}}: {e}") from e
+
+
+class LLMRouter:
+    """Hedged, tiered chat completions over `endpoints` (in order of preference)"""
+
+    def __init__(self, endpoints: List[Endpoint], max_attempts: int = LLM_MAX_ATTEMPTS,
+                 timeout: float = LLM_TIMEOUT_SECONDS):
+        if not endpoints:
+            raise ValueError("At least one LLM endpoint is required")
+        self.endpoints = endpoints
+        self.max_attempts = max(1, max_attempts)
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        # 1 for each recent request that sent a hedge, 0 otherwise
+        self._recent_hedges: Deque[int] = deque(maxlen=HEDGE_WINDOW)
+
+    @property
+    def configured(self) -> bool:
+        return any(endpoint.configured for endpoint in self.endpoints)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+            self._client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+        return self._client
+
+    async def aclose(self):
+        """Close pooled connections; called from the application lifespan"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _may_hedge(self) -> bool:
+        if not self._recent_hedges:
+            return True
+        return sum(self._recent_hedges) / len(self._recent_hedges) < LLM_HEDGE_MAX_FRACTION
+
+    async def _attempt(self, endpoint: Endpoint, messages: List[Dict], max_tokens: int,
+                       temperature: float, deadline: float) -> str:
+        """One request; the caller has already been admitted by endpoint.breaker"""
+        loop = asyncio.get_running_loop()
+        breaker = endpoint.breaker
+        endpoint.requests += 1
+        started = time.perf_counter()
+        try:
+            response = await self._get_client().post(
+                f"{endpoint.base_url}/chat/completions",
+                headers={"Authorization": f"Bearer {endpoint.api_key}", "Content-Type": "application/json"},
+                json={
+                    "model": endpoint.model,
+                    "messages": messages,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "stream": False
+                },
+                timeout=max(0.001, deadline - loop.time())
+            )
+        except asyncio.CancelledError:
+            # Cancelled at the overall deadline: the endpoint timed out.
+            # Otherwise it lost the race; its elapsed time is only a lower bound
+            # (about the hedge delay itself), so it is not fed into the percentile
+            if loop.time() >= deadline:
+                breaker.record_failure()
+            else:
+                breaker.release()
+            metrics.llm_attempts_total.inc(endpoint=endpoint.name, outcome="cancelled")
+            raise
+        except Exception:
+            breaker.record_failure()
+            endpoint.errors += 1
+            metrics.llm_attempts_total.inc(endpoint=endpoint.name, outcome="error")
+            raise
+
+        elapsed = time.perf_counter() - started
+        metrics.upstream_request_seconds.observe(elapsed, upstream=endpoint.name)
+        metrics.upstream_responses_total.inc(upstream=endpoint.name, status=response.status_code)
+        if response.status_code != 200:
+            if circuit_breaker.is_failure_status(response.status_code):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            endpoint.errors += 1
+            metrics.llm_attempts_total.inc(endpoint=endpoint.name, outcome="error")
+            raise LLMUnavailable(f"{endpoint.name} returned {response.status_code}", response.status_code)
+        try:
+            content = response.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            breaker.record_failure()
+            endpoint.errors += 1
+            metrics.llm_attempts_total.inc(endpoint=endpoint.name, outcome="error")
+            raise LLMUnavailable(f"{endpoint.name} returned a malformed response") from e
+        breaker.record_success()
+        endpoint.latency.record(elapsed)
+        metrics.llm_hedge_delay_seconds.set(endpoint.latency.hedge_delay, endpoint=endpoint.name)
+        return content
+
+    async def complete(self, messages: List[Dict], max_tokens: int = 150, temperature: float = 0.7) -> str:
+        """Content of the first successful answer; raises LLMUnavailable (CircuitOpen
+        without any network call when every endpoint's circuit is open)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        pending: Dict[asyncio.Task, Endpoint] = {}
+        attempts = 0
+        cursor = 0
+        exhausted = False
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> Optional[Endpoint]:
+            """Start an attempt on the next endpoint whose circuit admits it"""
+            nonlocal attempts, cursor
+            for _ in range(len(self.endpoints)):
+                endpoint = self.endpoints[cursor % len(self.endpoints)]
+                cursor += 1
+                if endpoint.breaker.allow():
+                    task = asyncio.ensure_future(self._attempt(endpoint, messages, max_tokens, temperature, deadline))
+                    pending[task] = endpoint
+                    attempts += 1
+                    return endpoint
+            return None
+
+        last_endpoint = launch()
+        if last_endpoint is None:
+            raise CircuitOpen("All LLM circuits are open")
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                can_hedge = not exhausted and attempts < self.max_attempts and self._may_hedge()
+                wait = min(remaining, last_endpoint.latency.hedge_delay) if can_hedge else remaining
+                done, _ = await asyncio.wait(list(pending), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if can_hedge:
+                        endpoint = launch()
+                        if endpoint is None:
+                            exhausted = True
+                        else:
+                            hedged = True
+                            last_endpoint = endpoint
+                            metrics.llm_hedges_total.inc(endpoint=endpoint.name)
+                    continue
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    if task.exception() is None:
+                        endpoint.wins += 1
+                        metrics.llm_attempts_total.inc(endpoint=endpoint.name, outcome="won")
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning("LLM attempt on %s failed: %r", endpoint.name, last_error)
+
+                # Failed attempts hand over to the next endpoint straight away
+                if not pending and attempts < self.max_attempts:
+                    last_endpoint = launch() or last_endpoint
+        finally:
+            self._recent_hedges.append(1 if hedged else 0)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if last_error is None:
+            raise LLMUnavailable(f"No LLM answer within {self.timeout:.0f}s")
+        status_code = getattr(last_error, "status_code", None)
+        raise LLMUnavailable(str(last_error) or type(last_error).__name__, status_code) from last_error
+
+    def stats(self) -> List[Dict]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+
+llm_router = LLMRouter(load_endpoints())
+
+
+async def _probe(requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def one(position: int):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await llm_router.complete([{"role": "user", "content": f"probe {position}"}], max_tokens=20)
+                latencies.append(time.perf_counter() - started)
+            except LLMUnavailable:
+                failures += 1
+
+    try:
+        await asyncio.gather(*(one(position) for position in range(requests)))
+    finally:
+        await llm_router.aclose()
+
+    latencies.sort()
+
+    def quantile(fraction: float) -> Optional[float]:
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 1)
+
+    print(json.dumps({
+        "requests": requests,
+        "failures": failures,
+        "hedged_fraction": round(sum(llm_router._recent_hedges) / max(1, len(llm_router._recent_hedges)), 3),
+        "p50_ms": quantile(0.5),
+        "p95_ms": quantile(0.95),
+        "p99_ms": quantile(0.99),
+        "max_ms": quantile(1.0),
+        "endpoints": llm_router.stats(),
+    }, indent=2))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Send probe requests through the LLM router")
+    parser.add_argument("command", choices=["probe"])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args(argv)
+    asyncio.run(_probe(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 import os
@@ -8,16 +11,47 @@ import os
 load_dotenv()
 
 from .database import engine, get_db
-from . import models
+from . import models, metrics, query_stats, migrations, search, serialization, circuit_breaker
+from .export_jobs import export_jobs
+from .llm_router import llm_router
+from .events import event_bus
+from .write_behind import write_behind
+from .archive import archiver
 from .routers import auth, agents, conversations, analytics
+from .routers.elevenlabs_service import elevenlabs_service
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Set by the production server for its workers once it has prepared the schema
+SCHEMA_READY = os.getenv("SCHEMA_READY") == "1"
+
+def startup():
+    """One-time process setup: database schema and storage directories"""
+    if not SCHEMA_READY:
+        models.Base.metadata.create_all(bind=engine)
+        migrations.upgrade_schema(engine)
+        search.init_search_index(engine)
+    conversations.init_storage()
+    elevenlabs_service.init_storage()
+    export_jobs.init_storage()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup()
+    archiver.start()
+    conversations.manager.start_sweeper()
+    yield
+    await conversations.manager.stop_sweeper()
+    archiver.stop()
+    # Buffered turns must reach the database before the process exits
+    write_behind.close()
+    await llm_router.aclose()
+    await event_bus.aclose()
 
 app = FastAPI(
     title="Data Collection Agents API",
     description="API for creating and managing data collection agents with voice/text interactions",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=serialization.FastJSONResponse
 )
 
 # Add CORS middleware for local development
@@ -29,6 +63,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count queries, rows and DB time per request
+app.add_middleware(query_stats.QueryAccountingMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(agents.router)
@@ -46,12 +83,20 @@ def read_root():
 @app.get("/health")
 def health_check(db: Session = Depends(get_db)):
     """Health check endpoint"""
+    # Open circuits mean replies come from the fallback path, not that the API is down
+    circuits = circuit_breaker.snapshot()
     try:
         # Simple database connectivity check
-        db.execute("SELECT 1")
-        return {"status": "healthy", "database": "connected"}
+        db.execute(text("SELECT 1"))
+        status = "degraded" if circuit_breaker.any_open() else "healthy"
+        return {"status": status, "database": "connected", "circuits": circuits}
     except Exception as e:
-        return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
+        return {"status": "unhealthy", "database": "disconnected", "error": str(e), "circuits": circuits}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus text exposition of in-process metrics"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE_LATEST)
 
 # WebSocket test endpoint
 @app.websocket("/test-ws")
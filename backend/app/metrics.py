@@ -0,0 +1,290 @@
+"""
+In-process metrics with a Prometheus text exposition endpoint.
+
+Counters and histograms are plain dicts keyed by label values. Updates are
+single dict/list operations that rely on the GIL instead of locks, so they
+are cheap enough to leave on in production. A rare lost increment under
+thread contention is acceptable for monitoring data.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4"
+
+# Latency buckets in seconds, from sub-millisecond DB queries to LLM timeouts
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge that is either set directly or computed by a callback at scrape time"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback: Callable[[], float]):
+        self._callback = callback
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        if self._callback is not None:
+            try:
+                lines.append(f"{self.name} {float(self._callback())}")
+            except Exception:
+                # A broken callback must never take the whole endpoint down
+                pass
+            return lines
+        for key, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return int(sum(state[:-1])) if state else 0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, state in list(self._values.items()):
+            state = list(state)
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += state[len(self.buckets)]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# WebSocket turns
+ws_turn_seconds = registry.histogram(
+    "ws_turn_seconds", "End-to-end latency of a WebSocket conversation turn"
+)
+ws_turn_stage_seconds = registry.histogram(
+    "ws_turn_stage_seconds",
+    "Latency of each WebSocket turn stage (extraction, llm, db_write, send)",
+    ["stage"],
+)
+ws_active_connections = registry.gauge(
+    "ws_active_connections", "Open conversation WebSockets tracked by ConversationManager"
+)
+ws_session_states = registry.gauge(
+    "ws_session_states", "Conversation states tracked by ConversationManager"
+)
+ws_session_state_bytes = registry.gauge(
+    "ws_session_state_bytes", "Approximate memory held by tracked conversation states"
+)
+rate_limited_total = registry.counter(
+    "rate_limited_total", "Requests and sessions refused by admission control, by scope", ["scope"]
+)
+ws_session_evictions_total = registry.counter(
+    "ws_session_evictions_total", "Conversation states saved and dropped from memory, by reason (idle, capacity)", ["reason"]
+)
+
+# Upstream services (Cerebras, ElevenLabs)
+upstream_request_seconds = registry.histogram(
+    "upstream_request_seconds", "Latency of calls to upstream APIs", ["upstream"]
+)
+upstream_responses_total = registry.counter(
+    "upstream_responses_total", "Upstream API responses by status code", ["upstream", "status"]
+)
+upstream_fallbacks_total = registry.counter(
+    "upstream_fallbacks_total", "Times a fallback was used instead of an upstream result",
+    ["upstream", "reason"],
+)
+circuit_breaker_state = registry.gauge(
+    "circuit_breaker_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open)", ["upstream"]
+)
+circuit_breaker_transitions_total = registry.counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes by upstream and new state", ["upstream", "state"]
+)
+circuit_breaker_rejections_total = registry.counter(
+    "circuit_breaker_rejections_total", "Upstream calls skipped because the circuit was open", ["upstream"]
+)
+llm_attempts_total = registry.counter(
+    "llm_attempts_total", "LLM requests by endpoint and outcome (won, cancelled, error)", ["endpoint", "outcome"]
+)
+llm_hedges_total = registry.counter(
+    "llm_hedges_total", "Hedged duplicate LLM requests, by the endpoint they were sent to", ["endpoint"]
+)
+llm_hedge_delay_seconds = registry.gauge(
+    "llm_hedge_delay_seconds", "Current hedge delay of each LLM endpoint", ["endpoint"]
+)
+llm_prompt_tokens = registry.histogram(
+    "llm_prompt_tokens", "Estimated prompt size of LLM requests in tokens", ["phase"],
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+)
+
+# Live events
+events_published_total = registry.counter(
+    "events_published_total", "Live conversation events published, by type", ["type"]
+)
+events_dropped_total = registry.counter(
+    "events_dropped_total", "Live events dropped for subscribers that fell behind"
+)
+events_subscribers = registry.gauge(
+    "events_subscribers", "Open live event subscriptions in this process"
+)
+
+# Database
+db_query_seconds = registry.histogram(
+    "db_query_seconds", "SQLAlchemy statement execution time", ["operation"]
+)
+write_behind_records_total = registry.counter(
+    "write_behind_records_total", "Turn writes accepted by the write-behind buffer"
+)
+write_behind_failures_total = registry.counter(
+    "write_behind_failures_total", "Failed write-behind group commits"
+)
+write_behind_flush_seconds = registry.histogram(
+    "write_behind_flush_seconds", "Duration of write-behind group commits"
+)
+write_behind_batch_size = registry.histogram(
+    "write_behind_batch_size", "Conversations written per write-behind group commit",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+write_behind_pending = registry.gauge(
+    "write_behind_pending", "Conversations with buffered writes waiting for the next group commit"
+)
+archive_conversations_total = registry.counter(
+    "archive_conversations_total", "Conversation transcripts moved to or from cold storage", ["direction"]
+)
+
+
+def _statement_operation(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def observe_query(statement: str, seconds: float):
+    """Record one statement's execution time; called from query_stats' engine hook"""
+    db_query_seconds.observe(seconds, operation=_statement_operation(statement))
@@ -0,0 +1,55 @@
+"""
+Lightweight schema upgrades for existing databases.
+
+`Base.metadata.create_all` only creates missing tables. This adds columns
+and indexes that were declared on the models after a table was first
+created, so older SQLite files keep working without a migration tool.
+New columns are added as nullable; code reading them must handle NULL on
+rows written before the upgrade.
+"""
+import logging
+
+from sqlalchemy import inspect
+
+from .database import Base
+
+logger = logging.getLogger(__name__)
+
+# Values for rows that predate a column, keyed by (table, column) and dialect.
+# SQLite compares timestamps as text, so backfilled ones get the same
+# microsecond format SQLAlchemy writes.
+COLUMN_BACKFILLS = {
+    ("conversations", "updated_at"): {
+        "sqlite": "CASE WHEN length(COALESCE(completed_at, created_at)) = 19 "
+                  "THEN COALESCE(completed_at, created_at) || '.000000' "
+                  "ELSE COALESCE(completed_at, created_at) END",
+        "default": "COALESCE(completed_at, created_at)",
+    },
+}
+
+
+def upgrade_schema(engine):
+    """Add model columns and indexes missing from existing tables"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                logger.info("Added column %s.%s", table.name, column.name)
+                backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill:
+                    value = backfill.get(engine.dialect.name, backfill["default"])
+                    conn.exec_driver_sql(f"UPDATE {table.name} SET {column.name} = {value}")
+
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+                    logger.info("Created index %s", index.name)
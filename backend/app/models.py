@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean, Float, Index, LargeBinary
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.sql import func
 from .database import Base
+from datetime import datetime
 
 class User(Base):
     __tablename__ = "users"
@@ -30,6 +31,13 @@ class Agent(Base):
     agent_link = Column(String, unique=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     is_active = Column(Boolean, default=True)
+    data_version = Column(Integer, default=0)  # Bumped when analytics-relevant conversation data changes
+    timeseries_version = Column(Integer, default=0)  # Bumped when a write lands in an already settled time bucket
+    
+    # Admission limits for the public link (NULL: server defaults / unlimited)
+    sessions_per_minute = Column(Integer)
+    daily_session_quota = Column(Integer)
+    max_concurrent_sessions = Column(Integer)
     
     # Foreign key
     owner_id = Column(Integer, ForeignKey("users.id"))
@@ -57,20 +65,67 @@ class Conversation(Base):
     key_terms = Column(JSON)  # Extracted key terms for CSV
     audio_recording_path = Column(String)  # Path to recorded audio
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    completed_at = Column(DateTime(timezone=True))
+    # Old values are loaded before a change so timeseries can tell which buckets it touches
+    created_at = column_property(Column(DateTime(timezone=True), server_default=func.now()), active_history=True)
+    completed_at = column_property(Column(DateTime(timezone=True)), active_history=True)
+    # Set on every write (microsecond resolution); drives delta exports
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Precomputed statistics, maintained by conversation_stats on every write
+    total_message_count = Column(Integer)
+    user_message_count = Column(Integer)
+    agent_message_count = Column(Integer)
+    first_user_message = Column(Text)
+    last_user_message = Column(Text)
+    last_agent_message = Column(Text)
+    themes = Column(JSON)
+    topic_word_counts = Column(JSON)
+    duration_seconds = Column(Float)
+    
+    # Coordinates resolved from participant_location by the offline geocoder;
+    # geocoded_location records which location string they belong to
+    location_latitude = Column(Float)
+    location_longitude = Column(Float)
+    geocoded_location = Column(String)
+    
+    # Set once the transcript has moved to conversation_archives; full_conversation is NULL then
+    archived_at = Column(DateTime(timezone=True))
+    # Data collection state of a live session, saved when a server drains so it resumes after reconnecting
+    session_state = Column(JSON)
     
     # Foreign key
     agent_id = Column(Integer, ForeignKey("agents.id"))
     
     # Relationship
     agent = relationship("Agent", back_populates="conversations")
+    
+    __table_args__ = (
+        # Covers the heatmap's per-location aggregation so it never reads table rows
+        Index("ix_conversations_agent_location", "agent_id", "participant_location",
+              "geocoded_location", "location_latitude", "location_longitude"),
+        # Range filters of the time-series analytics
+        Index("ix_conversations_agent_created", "agent_id", "created_at"),
+        Index("ix_conversations_agent_completed", "agent_id", "completed_at"),
+        # Keyset scans of delta exports
+        Index("ix_conversations_agent_updated", "agent_id", "updated_at", "id"),
+    )
+
+class ConversationArchive(Base):
+    __tablename__ = "conversation_archives"
+    
+    # Compressed transcripts of old completed conversations (see app/archive.py)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), primary_key=True)
+    codec = Column(String)  # 'zstd' or 'zlib'
+    transcript = Column(LargeBinary)
+    raw_bytes = Column(Integer)  # Size of the uncompressed JSON
+    archived_at = Column(DateTime(timezone=True), default=datetime.utcnow)
 
 class ConversationMessage(Base):
     __tablename__ = "conversation_messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), index=True)
+    agent_id = Column(Integer, ForeignKey("agents.id"), index=True)  # Denormalized for search scoping
     sender = Column(String)  # 'agent' or 'user'
     message = Column(Text)
     audio_path = Column(String)  # Path to individual message audio
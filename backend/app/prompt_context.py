@@ -0,0 +1,215 @@
+"""
+Token-budgeted prompt context for LLM turns.
+
+Every request is assembled within PROMPT_TOKEN_BUDGET tokens:
+
+- the agent's knowledge is split into chunks once, and only the chunks
+  most relevant to the latest message (plus the participant's topic) are
+  included, up to a share of the budget;
+- the most recent turns are included verbatim, newest first, as far as
+  the budget allows;
+- turns that fall out of that window are folded into a rolling summary
+  kept in the session state. The summary is extended incrementally and
+  capped, so it never has to be rebuilt from the full transcript.
+
+Token counts are estimated from the text (about four characters per
+token), which is close enough for budgeting without shipping the model's
+tokenizer.
+"""
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+# Share of the budget (after the fixed parts) that knowledge may use
+KNOWLEDGE_BUDGET_SHARE = float(os.getenv("PROMPT_KNOWLEDGE_SHARE", "0.4"))
+SUMMARY_MAX_TOKENS = int(os.getenv("PROMPT_SUMMARY_MAX_TOKENS", "400"))
+CHUNK_TOKENS = 200
+SUMMARY_LINE_WORDS = 30
+# Always keep at least this many recent messages verbatim
+MIN_RECENT_MESSAGES = 2
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'your', 'with', 'this', 'that', 'have', 'has',
+    'was', 'were', 'what', 'when', 'where', 'which', 'who', 'how', 'why', 'can', 'could', 'would',
+    'should', 'about', 'from', 'they', 'them', 'their', 'there', 'here', 'our', 'its', 'into', 'also',
+    'just', 'like', 'some', 'very', 'more', 'most', 'much', 'many', 'any', 'all', 'been', 'being',
+    'will', 'did', 'does', 'doing', 'than', 'then', 'too', 'yes', 'i\'m', 'it\'s', 'don\'t',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in _WORD_RE.findall(text.lower()) if len(word) > 2 and word not in STOPWORDS]
+
+
+class KnowledgeIndex:
+    """Knowledge text split into ~CHUNK_TOKENS chunks with term statistics"""
+
+    def __init__(self, knowledge: str):
+        self.chunks = split_chunks(knowledge)
+        self.chunk_tokens = [estimate_tokens(chunk) for chunk in self.chunks]
+        self.term_counts = [Counter(_terms(chunk)) for chunk in self.chunks]
+        document_frequency: Counter = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        total = len(self.chunks)
+        self.idf = {term: math.log(1 + total / df) for term, df in document_frequency.items()}
+        self.total_tokens = sum(self.chunk_tokens)
+
+    def select(self, query: str, budget: int) -> List[str]:
+        """Most relevant chunks fitting in `budget` tokens, in their original order"""
+        if self.total_tokens <= budget:
+            return list(self.chunks)
+        query_terms = set(_terms(query))
+        scored = []
+        for position, counts in enumerate(self.term_counts):
+            score = sum(self.idf[term] * (1 + math.log(counts[term])) for term in query_terms if term in counts)
+            scored.append((score, -position))
+        # Without any overlap the leading chunks (usually the overview) win
+        scored.sort(reverse=True)
+
+        selected = []
+        used = 0
+        for score, negative_position in scored:
+            position = -negative_position
+            if used + self.chunk_tokens[position] > budget:
+                continue
+            selected.append(position)
+            used += self.chunk_tokens[position]
+        return [self.chunks[position] for position in sorted(selected)]
+
+
+def split_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """Paragraphs, with long paragraphs split on sentence boundaries"""
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            chunks.append(paragraph)
+            continue
+        current = ""
+        for sentence in _SENTENCE_RE.split(paragraph):
+            if current and estimate_tokens(current) + estimate_tokens(sentence) > max_tokens:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {sentence}".strip()
+            # A single sentence longer than a chunk is hard-split
+            while estimate_tokens(current) > max_tokens:
+                chunks.append(current[:max_tokens * 4])
+                current = current[max_tokens * 4:]
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+@lru_cache(maxsize=256)
+def knowledge_index(knowledge: str) -> KnowledgeIndex:
+    return KnowledgeIndex(knowledge)
+
+
+def _summary_line(message: Dict) -> Optional[str]:
+    text = " ".join((message.get("message") or "").split())
+    if not text:
+        return None
+    words = text.split(" ")
+    if len(words) > SUMMARY_LINE_WORDS:
+        text = " ".join(words[:SUMMARY_LINE_WORDS]) + "..."
+    speaker = "Participant" if message.get("sender") == "user" else "Agent"
+    return f"{speaker}: {text}"
+
+
+def update_summary(context_state: Dict, history: List[Dict], upto: int):
+    """Fold history[summarized_upto:upto] into the rolling summary"""
+    start = context_state.get("summarized_upto", 0)
+    if upto <= start:
+        return
+    lines = context_state.setdefault("summary_lines", [])
+    for message in history[start:upto]:
+        # Agent turns only matter as context for answers; keep the participant's words
+        if message.get("sender") != "user":
+            continue
+        line = _summary_line(message)
+        if line:
+            lines.append(line)
+    context_state["summarized_upto"] = upto
+
+    # Cap the summary, dropping the oldest points first
+    omitted = context_state.get("summary_omitted", 0)
+    while len(lines) > 1 and sum(estimate_tokens(line) for line in lines) > SUMMARY_MAX_TOKENS:
+        lines.pop(0)
+        omitted += 1
+    context_state["summary_omitted"] = omitted
+
+
+def summary_text(context_state: Dict) -> str:
+    lines = context_state.get("summary_lines") or []
+    if not lines:
+        return ""
+    omitted = context_state.get("summary_omitted", 0)
+    prefix = [f"({omitted} earlier points omitted)"] if omitted else []
+    return "\n".join(prefix + lines)
+
+
+def build_messages(system_prompt: str, knowledge: str, history: List[Dict], user_message: str,
+                   context_state: Dict, knowledge_query: str = "", response_tokens: int = 150,
+                   budget: int = PROMPT_TOKEN_BUDGET) -> Tuple[List[Dict], int]:
+    """Chat messages for one turn within `budget` tokens, and their estimated size.
+
+    `history` may already end with the current user message; it is not sent twice.
+    `context_state` is the per-session dict holding the rolling summary.
+    """
+    if history and history[-1].get("sender") == "user" and history[-1].get("message") == user_message:
+        history = history[:-1]
+
+    fixed_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_message) + response_tokens
+    available = max(0, budget - fixed_tokens)
+
+    index = knowledge_index(knowledge or "")
+    knowledge_budget = int(available * KNOWLEDGE_BUDGET_SHARE)
+    chunks = index.select(f"{user_message} {knowledge_query}", knowledge_budget) if index.chunks else []
+    knowledge_text = "\n\n".join(chunks)
+    available -= estimate_tokens(knowledge_text)
+
+    # Reserve room for the summary, then fill the rest with recent turns
+    available -= min(SUMMARY_MAX_TOKENS, estimate_tokens(summary_text(context_state)) + 50)
+    window_start = len(history)
+    for position in range(len(history) - 1, -1, -1):
+        cost = estimate_tokens(history[position].get("message", "")) + 4
+        if cost > available and len(history) - position > MIN_RECENT_MESSAGES:
+            break
+        available -= cost
+        window_start = position
+    # Everything before the window is covered by the summary from now on
+    window_start = max(window_start, context_state.get("summarized_upto", 0))
+    update_summary(context_state, history, window_start)
+
+    content = system_prompt.rstrip()
+    if knowledge_text:
+        content += f"\n\nYour knowledge:\n{knowledge_text}"
+    summary = summary_text(context_state)
+    if summary:
+        content += f"\n\nEARLIER IN THIS CONVERSATION (summary):\n{summary}"
+
+    messages = [{"role": "system", "content": content}]
+    for message in history[window_start:]:
+        messages.append({
+            "role": "user" if message.get("sender") == "user" else "assistant",
+            "content": message.get("message", "")
+        })
+    messages.append({"role": "user", "content": user_message})
+
+    tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    return messages, tokens
@@ -0,0 +1,160 @@
+"""
+Per-request database accounting and slow-query logging.
+
+Every statement executed on an instrumented engine is timed once, recorded
+in the db_query_seconds metric and added to the QueryStats of the current
+scope (an HTTP request or a WebSocket turn). Statements slower than
+SLOW_QUERY_MS are logged together with their query plan.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# Attach X-DB-* summary headers to HTTP responses
+DEBUG_HEADERS = os.getenv("APP_DEBUG", "false").lower() in ("1", "true", "yes")
+
+_PLANNABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+
+
+class QueryStats:
+    __slots__ = ("queries", "rows", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    @property
+    def milliseconds(self) -> float:
+        return round(self.seconds * 1000, 2)
+
+    def as_headers(self):
+        return {
+            "X-DB-Queries": str(self.queries),
+            "X-DB-Rows": str(self.rows),
+            "X-DB-Time-Ms": str(self.milliseconds),
+        }
+
+    def __repr__(self):
+        return f"<QueryStats queries={self.queries} rows={self.rows} ms={self.milliseconds}>"
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+@contextmanager
+def track_queries():
+    """Collect query count, rows and DB time for everything run inside the block"""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def _explain(cursor, statement, parameters, dialect_name: str) -> str:
+    """Run the dialect's EXPLAIN on a side cursor of the same DBAPI connection"""
+    prefix = "EXPLAIN QUERY PLAN " if dialect_name == "sqlite" else "EXPLAIN "
+    try:
+        plan_cursor = cursor.connection.cursor()
+        try:
+            plan_cursor.execute(prefix + statement, parameters)
+            rows = plan_cursor.fetchall()
+        finally:
+            plan_cursor.close()
+    except Exception as e:
+        return f"(plan unavailable: {e})"
+    if dialect_name == "sqlite":
+        # (id, parent, notused, detail)
+        return "; ".join(str(row[-1]) for row in rows)
+    return "; ".join(" ".join(str(col) for col in row) for row in rows)
+
+
+def instrument_engine(engine):
+    """Hook statement timing, metrics, per-scope accounting and slow-query logging into the engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_stats_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_stats_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        metrics.observe_query(statement, elapsed)
+
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+            # Rows written; rows materialized by the ORM are counted by the load hook below
+            if cursor.rowcount and cursor.rowcount > 0:
+                stats.rows += cursor.rowcount
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            operation = statement.lstrip()[:6].upper()
+            plan = ""
+            if not executemany and operation.startswith(_PLANNABLE):
+                plan = _explain(cursor, statement, parameters, engine.dialect.name)
+            logger.warning(
+                "Slow query (%.1f ms, %d param bytes): %s | plan: %s",
+                elapsed * 1000,
+                len(repr(parameters)),
+                " ".join(statement.split())[:1000],
+                plan or "n/a",
+            )
+
+    return engine
+
+
+class QueryAccountingMiddleware:
+    """Count queries, rows and DB time per HTTP request.
+
+    Plain ASGI rather than BaseHTTPMiddleware: the scope stays open until
+    the response body has been sent, so queries made while a streaming
+    response is produced are counted too. With DEBUG_HEADERS the X-DB-*
+    headers report what ran before the response started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_with_headers(message):
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).update(stats.as_headers())
+                await send(message)
+
+            await self.app(scope, receive, send_with_headers if DEBUG_HEADERS else send)
+
+
+@event.listens_for(Session, "loaded_as_persistent")
+def _count_loaded_row(session, instance):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.rows += 1
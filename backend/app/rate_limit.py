@@ -0,0 +1,234 @@
+"""
+Admission control for the public conversation endpoints.
+
+Starting a conversation needs no login, so the start endpoints and the
+conversation WebSocket are guarded here with in-memory counters only:
+
+- a token bucket per client IP (RATE_LIMIT_IP_PER_MINUTE, burst
+  RATE_LIMIT_IP_BURST), checked before anything touches the database;
+- a token bucket per agent link, refilled at the agent's own
+  `sessions_per_minute` (RATE_LIMIT_LINK_PER_MINUTE if unset) as read
+  from the database on every start, so quota changes apply everywhere
+  from the next request on;
+- the agent's `max_concurrent_sessions`, then its `daily_session_quota`
+  of new conversations per UTC day, charged last and given back if the
+  conversation is not created;
+- a cap of WS_MAX_SESSIONS concurrent WebSocket sessions per worker.
+
+Rejected requests get 429 (rates, quotas) or 503 (capacity) with a
+Retry-After header; rejected WebSockets are closed with 1013 (try again
+later). Counters are per worker process: with several workers the
+effective limits are up to that many times higher, and the daily quota
+is re-counted from the database when a worker first sees an agent each
+day.
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "20"))
+RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "10"))
+RATE_LIMIT_LINK_PER_MINUTE = float(os.getenv("RATE_LIMIT_LINK_PER_MINUTE", "120"))
+RATE_LIMIT_LINK_BURST = int(os.getenv("RATE_LIMIT_LINK_BURST", "30"))
+# Buckets kept per limiter; the least recently used are forgotten (as if full)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+WS_MAX_SESSIONS = int(os.getenv("WS_MAX_SESSIONS", "1000"))
+
+# WebSocket close code for "try again later"
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0 if one was available, else seconds until the next one"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return 60.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets by key, bounded to RATE_LIMIT_MAX_KEYS"""
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def hit(self, key: str, per_minute: Optional[float] = None) -> float:
+        """Count a request, at `per_minute` instead of the default rate if given;
+        returns 0 if allowed, else the seconds to wait"""
+        if per_minute is None:
+            per_minute, burst = self.per_minute, self.burst
+        else:
+            # A slow custom rate must not allow a full default burst
+            burst = min(self.burst, max(1, int(per_minute)))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(per_minute, burst)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.rate = per_minute / 60
+            bucket.capacity = max(1, burst)
+            bucket.tokens = min(bucket.tokens, bucket.capacity)
+        return bucket.take()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class DailyQuota:
+    """New conversations per agent and UTC day"""
+
+    def __init__(self):
+        self._counts: Dict[int, Tuple[str, int]] = {}
+
+    def try_acquire(self, agent_id: int, limit: int, seed: Callable[[], int]) -> bool:
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        counted = self._counts.get(agent_id)
+        if counted is None or counted[0] != day:
+            # First sight today: start from what is already stored
+            counted = (day, seed())
+        if counted[1] >= limit:
+            self._counts[agent_id] = counted
+            return False
+        self._counts[agent_id] = (day, counted[1] + 1)
+        return True
+
+    def release(self, agent_id: int):
+        """Give back a slot taken today by a conversation that was not created"""
+        counted = self._counts.get(agent_id)
+        if counted is not None and counted[0] == datetime.utcnow().strftime("%Y-%m-%d") and counted[1] > 0:
+            self._counts[agent_id] = (counted[0], counted[1] - 1)
+
+
+class SessionSlots:
+    """Concurrent WebSocket sessions per agent"""
+
+    def __init__(self):
+        self._active: Dict[int, int] = {}
+
+    def acquire(self, agent_id: int, limit: Optional[int]) -> bool:
+        active = self._active.get(agent_id, 0)
+        if limit is not None and active >= limit:
+            return False
+        self._active[agent_id] = active + 1
+        return True
+
+    def active(self, agent_id: int) -> int:
+        return self._active.get(agent_id, 0)
+
+    def release(self, agent_id: int):
+        active = self._active.get(agent_id, 0) - 1
+        if active > 0:
+            self._active[agent_id] = active
+        else:
+            self._active.pop(agent_id, None)
+
+
+ip_limiter = RateLimiter(RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+link_limiter = RateLimiter(RATE_LIMIT_LINK_PER_MINUTE, RATE_LIMIT_LINK_BURST)
+daily_quota = DailyQuota()
+session_slots = SessionSlots()
+
+
+def _reject(status_code: int, detail: str, retry_after: float, scope: str):
+    metrics.rate_limited_total.inc(scope=scope)
+    raise HTTPException(status_code=status_code, detail=detail,
+                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+def check_new_session(client_ip: Optional[str], active_sessions: int):
+    """Cheap checks before a start request touches the database"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    if active_sessions >= WS_MAX_SESSIONS:
+        _reject(503, "Too many active conversations, please retry shortly", 5, "capacity")
+    if client_ip:
+        wait = ip_limiter.hit(client_ip)
+        if wait:
+            _reject(429, "Too many conversations started, please retry later", wait, "ip")
+
+
+def _conversations_today(db: Session, agent_id: int) -> int:
+    midnight = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return db.query(func.count(models.Conversation.id)).filter(
+        models.Conversation.agent_id == agent_id,
+        models.Conversation.created_at >= midnight
+    ).scalar() or 0
+
+
+def check_agent_quota(db: Session, agent: models.Agent):
+    """Per-agent limits, once the agent behind a link is known.
+
+    Takes a daily quota slot if the agent has a quota; call
+    release_daily_quota if the conversation is then not created.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    wait = link_limiter.hit(agent.agent_link, agent.sessions_per_minute)
+    if wait:
+        _reject(429, "This link is receiving too many requests, please retry later", wait, "link")
+    if agent.max_concurrent_sessions is not None \
+            and session_slots.active(agent.id) >= agent.max_concurrent_sessions:
+        _reject(503, "This agent has too many active conversations, please retry shortly", 5, "concurrency")
+    # Charged last, so no other rejection uses up a slot
+    if agent.daily_session_quota is not None:
+        agent_id = agent.id
+        if not daily_quota.try_acquire(agent_id, agent.daily_session_quota,
+                                       seed=lambda: _conversations_today(db, agent_id)):
+            now = datetime.utcnow()
+            seconds_left = 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+            _reject(429, "This agent has reached its daily conversation limit", seconds_left, "quota")
+
+
+def release_daily_quota(agent_id: int):
+    if RATE_LIMIT_ENABLED:
+        daily_quota.release(agent_id)
+
+
+def ws_capacity_reached(active_sessions: int) -> bool:
+    """Whether a new WebSocket session would exceed WS_MAX_SESSIONS"""
+    if RATE_LIMIT_ENABLED and active_sessions >= WS_MAX_SESSIONS:
+        metrics.rate_limited_total.inc(scope="capacity")
+        return True
+    return False
+
+
+def acquire_session(agent: models.Agent) -> bool:
+    """Take one of the agent's concurrent session slots; every acquired one must be released"""
+    limit = agent.max_concurrent_sessions if RATE_LIMIT_ENABLED else None
+    if not session_slots.acquire(agent.id, limit):
+        metrics.rate_limited_total.inc(scope="concurrency")
+        return False
+    return True
+
+
+def release_session(agent_id: int):
+    session_slots.release(agent_id)
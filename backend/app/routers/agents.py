@@ -37,6 +37,35 @@ def get_agent(
     
     return agent
 
+@router.put("/{agent_id}/quotas", response_model=schemas.AgentResponse)
+def update_agent_quotas(
+    agent_id: int,
+    quotas: schemas.AgentQuotas,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Set the admission limits of an agent's public link (null for the server defaults).
+
+    Limits are enforced per worker process. New values apply on each
+    worker's next start request, but with several workers the link rate and
+    the concurrent session cap apply to each worker separately, and the
+    daily quota is only re-counted from stored conversations when a worker
+    first sees the agent each day.
+    """
+    agent = crud.get_agent_by_id(db=db, agent_id=agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    if agent.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    agent.sessions_per_minute = quotas.sessions_per_minute
+    agent.daily_session_quota = quotas.daily_session_quota
+    agent.max_concurrent_sessions = quotas.max_concurrent_sessions
+    db.commit()
+    db.refresh(agent)
+    return agent
+
 @router.get("/public/{agent_link}")
 def get_agent_by_link(agent_link: str, db: Session = Depends(get_db)):
     agent = crud.get_agent_by_link(db=db, agent_link=agent_link)
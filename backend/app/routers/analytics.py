@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from typing import Optional
-from app import crud, schemas, auth, models
-from app.database import get_db
-import pandas as pd
+from app import crud, schemas, auth, models, search, conversation_stats, archive, analytics_cache, geocoding, timeseries, export_delta, events, serialization
+from app.events import event_bus
+from app.export_jobs import export_jobs, download_response
+from app.database import get_read_db, SessionLocal
 from io import StringIO, BytesIO
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from datetime import datetime
+import asyncio
 import json
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
@@ -13,7 +16,8 @@ router = APIRouter(prefix="/analytics", tags=["analytics"])
 @router.get("/dashboard/{agent_id}", response_model=schemas.AnalyticsResponse)
 def get_analytics_dashboard(
     agent_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     # Verify agent ownership
@@ -24,19 +28,50 @@ def get_analytics_dashboard(
     if agent.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    # Get analytics data
-    conversations = crud.get_conversations_by_agent(db=db, agent_id=agent_id)
-    total_conversations = len(conversations)
+    def compute():
+        # Get analytics data
+        conversations = crud.get_conversations_by_agent(db=db, agent_id=agent_id)
+        total_conversations = len(conversations)
+        
+        age_distribution = crud.get_age_distribution(db=db, agent_id=agent_id)
+        gender_breakdown = crud.get_gender_breakdown(db=db, agent_id=agent_id)
+        # Newly seen locations are geocoded once and stored through a write session
+        with SessionLocal() as writer:
+            location_data = geocoding.location_points(db, agent_id, writer=writer)
+        
+        return schemas.AnalyticsResponse(
+            total_conversations=total_conversations,
+            age_distribution=[schemas.AgeDistribution(**item) for item in age_distribution],
+            gender_breakdown=[schemas.GenderBreakdown(**item) for item in gender_breakdown],
+            location_data=[
+                schemas.LocationData(
+                    location=item["location"],
+                    count=item["count"],
+                    coordinates=[item["latitude"], item["longitude"]] if item["latitude"] is not None else None
+                )
+                for item in location_data
+            ]
+        )
+    
+    # Served from cache / 304 until this agent's conversations change
+    return analytics_cache.cached_response(request, "dashboard", agent, compute)
+
+@router.get("/portfolio", response_model=schemas.PortfolioResponse)
+def get_portfolio_analytics(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Volumes and demographics across all of the current user's agents, with per-agent breakdowns"""
+    
+    # Only the user's own agents are aggregated, so no per-agent ownership check is needed
+    agents = crud.get_agents_by_user(db=db, user_id=current_user.id)
     
-    age_distribution = crud.get_age_distribution(db=db, agent_id=agent_id)
-    gender_breakdown = crud.get_gender_breakdown(db=db, agent_id=agent_id)
-    location_data = crud.get_location_data(db=db, agent_id=agent_id)
+    def compute():
+        return crud.get_portfolio_analytics(db=db, agents=agents)
     
-    return schemas.AnalyticsResponse(
-        total_conversations=total_conversations,
-        age_distribution=[schemas.AgeDistribution(**item) for item in age_distribution],
-        gender_breakdown=[schemas.GenderBreakdown(**item) for item in gender_breakdown],
-        location_data=[schemas.LocationData(**item) for item in location_data]
+    return analytics_cache.serve_versioned(
+        request, "portfolio", f"user{current_user.id}", analytics_cache.agents_version(agents), compute
     )
 
 def extract_conversation_summary(conversation_history):
@@ -55,17 +90,8 @@ def extract_conversation_summary(conversation_history):
     all_text = " ".join(user_messages).lower()
     
     # Common themes based on agent purposes
-    themes = {
-        "health": ["health", "medical", "doctor", "hospital", "medicine", "treatment", "symptoms"],
-        "agriculture": ["farm", "crop", "farming", "agriculture", "harvest", "soil", "plant"],
-        "education": ["school", "learn", "education", "teacher", "student", "study", "knowledge"],
-        "technology": ["computer", "software", "digital", "internet", "app", "technology"],
-        "finance": ["money", "bank", "investment", "finance", "budget", "income", "expense"],
-        "social": ["family", "community", "social", "friends", "society", "culture", "relationship"]
-    }
-    
     identified_themes = []
-    for theme, keywords in themes.items():
+    for theme, keywords in conversation_stats.THEMES.items():
         if any(keyword in all_text for keyword in keywords):
             identified_themes.append(theme)
     
@@ -87,13 +113,57 @@ def extract_conversation_summary(conversation_history):
     
     return " | ".join(summary_parts)
 
+def build_export_row(conversation: models.Conversation, agent: models.Agent) -> dict:
+    """One CSV row for a conversation, read from its precomputed stats"""
+    conversation_stats.ensure_stats(conversation)
+    duration_minutes = conversation_stats.duration_minutes(conversation)
+    
+    row = {
+        "conversation_id": conversation.id,
+        "session_id": conversation.session_id,
+        "participant_name": conversation.participant_name,
+        "participant_age": conversation.participant_age,
+        "participant_gender": conversation.participant_gender,
+        "participant_location": conversation.participant_location,
+        "conversation_date": conversation.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "completed_date": conversation.completed_at.strftime("%Y-%m-%d %H:%M:%S") if conversation.completed_at else "Not completed",
+        "agent_name": agent.name,
+        "agent_purpose": agent.purpose,
+        "agent_segment": agent.segment,
+        "conversation_summary": conversation_stats.summary_text(conversation),
+        "manual_summary": conversation.summary or "No manual summary",
+        "total_messages": conversation.total_message_count,
+        "user_messages_count": conversation.user_message_count,
+        "agent_messages_count": conversation.agent_message_count,
+        "first_user_response": conversation_stats.first_user_response(conversation),
+        "last_agent_response": conversation_stats.last_agent_response(conversation),
+        "conversation_duration_minutes": duration_minutes if duration_minutes is not None else "Ongoing"
+    }
+    
+    # Add additional participant info
+    if conversation.participant_info:
+        for key, value in conversation.participant_info.items():
+            row[f"additional_{key}"] = str(value)
+    
+    # Add key terms as separate columns
+    if conversation.key_terms:
+        for key, value in conversation.key_terms.items():
+            row[f"key_term_{key}"] = str(value)
+    
+    # Add full conversation as JSON (optional - can be large); archived ones are rehydrated
+    transcript = archive.get_transcript(conversation)
+    row["full_conversation_json"] = json.dumps(transcript) if transcript else ""
+    
+    return row
+
 @router.get("/export/{agent_id}/csv")
 def export_all_conversations_csv(
     agent_id: int,
-    db: Session = Depends(get_db),
+    since: Optional[str] = Query(None, description="Cursor from a previous export's X-Next-Cursor"),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    """Export all conversations for an agent to CSV"""
+    """Export all conversations for an agent to CSV, or only those completed or changed since a cursor"""
     
     # Verify agent ownership
     agent = crud.get_agent_by_id(db=db, agent_id=agent_id)
@@ -103,74 +173,26 @@ def export_all_conversations_csv(
     if agent.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    conversations = crud.get_conversations_by_agent(db=db, agent_id=agent_id)
-    
-    if not conversations:
-        raise HTTPException(status_code=404, detail="No conversations found")
+    batches = export_delta.ExportBatches(db, agent_id=agent_id, since=parse_export_cursor(since))
     
     # Prepare CSV data
-    csv_data = []
-    for conversation in conversations:
-        # Extract conversation summary and themes
-        conversation_summary = extract_conversation_summary(conversation.full_conversation)
-        
-        # Count messages
-        total_messages = len(conversation.full_conversation) if conversation.full_conversation else 0
-        user_messages = len([msg for msg in conversation.full_conversation if msg.get("sender") == "user"]) if conversation.full_conversation else 0
-        agent_messages = len([msg for msg in conversation.full_conversation if msg.get("sender") == "agent"]) if conversation.full_conversation else 0
-        
-        # Extract first user message and last agent response for context
-        first_user_msg = ""
-        last_agent_msg = ""
-        
-        if conversation.full_conversation:
-            user_msgs = [msg.get("message", "") for msg in conversation.full_conversation if msg.get("sender") == "user"]
-            agent_msgs = [msg.get("message", "") for msg in conversation.full_conversation if msg.get("sender") == "agent"]
-            
-            if user_msgs:
-                first_user_msg = user_msgs[0][:200] + "..." if len(user_msgs[0]) > 200 else user_msgs[0]
-            if agent_msgs:
-                last_agent_msg = agent_msgs[-1][:200] + "..." if len(agent_msgs[-1]) > 200 else agent_msgs[-1]
-        
-        row = {
-            "conversation_id": conversation.id,
-            "session_id": conversation.session_id,
-            "participant_name": conversation.participant_name,
-            "participant_age": conversation.participant_age,
-            "participant_gender": conversation.participant_gender,
-            "participant_location": conversation.participant_location,
-            "conversation_date": conversation.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "completed_date": conversation.completed_at.strftime("%Y-%m-%d %H:%M:%S") if conversation.completed_at else "Not completed",
-            "agent_name": agent.name,
-            "agent_purpose": agent.purpose,
-            "agent_segment": agent.segment,
-            "conversation_summary": conversation_summary,
-            "manual_summary": conversation.summary or "No manual summary",
-            "total_messages": total_messages,
-            "user_messages_count": user_messages,
-            "agent_messages_count": agent_messages,
-            "first_user_response": first_user_msg,
-            "last_agent_response": last_agent_msg,
-            "conversation_duration_minutes": (
-                (conversation.completed_at - conversation.created_at).total_seconds() / 60
-                if conversation.completed_at else "Ongoing"
-            )
-        }
-        
-        # Add additional participant info
-        if conversation.participant_info:
-            for key, value in conversation.participant_info.items():
-                row[f"additional_{key}"] = str(value)
-        
-        # Add key terms as separate columns
-        if conversation.key_terms:
-            for key, value in conversation.key_terms.items():
-                row[f"key_term_{key}"] = str(value)
-        
-        # Add full conversation as JSON (optional - can be large)
-        row["full_conversation_json"] = json.dumps(conversation.full_conversation) if conversation.full_conversation else ""
-        
-        csv_data.append(row)
+    csv_data = [build_export_row(conversation, agent) for batch in batches for conversation in batch]
+    
+    headers = {
+        "Content-Disposition": f"attachment; filename=agent_{agent_id}_conversations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    }
+    next_cursor = export_delta.encode_cursor(batches.next_cursor)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    
+    if not csv_data:
+        if since is None:
+            raise HTTPException(status_code=404, detail="No conversations found")
+        # Nothing new since the cursor
+        return Response(content="", media_type="text/csv", headers=headers)
+    
+    # pandas is only needed here; importing it lazily keeps worker startup fast
+    import pandas as pd
     
     # Create DataFrame and convert to CSV
     df = pd.DataFrame(csv_data)
@@ -186,15 +208,81 @@ def export_all_conversations_csv(
     return StreamingResponse(
         csv_bytes,
         media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename=agent_{agent_id}_conversations_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        }
+        headers=headers
     )
 
+def parse_export_cursor(since: Optional[str]):
+    if since is None:
+        return None
+    try:
+        return export_delta.decode_cursor(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/export/{agent_id}/jobs", status_code=202)
+def create_export_job(
+    agent_id: int,
+    since: Optional[str] = Query(None, description="Cursor from a previous export's next_cursor"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Start a background CSV export; poll the returned job for progress"""
+    
+    # Verify agent ownership
+    agent = crud.get_agent_by_id(db=db, agent_id=agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    if agent.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    cursor = parse_export_cursor(since)
+    job = export_jobs.submit(agent, owner_id=current_user.id, row_builder=build_export_row, since=cursor)
+    return job.to_dict()
+
+def get_owned_export_job(job_id: str, current_user: models.User):
+    job = export_jobs.get(job_id)
+    # Other users' jobs are indistinguishable from missing ones
+    if not job or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+@router.get("/export/jobs/{job_id}")
+def get_export_job(
+    job_id: str,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Status and progress of an export job"""
+    return get_owned_export_job(job_id, current_user).to_dict()
+
+@router.get("/export/jobs/{job_id}/download")
+def download_export_job(
+    job_id: str,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Download a finished export; supports Range requests to resume"""
+    job = get_owned_export_job(job_id, current_user)
+    if job.status != "completed" or not job.artifact_path.exists():
+        raise HTTPException(status_code=409, detail=f"Export is {job.status}")
+    return download_response(request, job)
+
+@router.delete("/export/jobs/{job_id}", status_code=204)
+def delete_export_job(
+    job_id: str,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Delete an export artifact before its retention window ends"""
+    job = get_owned_export_job(job_id, current_user)
+    if job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Export is still running")
+    export_jobs.delete(job)
+
 @router.get("/heatmap/{agent_id}")
 def get_location_heatmap_data(
     agent_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Get location data formatted for heatmap visualization"""
@@ -207,18 +295,166 @@ def get_location_heatmap_data(
     if agent.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    location_data = crud.get_location_data(db=db, agent_id=agent_id)
-    
-    # TODO: Add geocoding service integration to convert location names to coordinates
-    # For now, return basic location data
-    heatmap_data = []
-    for location in location_data:
-        heatmap_data.append({
-            "location": location["location"],
-            "count": location["count"],
-            "latitude": 0,  # TODO: Implement geocoding
-            "longitude": 0,  # TODO: Implement geocoding
-            "intensity": location["count"]
-        })
-    
-    return heatmap_data
\ No newline at end of file
+    def compute():
+        heatmap_data = []
+        with SessionLocal() as writer:
+            points = geocoding.location_points(db, agent_id, writer=writer)
+        for point in points:
+            heatmap_data.append({
+                "location": point["location"],
+                "count": point["count"],
+                "latitude": point["latitude"],
+                "longitude": point["longitude"],
+                "intensity": point["count"]
+            })
+        
+        return heatmap_data
+    
+    return analytics_cache.cached_response(request, "heatmap", agent, compute)
+
+@router.get("/timeseries/{agent_id}", response_model=schemas.TimeSeriesResponse)
+def get_timeseries(
+    agent_id: int,
+    start: datetime = Query(..., description="Range start (inclusive), UTC if no offset is given"),
+    end: Optional[datetime] = Query(None, description="Range end (exclusive), defaults to now"),
+    granularity: str = Query("day", pattern="^(hour|day|week)$"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Conversations started/completed, average duration and turns per time bucket"""
+    
+    # Verify agent ownership
+    agent = crud.get_agent_by_id(db=db, agent_id=agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    if agent.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    start = timeseries.to_utc_naive(start)
+    end = timeseries.to_utc_naive(end) if end else datetime.utcnow()
+    try:
+        buckets = timeseries.get_timeseries(db, agent_id=agent_id, start=start, end=end, granularity=granularity,
+                                            version=agent.timeseries_version or 0)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return schemas.TimeSeriesResponse(
+        agent_id=agent_id,
+        granularity=granularity,
+        start=start,
+        end=end,
+        buckets=[schemas.TimeSeriesBucket(**bucket) for bucket in buckets]
+    )
+
+@router.get("/search/{agent_id}")
+def search_conversations(
+    agent_id: int,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Full-text search over an agent's transcripts, best matches first"""
+    
+    # Verify agent ownership
+    agent = crud.get_agent_by_id(db=db, agent_id=agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    if agent.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    result = search.search_messages(db, agent_id=agent_id, query=q, limit=limit, offset=offset)
+    return {
+        "query": q,
+        "limit": limit,
+        "offset": offset,
+        "has_more": result["has_more"],
+        "results": result["results"]
+    }
+
+def check_live_feed_access(agent_id: int, token: Optional[str]):
+    """Validate the token and agent ownership for a live feed.
+
+    Uses its own short-lived session so no database connection is held for
+    the lifetime of the stream.
+    """
+    with SessionLocal() as db:
+        user = auth.get_user_from_token(db, token)
+        if user is None:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+        
+        agent = crud.get_agent_by_id(db=db, agent_id=agent_id)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        
+        if agent.owner_id != user.id:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+
+@router.get("/live/{agent_id}/events")
+async def stream_live_events(
+    agent_id: int,
+    request: Request,
+    token: Optional[str] = Query(None, description="Access token, for clients (EventSource) that cannot send headers")
+):
+    """Server-sent events for an agent's conversations as they happen"""
+    
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    check_live_feed_access(agent_id, token)
+    
+    async def stream():
+        async with event_bus.subscribe(agent_id) as queue:
+            # Sent immediately so the client knows the subscription is live
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=events.EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {serialization.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/live/{agent_id}/ws")
+async def live_events_websocket(websocket: WebSocket, agent_id: int, token: Optional[str] = None):
+    """The same live feed over a WebSocket; the access token is passed as ?token="""
+    try:
+        check_live_feed_access(agent_id, token)
+    except HTTPException as e:
+        # 1008 policy violation: refused before the handshake completes
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    
+    await websocket.accept()
+    async with event_bus.subscribe(agent_id) as queue:
+        # Client frames are ignored; receiving only tells us when it goes away
+        receiver = asyncio.ensure_future(websocket.receive())
+        getter = None
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if receiver in done:
+                    if receiver.result()["type"] == "websocket.disconnect":
+                        break
+                    receiver = asyncio.ensure_future(websocket.receive())
+                if getter in done:
+                    await serialization.send_json(websocket, getter.result())
+                    getter = None
+                else:
+                    getter.cancel()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+            if getter is not None:
+                getter.cancel()
@@ -1,54 +1,254 @@
 # Updated conversations.py with direct conversation start and data extraction
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, UploadFile, File
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 from datetime import datetime
-import json
-import httpx
+import asyncio
+import logging
 import os
 import uuid
 import aiofiles
 import re
+import sys
+import time
+from collections import OrderedDict
 from pathlib import Path
-from app import crud, schemas, models
-from app.database import get_db
-from dotenv import load_dotenv
-load_dotenv()
+from app import crud, schemas, models, metrics, query_stats, conversation_stats, geocoding, serialization, prompt_context, archive, rate_limit, auth, bulk_import
+from app.database import get_db, SessionLocal
+from app.llm_router import llm_router, LLMUnavailable, CircuitOpen
+from app.events import event_bus
+from app.write_behind import write_behind
+from app import events
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
-# Audio storage configuration
+logger = logging.getLogger(__name__)
+
+# Audio storage configuration (created at startup by init_storage)
 AUDIO_STORAGE_PATH = Path("audio_recordings")
-AUDIO_STORAGE_PATH.mkdir(exist_ok=True)
 
-# Cerebras API configuration
-CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY", "csk-ymtphj83pp5p9x42cwycj8rrxv9dw2d664fdjxmvv2p88n4")
-CEREBRAS_BASE_URL = "https://api.cerebras.ai/v1"
+# Close code telling clients to reconnect because the server is restarting
+WS_CLOSE_SERVICE_RESTART = 1012
+
+# Session states idle this long are saved to the database and dropped from memory
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+# Most session states kept in memory; the least recently active are saved and dropped beyond it
+SESSION_STATE_MAX = int(os.getenv("SESSION_STATE_MAX", "10000"))
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+
+STEP_ORDER = ('name', 'age', 'gender', 'location', 'topic')
+
+class SessionState:
+    """Data collection progress of one live session"""
+    
+    __slots__ = ('collected_data', 'collection_step', 'context', 'participant_published', 'last_active')
+    
+    def __init__(self):
+        self.collected_data: Dict[str, str] = {}
+        self.collection_step = STEP_ORDER[0]  # name -> age -> gender -> location -> topic -> complete
+        self.context: Dict = {}  # Rolling summary of turns that no longer fit the prompt
+        self.participant_published = False
+        self.last_active = time.monotonic()
+    
+    def to_dict(self) -> Dict:
+        return {
+            'collected_data': self.collected_data,
+            'collection_step': self.collection_step,
+            'context': self.context,
+            'participant_published': self.participant_published
+        }
+    
+    @classmethod
+    def from_dict(cls, saved: Dict) -> "SessionState":
+        state = cls()
+        state.collected_data = dict(saved.get('collected_data') or {})
+        state.collection_step = saved.get('collection_step') or STEP_ORDER[0]
+        state.context = dict(saved.get('context') or {})
+        state.participant_published = bool(saved.get('participant_published'))
+        return state
 
 class ConversationManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
-        self.conversation_states: Dict[str, Dict] = {}  # Track data collection state
+        # Data collection state per session, least recently active first
+        self.conversation_states: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.turns_in_flight: Set[str] = set()
+        self.draining = False
+        self._sweeper: Optional[asyncio.Task] = None
     
-    async def connect(self, websocket: WebSocket, session_id: str):
+    async def connect(self, websocket: WebSocket, session_id: str) -> bool:
+        """Accept a session; returns False (and closes it) while the server drains"""
         await websocket.accept()
+        if self.draining:
+            await websocket.close(code=WS_CLOSE_SERVICE_RESTART)
+            return False
+        if rate_limit.ws_capacity_reached(len(self.active_connections)):
+            await websocket.close(code=rate_limit.WS_CLOSE_TRY_AGAIN_LATER)
+            return False
         self.active_connections[session_id] = websocket
-        # Initialize conversation state for data collection
-        self.conversation_states[session_id] = {
-            'collected_data': {},
-            'collection_step': 'name',  # name -> age -> gender -> location -> topic -> complete
-            'step_order': ['name', 'age', 'gender', 'location', 'topic']
-        }
+        self.conversation_states[session_id] = SessionState()
+        self._enforce_cap()
+        return True
+    
+    def get_state(self, session_id: str) -> SessionState:
+        """The session's state, marked as active; reloaded if it was evicted.
+        
+        Sessions that are no longer connected get an empty, untracked state.
+        """
+        state = self.conversation_states.get(session_id)
+        if state is None:
+            if session_id not in self.active_connections:
+                return SessionState()
+            state = self._load_saved_state(session_id)
+            self.conversation_states[session_id] = state
+            self._enforce_cap()
+        else:
+            self.conversation_states.move_to_end(session_id)
+        state.last_active = time.monotonic()
+        return state
+    
+    def restore_state(self, session_id: str, saved_state: Optional[Dict]):
+        """Continue from the state saved when a previous server drained"""
+        if saved_state and session_id in self.conversation_states:
+            self.conversation_states[session_id] = SessionState.from_dict(saved_state)
+    
+    def _load_saved_state(self, session_id: str) -> SessionState:
+        with SessionLocal() as db:
+            saved = db.query(models.Conversation.session_state).filter(
+                models.Conversation.session_id == session_id
+            ).scalar()
+            if not saved:
+                return SessionState()
+            db.execute(
+                update(models.Conversation)
+                .where(models.Conversation.session_id == session_id)
+                .values(session_state=None, updated_at=models.Conversation.updated_at)
+            )
+            db.commit()
+        return SessionState.from_dict(saved)
+    
+    def save_states(self, session_ids: List[str]):
+        """Store the data collection state of sessions on their conversations"""
+        states = {sid: self.conversation_states[sid] for sid in session_ids if sid in self.conversation_states}
+        if not states:
+            return
+        with SessionLocal() as db:
+            for sid, state in states.items():
+                # Not a change of the conversation itself: keep updated_at
+                db.execute(
+                    update(models.Conversation)
+                    .where(models.Conversation.session_id == sid)
+                    .values(session_state=state.to_dict(), updated_at=models.Conversation.updated_at)
+                )
+            db.commit()
+        logger.info("Saved state of %s sessions", len(states))
+    
+    def evict(self, session_ids: List[str], reason: str):
+        """Save states and drop them from memory; connected sessions reload them on their next turn"""
+        self.save_states(session_ids)
+        for session_id in session_ids:
+            if self.conversation_states.pop(session_id, None) is not None:
+                metrics.ws_session_evictions_total.inc(reason=reason)
+    
+    def _enforce_cap(self):
+        overflow = len(self.conversation_states) - SESSION_STATE_MAX
+        if overflow <= 0:
+            return
+        victims = []
+        for session_id in self.conversation_states:
+            if len(victims) == overflow:
+                break
+            # A state in the middle of a turn is still being written to
+            if session_id not in self.turns_in_flight:
+                victims.append(session_id)
+        self.evict(victims, "capacity")
+    
+    def sweep(self) -> int:
+        """Evict states idle for longer than SESSION_IDLE_TTL_SECONDS"""
+        cutoff = time.monotonic() - SESSION_IDLE_TTL_SECONDS
+        idle = []
+        for session_id, state in self.conversation_states.items():
+            if state.last_active > cutoff:
+                break
+            if session_id not in self.turns_in_flight:
+                idle.append(session_id)
+        if idle:
+            self.evict(idle, "idle")
+        return len(idle)
+    
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(SESSION_SWEEP_SECONDS)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Sweeping idle session states failed")
+    
+    def start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.ensure_future(self._sweep_periodically())
+    
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+    
+    async def drain(self, timeout: float):
+        """Stop taking sessions, let running turns finish, then save and close every session"""
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while self.turns_in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.turns_in_flight:
+            logger.warning("Drain timed out with %s turns in flight", len(self.turns_in_flight))
+        
+        # Each handler saves its session's state as the socket closes
+        for websocket in list(self.active_connections.values()):
+            try:
+                await websocket.close(code=WS_CLOSE_SERVICE_RESTART)
+            except Exception:
+                pass
+        while self.active_connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        # Sessions whose handlers did not get there in time
+        self.save_states(list(self.conversation_states))
     
     def disconnect(self, session_id: str):
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
-        if session_id in self.conversation_states:
-            del self.conversation_states[session_id]
+        self.active_connections.pop(session_id, None)
+        self.conversation_states.pop(session_id, None)
+        self.turns_in_flight.discard(session_id)
+
+    def state_size_bytes(self) -> int:
+        """Approximate memory held by tracked conversation states (shallow per entry)"""
+        total = sys.getsizeof(self.conversation_states)
+        for state in list(self.conversation_states.values()):
+            total += sys.getsizeof(state) + sys.getsizeof(state.collected_data) + sys.getsizeof(state.context)
+            for value in list(state.collected_data.values()):
+                total += sys.getsizeof(value)
+            for line in list(state.context.get('summary_lines', [])):
+                total += sys.getsizeof(line)
+        return total
 
 manager = ConversationManager()
 
+def ensure_accepting_sessions(request: Request):
+    if manager.draining:
+        raise HTTPException(status_code=503, detail="Server is restarting, please retry",
+                            headers={"Retry-After": "5"})
+    client_ip = request.client.host if request.client else None
+    rate_limit.check_new_session(client_ip, len(manager.active_connections))
+
+def init_storage():
+    """Create audio storage directories; called from the application lifespan"""
+    AUDIO_STORAGE_PATH.mkdir(exist_ok=True)
+
+metrics.ws_active_connections.set_function(lambda: len(manager.active_connections))
+metrics.ws_session_states.set_function(lambda: len(manager.conversation_states))
+metrics.ws_session_state_bytes.set_function(manager.state_size_bytes)
+
 def extract_participant_data_from_message(message: str, expected_field: str) -> Optional[str]:
     """Extract specific participant data from their response"""
     message_lower = message.lower().strip()
@@ -124,29 +324,29 @@ def extract_participant_data_from_message(message: str, expected_field: str) ->
 
 async def get_ai_response_with_data_collection(agent, conversation_history, user_message, session_id):
     """Enhanced AI response that handles data collection"""
+    # get_state may reload an evicted state from the database; if that
+    # fails the fallback reply below still needs a step
+    current_step = STEP_ORDER[0]
     try:
         # Get conversation state
-        state = manager.conversation_states.get(session_id, {})
-        current_step = state.get('collection_step', 'name')
-        collected_data = state.get('collected_data', {})
-        step_order = state.get('step_order', ['name', 'age', 'gender', 'location', 'topic'])
+        state = manager.get_state(session_id)
+        current_step = state.collection_step
+        collected_data = state.collected_data
         
         # Try to extract data from user message if we're in collection mode
         if current_step != 'complete':
-            extracted_data = extract_participant_data_from_message(user_message, current_step)
+            with metrics.ws_turn_stage_seconds.time(stage="extraction"):
+                extracted_data = extract_participant_data_from_message(user_message, current_step)
             
             if extracted_data:
                 collected_data[current_step] = extracted_data
                 
                 # Move to next step
-                current_step_index = step_order.index(current_step)
-                if current_step_index < len(step_order) - 1:
-                    next_step = step_order[current_step_index + 1]
-                    manager.conversation_states[session_id]['collection_step'] = next_step
+                current_step_index = STEP_ORDER.index(current_step)
+                if current_step_index < len(STEP_ORDER) - 1:
+                    state.collection_step = STEP_ORDER[current_step_index + 1]
                 else:
-                    manager.conversation_states[session_id]['collection_step'] = 'complete'
-                
-                manager.conversation_states[session_id]['collected_data'] = collected_data
+                    state.collection_step = 'complete'
         
         # Create dynamic system prompt based on collection state
         if current_step == 'complete':
@@ -187,63 +387,47 @@ INSTRUCTIONS:
 - Be natural and conversational, not robotic
 - If they didn't provide clear {current_step} information, politely ask again
 - Use the exact question: "{next_questions[current_step]}"
-
-Your knowledge: {agent.knowledge}
 """
         
-        if not CEREBRAS_API_KEY or CEREBRAS_API_KEY == "your-cerebras-api-key":
+        if not llm_router.configured:
             print("Warning: Cerebras API key not configured, using fallback response")
+            metrics.upstream_fallbacks_total.inc(upstream="cerebras", reason="not_configured")
             if current_step != 'complete':
                 return next_questions[current_step]
             else:
                 return generate_specialized_fallback_response(agent, user_message)
         
-        # Build messages for API
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add recent conversation history
-        for msg in conversation_history[-5:]:
-            messages.append({
-                "role": "user" if msg["sender"] == "user" else "assistant",
-                "content": msg["message"]
-            })
-        
-        messages.append({"role": "user", "content": user_message})
-        
-        headers = {
-            "Authorization": f"Bearer {CEREBRAS_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "llama3.1-8b",
-            "messages": messages,
-            "max_tokens": 150,
-            "temperature": 0.7,
-            "stream": False
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{CEREBRAS_BASE_URL}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                ai_message = result["choices"][0]["message"]["content"]
-                return ai_message
+        # Build messages for API: relevant knowledge, a rolling summary of
+        # older turns and as many recent turns as fit the token budget
+        messages, prompt_tokens = prompt_context.build_messages(
+            system_prompt,
+            agent.knowledge,
+            conversation_history,
+            user_message,
+            context_state=state.context,
+            knowledge_query=collected_data.get('topic', ''),
+            response_tokens=150
+        )
+        metrics.llm_prompt_tokens.observe(
+            prompt_tokens, phase="conversation" if current_step == 'complete' else "collection"
+        )
+        
+        try:
+            with metrics.ws_turn_stage_seconds.time(stage="llm"):
+                ai_message = await llm_router.complete(messages, max_tokens=150, temperature=0.7)
+            return ai_message
+        except LLMUnavailable as e:
+            print(f"❌ LLM error: {e}")
+            reason = "circuit_open" if isinstance(e, CircuitOpen) else "http_error"
+            metrics.upstream_fallbacks_total.inc(upstream="cerebras", reason=reason)
+            if current_step != 'complete':
+                return next_questions[current_step]
             else:
-                print(f"❌ Cerebras API error: {response.status_code}")
-                if current_step != 'complete':
-                    return next_questions[current_step]
-                else:
-                    return generate_specialized_fallback_response(agent, user_message)
-                
+                return generate_specialized_fallback_response(agent, user_message)
+            
     except Exception as e:
         print(f"💥 Error in AI response: {e}")
+        metrics.upstream_fallbacks_total.inc(upstream="cerebras", reason="exception")
         if current_step != 'complete':
             next_questions = {
                 'name': f"Hello! I'm {agent.name}. To get started, could you please tell me your name?",
@@ -271,10 +455,10 @@ def generate_specialized_fallback_response(agent, user_message):
 async def save_participant_data_to_db(session_id: str, db: Session):
     """Save collected participant data to database"""
     try:
-        state = manager.conversation_states.get(session_id, {})
-        collected_data = state.get('collected_data', {})
+        state = manager.get_state(session_id)
+        collected_data = state.collected_data
         
-        if not collected_data or state.get('collection_step') != 'complete':
+        if not collected_data or state.collection_step != 'complete':
             return
         
         # Find conversation by session_id
@@ -288,6 +472,7 @@ async def save_participant_data_to_db(session_id: str, db: Session):
             conversation.participant_age = int(collected_data.get('age', 0)) if collected_data.get('age', '0').isdigit() else 0
             conversation.participant_gender = collected_data.get('gender', 'unknown')
             conversation.participant_location = collected_data.get('location', 'Unknown')
+            geocoding.apply_to_conversation(conversation)
             
             # Store discussion topic in participant_info
             if not conversation.participant_info:
@@ -296,6 +481,23 @@ async def save_participant_data_to_db(session_id: str, db: Session):
             
             db.commit()
             print(f"✅ Saved participant data for session {session_id}")
+            
+            # Saved again on later turns; announce it once
+            if not state.participant_published:
+                state.participant_published = True
+                event_bus.publish(
+                    events.PARTICIPANT_COMPLETED,
+                    agent_id=conversation.agent_id,
+                    conversation_id=conversation.id,
+                    session_id=session_id,
+                    name=conversation.participant_name,
+                    age=conversation.participant_age,
+                    gender=conversation.participant_gender,
+                    location=conversation.participant_location,
+                    latitude=conversation.location_latitude,
+                    longitude=conversation.location_longitude,
+                    topic=collected_data.get('topic', '')
+                )
         
     except Exception as e:
         print(f"❌ Error saving participant data: {e}")
@@ -304,9 +506,11 @@ async def save_participant_data_to_db(session_id: str, db: Session):
 @router.post("/start-direct/{agent_link}")
 async def start_conversation_direct(
     agent_link: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Start conversation directly without participant form"""
+    ensure_accepting_sessions(request)
     agent = crud.get_agent_by_link(db=db, agent_link=agent_link)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
@@ -314,6 +518,8 @@ async def start_conversation_direct(
     if not agent.is_active:
         raise HTTPException(status_code=404, detail="Agent is not active")
     
+    rate_limit.check_agent_quota(db, agent)
+    
     # Create conversation with empty participant data (will be collected during chat)
     session_id = str(uuid.uuid4())
     
@@ -328,8 +534,13 @@ async def start_conversation_direct(
         full_conversation=[],
         key_terms={}
     )
-    db.add(db_conversation)
-    db.commit()
+    try:
+        db.add(db_conversation)
+        db.commit()
+    except Exception:
+        # Not started, so it does not count against the daily quota
+        rate_limit.release_daily_quota(agent.id)
+        raise
     db.refresh(db_conversation)
     
     # Generate welcome message for data collection
@@ -345,7 +556,8 @@ async def start_conversation_direct(
     crud.update_conversation(
         db=db,
         conversation_id=db_conversation.id,
-        messages=initial_conversation_history
+        messages=initial_conversation_history,
+        new_messages=initial_conversation_history
     )
     
     return {
@@ -359,18 +571,27 @@ async def start_conversation_direct(
 async def start_conversation(
     agent_link: str,
     participant_data: schemas.ParticipantFormData,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Legacy endpoint: Start conversation with participant form (keeping for compatibility)"""
+    ensure_accepting_sessions(request)
     agent = crud.get_agent_by_link(db=db, agent_link=agent_link)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    conversation = crud.create_conversation(
-        db=db,
-        agent_id=agent.id,
-        participant_data=participant_data
-    )
+    rate_limit.check_agent_quota(db, agent)
+    
+    try:
+        conversation = crud.create_conversation(
+            db=db,
+            agent_id=agent.id,
+            participant_data=participant_data
+        )
+    except Exception:
+        # Not started, so it does not count against the daily quota
+        rate_limit.release_daily_quota(agent.id)
+        raise
     
     welcome_message = f"Hello {participant_data.name}! I'm {agent.name}, and I'm excited to learn about your experiences with {agent.purpose}. What would you like to discuss today?"
     
@@ -384,7 +605,8 @@ async def start_conversation(
     crud.update_conversation(
         db=db,
         conversation_id=conversation.id,
-        messages=initial_conversation_history
+        messages=initial_conversation_history,
+        new_messages=initial_conversation_history
     )
     
     return {
@@ -397,10 +619,11 @@ async def start_conversation(
 @router.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     """Enhanced WebSocket endpoint with data collection"""
-    await manager.connect(websocket, session_id)
+    if not await manager.connect(websocket, session_id):
+        return
     
-    from app.database import SessionLocal
     db = SessionLocal()
+    slot_agent_id = None
     
     try:
         conversation = db.query(models.Conversation).filter(
@@ -408,34 +631,46 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         ).first()
         
         if not conversation:
-            await websocket.send_text(json.dumps({"error": "Conversation not found"}))
+            await serialization.send_json(websocket, {"error": "Conversation not found"})
             return
             
         agent = conversation.agent
+        if not rate_limit.acquire_session(agent):
+            await websocket.close(code=rate_limit.WS_CLOSE_TRY_AGAIN_LATER)
+            return
+        slot_agent_id = agent.id
+        # A resumed session writes to its transcript again, so it leaves cold storage
+        archive.restore(db, conversation)
+        if conversation.session_state:
+            # Resumed after a server restart
+            manager.restore_state(session_id, conversation.session_state)
+            conversation.session_state = None
+            db.commit()
         conversation_history = conversation.full_conversation or []
+        # Plain ids for live events; ORM attributes expire on every commit
+        agent_id, conversation_id = agent.id, conversation.id
         
         # Send connection info
-        await websocket.send_text(json.dumps({
+        await serialization.send_json(websocket, {
             "agent_name": agent.name,
             "agent_purpose": agent.purpose,
             "participant_name": conversation.participant_name if conversation.participant_name != "Collecting..." else None,
             "conversation_id": conversation.id,
             "type": "connection_info"
-        }))
+        })
         
         # Send welcome message if it exists
         if conversation_history and conversation_history[0].get("type") == "welcome":
             welcome_msg = conversation_history[0]
-            await websocket.send_text(json.dumps({
+            await serialization.send_json(websocket, {
                 "message": welcome_msg["message"],
                 "sender": "agent",
                 "type": "welcome",
                 "timestamp": welcome_msg.get("timestamp")
-            }))
+            })
         
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await serialization.receive_json(websocket)
             
             user_message = message_data.get("message", "").strip()
             message_type = message_data.get("type", "text")
@@ -443,6 +678,14 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             if not user_message:
                 continue
             
+            if manager.draining:
+                # No new turns during a restart; the client resends after reconnecting
+                await websocket.close(code=WS_CLOSE_SERVICE_RESTART)
+                raise WebSocketDisconnect(code=WS_CLOSE_SERVICE_RESTART)
+            
+            manager.turns_in_flight.add(session_id)
+            turn_started = time.perf_counter()
+            
             # Add user message to history
             user_msg = {
                 "sender": "user",
@@ -464,38 +707,73 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             }
             conversation_history.append(agent_msg)
             
-            # Update conversation in database
-            crud.update_conversation(
-                db=db,
-                conversation_id=conversation.id,
-                messages=conversation_history
-            )
+            with query_stats.track_queries() as turn_db, \
+                    metrics.ws_turn_stage_seconds.time(stage="db_write"):
+                # Update conversation in database (group-committed with other
+                # sessions' turns when write-behind is enabled)
+                if write_behind.enabled:
+                    await write_behind.submit(conversation_id, conversation_history, [user_msg, agent_msg])
+                else:
+                    crud.update_conversation(
+                        db=db,
+                        conversation_id=conversation_id,
+                        messages=conversation_history,
+                        new_messages=[user_msg, agent_msg]
+                    )
+                
+                # Check if we completed data collection and save to DB
+                if manager.get_state(session_id).collection_step == 'complete':
+                    await save_participant_data_to_db(session_id, db)
+            logger.debug("Turn DB usage for session %s: %r", session_id, turn_db)
             
-            # Check if we completed data collection and save to DB
-            state = manager.conversation_states.get(session_id, {})
-            if state.get('collection_step') == 'complete':
-                await save_participant_data_to_db(session_id, db)
+            event_bus.publish(
+                events.TURN_STORED,
+                agent_id=agent_id,
+                conversation_id=conversation_id,
+                session_id=session_id,
+                user_message=user_msg,
+                agent_message=agent_msg,
+                message_count=len(conversation_history),
+                collection_step=manager.get_state(session_id).collection_step
+            )
             
             # Send AI response
-            await websocket.send_text(json.dumps({
-                "message": ai_response,
-                "sender": "agent",
-                "type": "text",
-                "timestamp": agent_msg["timestamp"]
-            }))
+            with metrics.ws_turn_stage_seconds.time(stage="send"):
+                await serialization.send_json(websocket, {
+                    "message": ai_response,
+                    "sender": "agent",
+                    "type": "text",
+                    "timestamp": agent_msg["timestamp"]
+                })
+            
+            metrics.ws_turn_seconds.observe(time.perf_counter() - turn_started)
+            manager.turns_in_flight.discard(session_id)
             
     except WebSocketDisconnect:
+        manager.turns_in_flight.discard(session_id)
+        if manager.draining:
+            # The session resumes on another server: keep where it was and
+            # store its buffered turns, but do not finalize the conversation
+            manager.save_states([session_id])
+            manager.disconnect(session_id)
+            if write_behind.enabled and 'conversation_id' in locals():
+                await write_behind.flush(conversation_id)
+            return
         manager.disconnect(session_id)
         
         # Save final data and generate summary on disconnect
         if 'conversation' in locals() and len(conversation_history) > 1:
             try:
+                if write_behind.enabled:
+                    # Finalize only once every buffered turn is stored
+                    await write_behind.flush(conversation_id)
+                    db.expire(conversation)
+                
                 # Save any remaining participant data
                 await save_participant_data_to_db(session_id, db)
                 
                 # Generate summary
-                state = manager.conversation_states.get(session_id, {})
-                collected_data = state.get('collected_data', {})
+                collected_data = manager.get_state(session_id).collected_data
                 
                 participant_data = {
                     'name': collected_data.get('name', 'Unknown'),
@@ -507,10 +785,21 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                     conversation_history, participant_data, agent
                 )
                 
-                conversation.completed_at = datetime.utcnow()
+                conversation_stats.mark_completed(conversation)
                 conversation.summary = summary
                 db.commit()
                 
+                event_bus.publish(
+                    events.CONVERSATION_FINALIZED,
+                    agent_id=agent_id,
+                    conversation_id=conversation_id,
+                    session_id=session_id,
+                    completed_at=conversation.completed_at.isoformat() if conversation.completed_at else None,
+                    duration_seconds=conversation.duration_seconds,
+                    user_message_count=conversation.user_message_count,
+                    summary=summary
+                )
+                
                 print(f"Conversation {session_id} completed and summarized")
                 
             except Exception as e:
@@ -518,8 +807,15 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         
     except Exception as e:
         print(f"WebSocket error: {e}")
+        manager.turns_in_flight.discard(session_id)
+        if manager.draining:
+            manager.save_states([session_id])
         manager.disconnect(session_id)
     finally:
+        # Also covers early returns, so no state outlives its socket
+        manager.disconnect(session_id)
+        if slot_agent_id is not None:
+            rate_limit.release_session(slot_agent_id)
         db.close()
 
 async def generate_conversation_summary(conversation_history, participant_data, agent_data):
@@ -597,12 +893,30 @@ async def upload_audio(
         print(f"Error uploading audio: {e}")
         raise HTTPException(status_code=500, detail="Failed to upload audio file")
 
+@router.post("/import/{agent_id}")
+def import_conversations(
+    agent_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Bulk-import conversations for an agent from a JSONL file (one conversation per line)"""
+    agent = crud.get_agent_by_id(db=db, agent_id=agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    if agent.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    return bulk_import.import_file(db, agent_id, file.file).to_dict()
+
 @router.get("/{conversation_id}/summary")
 async def get_conversation_summary(
     conversation_id: int,
+    include_transcript: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Get conversation summary and statistics"""
+    """Get conversation summary and statistics, optionally with the full transcript"""
     conversation = db.query(models.Conversation).filter(
         models.Conversation.id == conversation_id
     ).first()
@@ -610,38 +924,25 @@ async def get_conversation_summary(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    messages = conversation.full_conversation or []
-    user_messages = [msg for msg in messages if msg.get("sender") == "user"]
-    agent_messages = [msg for msg in messages if msg.get("sender") == "agent"]
-    
-    duration_minutes = 0
-    if conversation.created_at and conversation.completed_at:
-        duration = conversation.completed_at - conversation.created_at
-        duration_minutes = round(duration.total_seconds() / 60, 1)
-    
-    all_user_text = " ".join([msg.get("message", "") for msg in user_messages]).lower()
-    common_words = ['the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by']
-    words = [word for word in all_user_text.split() if len(word) > 3 and word not in common_words]
+    # Counts and topics are precomputed at write time; older rows are filled on demand
+    conversation_stats.ensure_stats(conversation)
     
-    word_freq = {}
-    for word in words:
-        word_freq[word] = word_freq.get(word, 0) + 1
+    duration_minutes = conversation_stats.duration_minutes(conversation)
+    duration_minutes = round(duration_minutes, 1) if duration_minutes is not None else 0
     
-    key_topics = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    return {
+    summary = {
         "conversation_id": conversation.id,
         "session_id": conversation.session_id,
         "participant_name": conversation.participant_name,
         "agent_name": conversation.agent.name,
         "duration_minutes": duration_minutes,
-        "total_messages": len(messages),
-        "user_messages": len(user_messages),
-        "agent_messages": len(agent_messages),
+        "total_messages": conversation.total_message_count,
+        "user_messages": conversation.user_message_count,
+        "agent_messages": conversation.agent_message_count,
         "start_time": conversation.created_at.isoformat() if conversation.created_at else None,
         "end_time": conversation.completed_at.isoformat() if conversation.completed_at else None,
         "summary": conversation.summary,
-        "key_topics": [{"topic": topic, "frequency": freq} for topic, freq in key_topics],
+        "key_topics": conversation_stats.key_topics(conversation),
         "has_audio": bool(conversation.audio_recording_path),
         "participant_info": {
             "age": conversation.participant_age,
@@ -649,6 +950,10 @@ async def get_conversation_summary(
             "location": conversation.participant_location
         }
     }
+    if include_transcript:
+        # Old transcripts live in cold storage and are rehydrated here
+        summary["transcript"] = archive.get_transcript(conversation)
+    return summary
 
 @router.get("/{agent_id}/conversations", response_model=List[schemas.ConversationResponse])
 def get_agent_conversations(
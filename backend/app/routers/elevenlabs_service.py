@@ -4,6 +4,7 @@ import aiofiles
 from pathlib import Path
 from typing import Optional
 import logging
+from app import circuit_breaker, metrics
 
 logger = logging.getLogger(__name__)
 
@@ -13,12 +14,21 @@ class ElevenLabsService:
         self.voice_id = os.getenv("ELEVENLABS_VOICE_ID", "TC0Zp7WVFzhA8zpTlRqV")  # Use env var
         self.base_url = "https://api.elevenlabs.io/v1"
         self.audio_dir = Path("audio_recordings/tts")
+        self.breaker = circuit_breaker.get_breaker("elevenlabs")
+    
+    def init_storage(self):
+        """Create the TTS output directory; called from the application lifespan"""
         self.audio_dir.mkdir(parents=True, exist_ok=True)
         
     async def text_to_speech(self, text: str, session_id: str) -> Optional[str]:
         """Generate speech from text using ElevenLabs API"""
         if not self.api_key:
             logger.warning("ElevenLabs API key not configured")
+            metrics.upstream_fallbacks_total.inc(upstream="elevenlabs", reason="not_configured")
+            return None
+        
+        if not self.breaker.allow():
+            metrics.upstream_fallbacks_total.inc(upstream="elevenlabs", reason="circuit_open")
             return None
             
         try:
@@ -38,12 +48,26 @@ class ElevenLabsService:
             }
             
             async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/text-to-speech/{self.voice_id}",
-                    json=data,
-                    headers=headers,
-                    timeout=30.0
-                )
+                try:
+                    with metrics.upstream_request_seconds.time(upstream="elevenlabs"):
+                        response = await client.post(
+                            f"{self.base_url}/text-to-speech/{self.voice_id}",
+                            json=data,
+                            headers=headers,
+                            timeout=30.0
+                        )
+                except httpx.HTTPError:
+                    self.breaker.record_failure()
+                    raise
+                except BaseException:
+                    # Cancelled: no verdict on the upstream
+                    self.breaker.release()
+                    raise
+                metrics.upstream_responses_total.inc(upstream="elevenlabs", status=response.status_code)
+                if circuit_breaker.is_failure_status(response.status_code):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
                 
                 if response.status_code == 200:
                     filename = f"tts_{session_id}_{hash(text) % 10000}.mp3"
@@ -56,10 +80,12 @@ class ElevenLabsService:
                     return str(file_path)
                 else:
                     logger.error(f"ElevenLabs API error: {response.status_code} - {response.text}")
+                    metrics.upstream_fallbacks_total.inc(upstream="elevenlabs", reason="http_error")
                     return None
                     
         except Exception as e:
             logger.error(f"ElevenLabs TTS error: {e}")
+            metrics.upstream_fallbacks_total.inc(upstream="elevenlabs", reason="exception")
             return None
 
 elevenlabs_service = ElevenLabsService()
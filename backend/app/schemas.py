@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -23,7 +23,12 @@ class UserLogin(BaseModel):
     password: str
 
 # Agent Schemas
-class AgentBase(BaseModel):
+class AgentQuotas(BaseModel):
+    sessions_per_minute: Optional[int] = Field(None, ge=1)  # New conversations per minute through the link
+    daily_session_quota: Optional[int] = Field(None, ge=1)  # New conversations per UTC day
+    max_concurrent_sessions: Optional[int] = Field(None, ge=1)
+
+class AgentBase(AgentQuotas):
     name: str
     purpose: str
     segment: str
@@ -63,6 +68,16 @@ class ConversationCreate(BaseModel):
     agent_link: str
     participant_data: ParticipantFormData
 
+class ConversationImport(BaseModel):
+    """One line of a bulk import file (JSONL)"""
+    participant: ParticipantFormData
+    messages: List[ConversationMessage] = []
+    session_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    summary: Optional[str] = None
+    key_terms: Optional[Dict[str, Any]] = None
+
 class ConversationResponse(BaseModel):
     id: int
     session_id: str
@@ -97,6 +112,38 @@ class AnalyticsResponse(BaseModel):
     gender_breakdown: List[GenderBreakdown]
     location_data: List[LocationData]
 
+class PortfolioTotals(BaseModel):
+    total_conversations: int
+    completed_conversations: int
+    avg_duration_seconds: Optional[float] = None
+    avg_turns: Optional[float] = None
+    age_distribution: List[AgeDistribution]
+    gender_breakdown: List[GenderBreakdown]
+    location_data: List[LocationData]
+
+class PortfolioAgentSummary(PortfolioTotals):
+    agent_id: int
+    name: str
+    is_active: Optional[bool] = None
+
+class PortfolioResponse(PortfolioTotals):
+    total_agents: int
+    agents: List[PortfolioAgentSummary]
+
+class TimeSeriesBucket(BaseModel):
+    bucket_start: datetime
+    started: int
+    completed: int
+    avg_duration_seconds: Optional[float] = None
+    avg_turns: Optional[float] = None
+
+class TimeSeriesResponse(BaseModel):
+    agent_id: int
+    granularity: str
+    start: datetime
+    end: datetime
+    buckets: List[TimeSeriesBucket]
+
 # Token Schema
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,230 @@
+"""
+Full-text search over conversation transcripts.
+
+Every stored turn is also written to the `conversation_messages` table. On
+SQLite an external-content FTS5 index over that table is kept in sync by
+triggers, so inserts from any code path (live turns, backfill, imports)
+are indexed in the same transaction. The agent id is an indexed column
+and part of every MATCH expression, so a search only ranks the agent's
+own messages however large the corpus grows. Other databases fall back
+to a case-insensitive LIKE scan.
+
+    python -m app.search backfill   # index transcripts stored before this existed
+"""
+import re
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import archive, models
+
+FTS_TABLE = "conversation_messages_fts"
+SNIPPET_TOKENS = 12
+
+_FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        message,
+        agent_id,
+        conversation_id UNINDEXED,
+        sender UNINDEXED,
+        content='conversation_messages',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS conversation_messages_fts_ai AFTER INSERT ON conversation_messages BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, message, agent_id, conversation_id, sender)
+        VALUES (new.id, new.message, new.agent_id, new.conversation_id, new.sender);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS conversation_messages_fts_ad AFTER DELETE ON conversation_messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message, agent_id, conversation_id, sender)
+        VALUES ('delete', old.id, old.message, old.agent_id, old.conversation_id, old.sender);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS conversation_messages_fts_au AFTER UPDATE ON conversation_messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message, agent_id, conversation_id, sender)
+        VALUES ('delete', old.id, old.message, old.agent_id, old.conversation_id, old.sender);
+        INSERT INTO {FTS_TABLE}(rowid, message, agent_id, conversation_id, sender)
+        VALUES (new.id, new.message, new.agent_id, new.conversation_id, new.sender);
+    END
+    """,
+]
+
+_TOKEN_RE = re.compile(r"[\w']+\*?", re.UNICODE)
+
+
+def fts_available(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def init_search_index(engine):
+    """Create the FTS5 table and sync triggers (idempotent)"""
+    if not fts_available(engine):
+        return
+    with engine.begin() as conn:
+        existing = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).scalar()
+        # Indexes created before agent_id was indexed are rebuilt once
+        outdated = existing is not None and "agent_id UNINDEXED" in existing
+        if outdated:
+            conn.exec_driver_sql(f"DROP TABLE {FTS_TABLE}")
+        for statement in _FTS_SCHEMA:
+            conn.exec_driver_sql(statement)
+        if outdated:
+            conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def rebuild_search_index(engine):
+    """Re-derive the whole FTS index from conversation_messages"""
+    if not fts_available(engine):
+        return
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def build_match_query(query: str, agent_id: Optional[int] = None) -> str:
+    """Turn free text into a safe FTS5 query: quoted terms ANDed, trailing * keeps prefix search.
+
+    With an agent id the terms only match the message column and the query
+    is restricted to that agent's messages.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(query):
+        prefix = token.endswith("*")
+        word = token.rstrip("*").replace('"', "")
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    if not terms or agent_id is None:
+        return " ".join(terms)
+    return f'agent_id:"{int(agent_id)}" AND message:({" ".join(terms)})'
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def message_rows(conversation: models.Conversation, messages: List[Dict]) -> List[models.ConversationMessage]:
+    """ConversationMessage rows for transcript entries of a conversation"""
+    rows = []
+    for msg in messages:
+        timestamp = msg.get("timestamp")
+        try:
+            timestamp = datetime.fromisoformat(timestamp) if timestamp else None
+        except (TypeError, ValueError):
+            timestamp = None
+        rows.append(models.ConversationMessage(
+            conversation_id=conversation.id,
+            agent_id=conversation.agent_id,
+            sender=msg.get("sender"),
+            message=msg.get("message", ""),
+            timestamp=timestamp,
+        ))
+    return rows
+
+
+def search_messages(db: Session, agent_id: int, query: str, limit: int = 20, offset: int = 0) -> Dict:
+    """Ranked message hits for an agent; fetches limit + 1 rows to report has_more"""
+    if fts_available(db.get_bind()):
+        match = build_match_query(query, agent_id=agent_id)
+        if not match:
+            return {"results": [], "has_more": False}
+        rows = db.execute(text(f"""
+            SELECT m.id, m.conversation_id, m.sender, m.timestamp,
+                   snippet({FTS_TABLE}, 0, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet,
+                   bm25({FTS_TABLE}, 1.0, 0.0) AS rank
+            FROM {FTS_TABLE}
+            JOIN conversation_messages AS m ON m.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :match
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """), {"match": match, "limit": limit + 1, "offset": offset}).all()
+        hits = [{
+            "message_id": row.id,
+            "conversation_id": row.conversation_id,
+            "sender": row.sender,
+            "timestamp": row.timestamp,
+            "snippet": row.snippet,
+            "rank": round(row.rank, 4),
+        } for row in rows]
+    else:
+        rows = db.query(models.ConversationMessage).filter(
+            models.ConversationMessage.agent_id == agent_id,
+            models.ConversationMessage.message.ilike(_like_pattern(query), escape="\\"),
+        ).order_by(models.ConversationMessage.id.desc()).offset(offset).limit(limit + 1).all()
+        hits = [{
+            "message_id": row.id,
+            "conversation_id": row.conversation_id,
+            "sender": row.sender,
+            "timestamp": row.timestamp,
+            "snippet": _plain_snippet(row.message, query),
+            "rank": None,
+        } for row in rows]
+
+    return {"results": hits[:limit], "has_more": len(hits) > limit}
+
+
+def _plain_snippet(message: str, query: str, width: int = 60) -> str:
+    position = message.lower().find(query.lower())
+    if position < 0:
+        return message[:width * 2]
+    start = max(0, position - width)
+    end = min(len(message), position + len(query) + width)
+    return ("..." if start else "") + message[start:end] + ("..." if end < len(message) else "")
+
+
+def backfill_messages(db: Session, batch_size: int = 500) -> int:
+    """Copy transcripts of conversations without message rows into conversation_messages"""
+    indexed = db.query(models.ConversationMessage.conversation_id).distinct()
+    query = db.query(models.Conversation).filter(
+        models.Conversation.id.notin_(indexed)
+    ).order_by(models.Conversation.id)
+
+    total = 0
+    last_id = 0
+    while True:
+        batch = query.filter(models.Conversation.id > last_id).limit(batch_size).all()
+        if not batch:
+            break
+        archive.preload_transcripts(db, batch)
+        for conversation in batch:
+            rows = message_rows(conversation, archive.get_transcript(conversation))
+            db.add_all(rows)
+            total += len(rows)
+        last_id = batch[-1].id
+        db.commit()
+        db.expunge_all()
+    return total
+
+
+def main(argv: Optional[List[str]] = None):
+    from .database import SessionLocal, engine
+    from .migrations import upgrade_schema
+
+    args = argv if argv is not None else sys.argv[1:]
+    command = args[0] if args else "backfill"
+    models.Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    init_search_index(engine)
+    if command == "backfill":
+        with SessionLocal() as db:
+            print(f"Indexed {backfill_messages(db)} messages")
+    elif command == "rebuild":
+        rebuild_search_index(engine)
+        print("Rebuilt search index")
+    else:
+        print("usage: python -m app.search [backfill|rebuild]")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
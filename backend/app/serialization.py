@@ -0,0 +1,71 @@
+"""
+JSON encoding used across the backend.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise (or when JSON_BACKEND=stdlib). The same functions back the
+database JSON columns (`full_conversation`, `participant_info`,
+`key_terms`, ...), WebSocket frames and API responses, so switching
+backends changes all of them together.
+"""
+import json
+import os
+from typing import Any, Callable, Dict, Optional, Union
+
+from fastapi import WebSocket
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+DefaultFn = Optional[Callable[[Any], Any]]
+
+
+def _stdlib_dumps(obj: Any, default: DefaultFn = None) -> str:
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":"))
+
+
+def _stdlib_dumps_bytes(obj: Any, default: DefaultFn = None) -> bytes:
+    return _stdlib_dumps(obj, default).encode("utf-8")
+
+
+def _orjson_dumps_bytes(obj: Any, default: DefaultFn = None) -> bytes:
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _orjson_dumps(obj: Any, default: DefaultFn = None) -> str:
+    return _orjson_dumps_bytes(obj, default).decode("utf-8")
+
+
+BACKENDS: Dict[str, Dict[str, Callable]] = {
+    "stdlib": {"dumps": _stdlib_dumps, "dumps_bytes": _stdlib_dumps_bytes, "loads": json.loads},
+}
+if orjson is not None:
+    BACKENDS["orjson"] = {"dumps": _orjson_dumps, "dumps_bytes": _orjson_dumps_bytes, "loads": orjson.loads}
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "orjson" if orjson is not None else "stdlib")
+if JSON_BACKEND not in BACKENDS:
+    JSON_BACKEND = "stdlib"
+
+_backend = BACKENDS[JSON_BACKEND]
+dumps: Callable[..., str] = _backend["dumps"]
+dumps_bytes: Callable[..., bytes] = _backend["dumps_bytes"]
+loads: Callable[[Union[str, bytes]], Any] = _backend["loads"]
+
+
+class FastJSONResponse(JSONResponse):
+    """Default API response class, rendered with the configured backend"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+
+async def send_json(websocket: WebSocket, payload: Any):
+    """Send one JSON text frame"""
+    await websocket.send_text(dumps(payload))
+
+
+async def receive_json(websocket: WebSocket) -> Any:
+    """Receive one text frame and decode it as JSON"""
+    return loads(await websocket.receive_text())
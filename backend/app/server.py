@@ -0,0 +1,98 @@
+"""
+Production server: uvicorn with several workers and a graceful drain.
+
+On SIGTERM (or Ctrl+C) each worker stops listening, refuses new sessions
+(HTTP 503 / WebSocket close 1012), lets turns that are being answered
+finish for up to SHUTDOWN_DRAIN_SECONDS, stores the data collection
+state of every live session on its conversation and closes the sockets
+with 1012 so clients reconnect to the next server and resume where they
+were. Buffered turn writes are flushed by the application shutdown.
+
+Started with `python run.py --production`; everything is configured from
+the environment:
+
+    HOST, PORT                      bind address (0.0.0.0:8000)
+    WEB_CONCURRENCY                 worker processes (1)
+    SERVER_KEEP_ALIVE_SECONDS       idle HTTP keep-alive (75, above common proxy timeouts)
+    WS_PING_INTERVAL, WS_PING_TIMEOUT
+    SHUTDOWN_DRAIN_SECONDS          time for live sessions to drain (25)
+    SHUTDOWN_GRACE_SECONDS          time for remaining HTTP requests after that (10)
+    SERVER_ACCESS_LOG               1 to log every request (off)
+
+uvloop and httptools are used when installed, asyncio and h11 otherwise.
+With several workers, live events need EVENTS_BACKEND=redis to reach
+subscribers on other workers.
+"""
+import importlib.util
+import logging
+import os
+from typing import List, Optional
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = os.getenv("HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SERVER_KEEP_ALIVE_SECONDS = int(os.getenv("SERVER_KEEP_ALIVE_SECONDS", "75"))
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "20"))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "25"))
+SHUTDOWN_GRACE_SECONDS = int(os.getenv("SHUTDOWN_GRACE_SECONDS", "10"))
+SERVER_ACCESS_LOG = os.getenv("SERVER_ACCESS_LOG", "0") == "1"
+
+LOOP = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+HTTP = "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that drains live conversation sessions before shutting down"""
+
+    async def shutdown(self, sockets: Optional[List] = None) -> None:
+        # Stop listening first so new sessions go to other servers
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        if not self.force_exit:
+            from .routers.conversations import manager
+            logger.info("Draining %s live sessions", len(manager.active_connections))
+            await manager.drain(SHUTDOWN_DRAIN_SECONDS)
+        await super().shutdown(sockets)
+
+
+def build_config(host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = WEB_CONCURRENCY) -> uvicorn.Config:
+    return uvicorn.Config(
+        "app.main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop=LOOP,
+        http=HTTP,
+        ws="websockets",
+        timeout_keep_alive=SERVER_KEEP_ALIVE_SECONDS,
+        ws_ping_interval=WS_PING_INTERVAL,
+        ws_ping_timeout=WS_PING_TIMEOUT,
+        timeout_graceful_shutdown=SHUTDOWN_GRACE_SECONDS,
+        proxy_headers=True,
+        access_log=SERVER_ACCESS_LOG,
+        log_level="info",
+    )
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = WEB_CONCURRENCY):
+    config = build_config(host=host, port=port, workers=workers)
+    server = DrainingServer(config=config)
+    print(f"🚀 Serving on {host}:{port} with {config.workers} worker(s), loop={LOOP}, http={HTTP}")
+    if config.workers > 1:
+        # Schema upgrades run once here; workers inherit SCHEMA_READY and
+        # skip them, so they do not race on create_all and migrations
+        from .main import startup
+        startup()
+        os.environ["SCHEMA_READY"] = "1"
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
@@ -0,0 +1,249 @@
+"""
+Collection-rate time series bucketed in SQL.
+
+Conversations are grouped into hour/day/week buckets (weeks start on
+Monday, all times UTC) by the database, using the (agent_id, created_at)
+and (agent_id, completed_at) indexes for the range filter. Started counts
+are bucketed by `created_at`; completions, average duration and average
+turns by `completed_at`, so a bucket normally stops changing once it has
+elapsed. Elapsed buckets are cached per agent `timeseries_version` and only
+buckets that are still open (or not yet cached) are queried.
+
+Live traffic only writes to open buckets and leaves the cache alone. Writes
+that land in a settled bucket (re-completing a finished conversation,
+backdated imports, deleting old conversations) bump the version, so no
+cached bucket outlives them in any process.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, inspect, literal, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .analytics_cache import ResponseCache
+
+GRANULARITIES = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+MAX_BUCKETS = int(os.getenv("TIMESERIES_MAX_BUCKETS", "2000"))
+# A bucket is only treated as immutable this long after it ends, so turns
+# that were in flight at the boundary have been committed (and have reached
+# the read replica, when DATABASE_READ_URL points at one)
+SETTLE_SECONDS = int(os.getenv("TIMESERIES_SETTLE_SECONDS", "120"))
+
+BUCKET_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# (agent_id, timeseries_version, granularity, bucket start) -> bucket dict
+bucket_cache = ResponseCache(max_entries=int(os.getenv("TIMESERIES_CACHE_MAX_ENTRIES", "50000")))
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Stored timestamps are naive UTC; convert aware inputs to match"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def floor_bucket(value: datetime, granularity: str) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if granularity in ("day", "week"):
+        value = value.replace(hour=0)
+    if granularity == "week":
+        value -= timedelta(days=value.weekday())
+    return value
+
+
+def bucket_starts(start: datetime, end: datetime, granularity: str) -> List[datetime]:
+    step = GRANULARITIES[granularity]
+    current = floor_bucket(start, granularity)
+    starts = []
+    while current < end:
+        starts.append(current)
+        current += step
+    return starts
+
+
+def bucket_expression(column, granularity: str, dialect_name: str):
+    """SQL expression formatting `column` as its bucket start (BUCKET_FORMAT)"""
+    if dialect_name == "sqlite":
+        if granularity == "hour":
+            return func.strftime("%Y-%m-%d %H:00:00", column)
+        if granularity == "day":
+            return func.strftime("%Y-%m-%d 00:00:00", column)
+        # Back up to the previous Tuesday, then forward to Monday
+        return func.strftime("%Y-%m-%d 00:00:00", column, "-6 days", "weekday 1")
+    return func.to_char(func.date_trunc(granularity, column), "YYYY-MM-DD HH24:MI:SS")
+
+
+def _bound(value: datetime, dialect_name: str):
+    # SQLite compares timestamps as text. CURRENT_TIMESTAMP rows have no
+    # fractional seconds, so whole-second bounds must not carry ".000000"
+    if dialect_name == "sqlite":
+        return literal(value.isoformat(sep=" "))
+    return value
+
+
+def _empty_bucket(bucket_start: datetime) -> Dict:
+    return {
+        "bucket_start": bucket_start,
+        "started": 0,
+        "completed": 0,
+        "avg_duration_seconds": None,
+        "avg_turns": None,
+    }
+
+
+def query_buckets(db: Session, agent_id: int, start: datetime, end: datetime, granularity: str) -> Dict[str, Dict]:
+    """Bucket rows for [start, end) keyed by formatted bucket start"""
+    Conversation = models.Conversation
+    dialect_name = db.get_bind().dialect.name
+    lower, upper = _bound(start, dialect_name), _bound(end, dialect_name)
+
+    buckets: Dict[str, Dict] = {}
+
+    started_bucket = bucket_expression(Conversation.created_at, granularity, dialect_name)
+    for bucket, started in db.query(started_bucket, func.count(Conversation.id)).filter(
+        Conversation.agent_id == agent_id,
+        Conversation.created_at >= lower,
+        Conversation.created_at < upper,
+    ).group_by(started_bucket):
+        buckets.setdefault(bucket, {})["started"] = started
+
+    completed_bucket = bucket_expression(Conversation.completed_at, granularity, dialect_name)
+    for bucket, completed, avg_duration, avg_turns in db.query(
+        completed_bucket,
+        func.count(Conversation.id),
+        func.avg(Conversation.duration_seconds),
+        func.avg(Conversation.user_message_count),
+    ).filter(
+        Conversation.agent_id == agent_id,
+        Conversation.completed_at >= lower,
+        Conversation.completed_at < upper,
+    ).group_by(completed_bucket):
+        buckets.setdefault(bucket, {}).update({
+            "completed": completed,
+            "avg_duration_seconds": round(avg_duration, 2) if avg_duration is not None else None,
+            "avg_turns": round(avg_turns, 2) if avg_turns is not None else None,
+        })
+    return buckets
+
+
+def get_timeseries(db: Session, agent_id: int, start: datetime, end: datetime, granularity: str,
+                   version: int = 0, now: Optional[datetime] = None) -> List[Dict]:
+    """Buckets covering [start, end), reusing elapsed buckets cached for the agent's timeseries `version`"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    if end <= start:
+        raise ValueError("end must be after start")
+    starts = bucket_starts(start, end, granularity)
+    if len(starts) > MAX_BUCKETS:
+        raise ValueError(f"Range spans {len(starts)} {granularity} buckets (max {MAX_BUCKETS})")
+
+    step = GRANULARITIES[granularity]
+    settled_before = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+    # Partial buckets at the edges of the range depend on the range itself
+    # and are never cached
+    cacheable = {
+        bucket_start for bucket_start in starts
+        if bucket_start >= start and bucket_start + step <= min(end, settled_before)
+    }
+
+    results: Dict[datetime, Dict] = {}
+    for bucket_start in cacheable:
+        cached = bucket_cache.get((agent_id, version, granularity, bucket_start))
+        if cached is not None:
+            results[bucket_start] = cached
+
+    # One query per contiguous run of uncached buckets, typically the
+    # partial first bucket and the still-open tail
+    for run in _missing_runs(starts, results):
+        run_start = max(start, run[0])
+        run_end = min(end, run[-1] + step)
+        rows = query_buckets(db, agent_id, run_start, run_end, granularity)
+        for bucket_start in run:
+            bucket = _empty_bucket(bucket_start)
+            bucket.update(rows.get(bucket_start.strftime(BUCKET_FORMAT), {}))
+            results[bucket_start] = bucket
+            if bucket_start in cacheable:
+                bucket_cache.put((agent_id, version, granularity, bucket_start), bucket)
+
+    return [results[bucket_start] for bucket_start in starts]
+
+
+def _missing_runs(starts: List[datetime], results: Dict[datetime, Dict]) -> List[List[datetime]]:
+    runs: List[List[datetime]] = []
+    previous_missing = False
+    for bucket_start in starts:
+        missing = bucket_start not in results
+        if missing and previous_missing:
+            runs[-1].append(bucket_start)
+        elif missing:
+            runs.append([bucket_start])
+        previous_missing = missing
+    return runs
+
+
+# Columns the completed-side metrics of a bucket are computed from
+_COMPLETED_METRIC_FIELDS = ("completed_at", "duration_seconds", "user_message_count")
+
+
+def _settled(value, settled_before: datetime) -> bool:
+    return isinstance(value, datetime) and to_utc_naive(value) < settled_before
+
+
+def _stored_in_settled_bucket(conversation: models.Conversation, settled_before: datetime) -> bool:
+    """For inserted or deleted rows; only loaded values are looked at"""
+    values = inspect(conversation).dict
+    return any(_settled(values.get(field), settled_before) for field in ("created_at", "completed_at"))
+
+
+def _change_touches_settled_bucket(conversation: models.Conversation, settled_before: datetime) -> bool:
+    attrs = inspect(conversation).attrs
+    # Old and new timestamps (old ones are always loaded, see active_history on the model)
+    for field in ("created_at", "completed_at"):
+        history = attrs[field].history
+        if history.has_changes() and any(_settled(value, settled_before)
+                                         for value in list(history.added) + list(history.deleted)):
+            return True
+    if attrs["agent_id"].history.has_changes():
+        return _settled(conversation.created_at, settled_before) \
+            or _settled(conversation.completed_at, settled_before)
+    if any(attrs[field].history.has_changes() for field in _COMPLETED_METRIC_FIELDS):
+        return _settled(conversation.completed_at, settled_before)
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_settled_versions(session: Session, flush_context):
+    """Bump timeseries_version of agents whose settled buckets changed in this flush"""
+    settled_before = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+    agent_ids = set()
+    for obj in session.new:
+        if isinstance(obj, models.Conversation) and _stored_in_settled_bucket(obj, settled_before):
+            agent_ids.add(obj.agent_id)
+    for obj in session.deleted:
+        if isinstance(obj, models.Conversation) and _stored_in_settled_bucket(obj, settled_before):
+            agent_ids.add(inspect(obj).dict.get("agent_id"))
+    for obj in session.dirty:
+        if isinstance(obj, models.Conversation) and _change_touches_settled_bucket(obj, settled_before):
+            # A moved conversation leaves its old agent's buckets too
+            agent_ids.add(obj.agent_id)
+            agent_ids.update(inspect(obj).attrs["agent_id"].history.deleted)
+    agent_ids.discard(None)
+    if agent_ids:
+        bump_versions(session, agent_ids)
+
+
+def bump_versions(session: Session, agent_ids):
+    """Invalidate cached settled buckets of the given agents (for writes that bypass the ORM)"""
+    agents = models.Agent.__table__
+    session.connection().execute(
+        update(agents)
+        .where(agents.c.id.in_(sorted(agent_ids)))
+        .values(timeseries_version=func.coalesce(agents.c.timeseries_version, 0) + 1)
+    )
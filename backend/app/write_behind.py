@@ -0,0 +1,263 @@
+"""
+Write-behind buffer for per-turn transcript writes.
+
+With WRITE_BEHIND_MODE=off (the default) every turn commits its own
+transaction, which on SQLite means one fsync per message per session.
+Otherwise turns are handed to a buffer and a single writer thread commits
+the writes of all sessions together: a group commit happens every
+WRITE_BEHIND_INTERVAL_MS, or as soon as WRITE_BEHIND_MAX_BATCH
+conversations are pending. Several turns of one conversation that land in
+the same group are coalesced into one row update.
+
+Durability is chosen with the mode:
+
+- "group": a turn waits for the group commit that contains it before the
+  reply is sent, so an acknowledged turn is never lost. Latency grows by
+  at most one interval, while commits are shared across sessions.
+- "async": a turn returns as soon as it is buffered. A crash can lose up to
+  one interval of turns; readers (analytics, exports) may lag by as much.
+
+Pending writes for a conversation are flushed before it is finalized on
+disconnect, and everything is flushed on shutdown.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud, metrics, models
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_MODE = os.getenv("WRITE_BEHIND_MODE", "off")
+WRITE_BEHIND_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "10"))
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "200"))
+# Attempts before the writes of a failing group are dropped
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "3"))
+
+MODES = ("off", "group", "async")
+
+Waiter = Tuple[asyncio.AbstractEventLoop, asyncio.Future]
+
+
+class PendingWrite:
+    """Coalesced writes for one conversation"""
+
+    __slots__ = ("conversation_id", "messages", "new_messages", "waiters", "first_queued", "attempts")
+
+    def __init__(self, conversation_id: int, messages: List[Dict], new_messages: List[Dict]):
+        self.conversation_id = conversation_id
+        self.messages = messages
+        self.new_messages = list(new_messages)
+        self.waiters: List[Waiter] = []
+        self.first_queued = time.monotonic()
+        self.attempts = 0
+
+    def absorb(self, newer: "PendingWrite"):
+        """Fold a later write for the same conversation into this one"""
+        self.messages = newer.messages
+        self.new_messages.extend(newer.new_messages)
+        self.waiters.extend(newer.waiters)
+
+
+def _resolve(waiters: List[Waiter], error: Optional[BaseException] = None):
+    for loop, future in waiters:
+        def settle(future=future):
+            if future.done():
+                return
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+        try:
+            loop.call_soon_threadsafe(settle)
+        except RuntimeError:
+            # The waiting loop has already shut down
+            pass
+
+
+class WriteBehindBuffer:
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None, mode: str = WRITE_BEHIND_MODE,
+                 interval_ms: float = WRITE_BEHIND_INTERVAL_MS, max_batch: int = WRITE_BEHIND_MAX_BATCH):
+        if mode not in MODES:
+            raise ValueError(f"WRITE_BEHIND_MODE must be one of {', '.join(MODES)}")
+        self._session_factory = session_factory
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[int, PendingWrite] = {}
+        # Waiters for conversations whose writes are being committed right now
+        self._in_flight: Dict[int, List[Waiter]] = {}
+        self._condition = threading.Condition()
+        self._urgent = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from .database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    async def submit(self, conversation_id: int, messages: List[Dict], new_messages: List[Dict]):
+        """Buffer a turn; in "group" mode, return once it is committed"""
+        # The caller keeps appending to its transcript list
+        write = PendingWrite(conversation_id, list(messages), new_messages)
+        future = None
+        if self.mode == "group":
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            write.waiters.append((loop, future))
+
+        with self._condition:
+            if self._closed:
+                write_now = True
+            else:
+                write_now = False
+                existing = self._pending.get(conversation_id)
+                if existing is None:
+                    self._pending[conversation_id] = write
+                else:
+                    existing.absorb(write)
+                metrics.write_behind_records_total.inc()
+                self._ensure_thread()
+                if len(self._pending) >= self.max_batch:
+                    self._urgent = True
+                self._condition.notify()
+
+        if write_now:
+            # Shut down already: fall back to a direct commit
+            self._commit([write])
+        if future is not None:
+            await future
+
+    async def flush(self, conversation_id: Optional[int] = None):
+        """Wait until buffered writes (of one conversation, or all) are committed"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        with self._condition:
+            if conversation_id is None:
+                waiter_lists = [write.waiters for write in self._pending.values()] + list(self._in_flight.values())
+            else:
+                waiter_lists = []
+                if conversation_id in self._pending:
+                    waiter_lists.append(self._pending[conversation_id].waiters)
+                if conversation_id in self._in_flight:
+                    waiter_lists.append(self._in_flight[conversation_id])
+            if not waiter_lists:
+                return
+            for waiters in waiter_lists:
+                future = loop.create_future()
+                waiters.append((loop, future))
+                futures.append(future)
+            self._urgent = True
+            self._condition.notify()
+        await asyncio.gather(*futures)
+
+    def close(self):
+        """Flush everything and stop the writer thread; called on shutdown"""
+        with self._condition:
+            self._closed = True
+            self._urgent = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._pending:
+            # The thread never started or died; write what is left here
+            batch = list(self._pending.values())
+            self._pending.clear()
+            self._commit(batch)
+
+    def _take_batch(self) -> Optional[List[PendingWrite]]:
+        with self._condition:
+            while True:
+                if self._pending:
+                    oldest = min(write.first_queued for write in self._pending.values())
+                    wait = oldest + self.interval - time.monotonic()
+                    if self._urgent or self._closed or wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+            batch = list(self._pending.values())
+            self._pending.clear()
+            self._urgent = False
+            for write in batch:
+                self._in_flight[write.conversation_id] = write.waiters
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._commit(batch)
+
+    def _commit(self, batch: List[PendingWrite]):
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            with self._new_session() as db:
+                ids = [write.conversation_id for write in batch]
+                conversations = {
+                    conversation.id: conversation
+                    for conversation in db.query(models.Conversation).filter(models.Conversation.id.in_(ids))
+                }
+                for write in batch:
+                    conversation = conversations.get(write.conversation_id)
+                    # Deleted meanwhile: nothing to write, as with update_conversation
+                    if conversation is not None:
+                        crud.apply_conversation_update(db, conversation, write.messages,
+                                                       new_messages=write.new_messages)
+                db.commit()
+        except Exception as e:
+            error = e
+            logger.exception("Write-behind group commit of %s conversations failed", len(batch))
+            metrics.write_behind_failures_total.inc()
+
+        metrics.write_behind_flush_seconds.observe(time.perf_counter() - started)
+        metrics.write_behind_batch_size.observe(len(batch))
+
+        retry = []
+        with self._condition:
+            for write in batch:
+                waiters = self._in_flight.pop(write.conversation_id, write.waiters)
+                write.waiters = waiters
+                write.attempts += 1
+                if error is not None and write.attempts < WRITE_BEHIND_MAX_RETRIES and not self._closed:
+                    retry.append(write)
+                    continue
+                if error is not None:
+                    logger.error("Dropping %s buffered messages of conversation %s",
+                                 len(write.new_messages), write.conversation_id)
+                _resolve(waiters, error)
+            # Retried writes go before anything queued since for the same conversation
+            for write in retry:
+                newer = self._pending.get(write.conversation_id)
+                if newer is not None:
+                    write.absorb(newer)
+                write.first_queued = time.monotonic()
+                self._pending[write.conversation_id] = write
+
+
+write_behind = WriteBehindBuffer()
+
+metrics.write_behind_pending.set_function(write_behind.pending_count)
@@ -0,0 +1,7 @@
+"""
+Repeatable microbenchmarks for the backend hot paths.
+
+- datagen: synthetic agents, conversations and messages
+- harness: timing helpers plus JSON result files for comparing commits
+- run: command line entry point (python -m benchmarks.run --help)
+"""
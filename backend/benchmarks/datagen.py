@@ -0,0 +1,191 @@
+"""
+Synthetic dataset generator.
+
+Produces realistic-looking agents, conversations and transcripts that go
+through the same models as live traffic, so benchmarks exercise the real
+query and serialization paths.
+"""
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import conversation_stats, models, search
+
+FIRST_NAMES = [
+    "Amina", "Carlos", "Mei", "John", "Priya", "Kofi", "Elena", "Omar", "Fatima", "Luis",
+    "Hana", "David", "Aisha", "Pedro", "Yuki", "Grace", "Ahmed", "Sofia", "Ravi", "Zanele",
+]
+LOCATIONS = [
+    "Nairobi Kenya", "Lima Peru", "Dhaka Bangladesh", "Lagos Nigeria", "Berlin Germany",
+    "Mumbai India", "Sao Paulo Brazil", "Manila Philippines", "Cairo Egypt", "Hanoi Vietnam",
+    "Accra Ghana", "Bogota Colombia", "Kampala Uganda", "Jakarta Indonesia", "Toronto Canada",
+]
+GENDERS = ["male", "female", "female", "male", "non-binary", "other", "prefer_not_to_say"]
+PURPOSES = {
+    "agriculture": ["farm", "crop", "harvest", "soil", "rain", "seeds", "market", "irrigation", "cattle"],
+    "health": ["doctor", "hospital", "medicine", "clinic", "treatment", "symptoms", "nurse", "insurance"],
+    "education": ["school", "teacher", "student", "exam", "books", "learn", "tuition", "classroom"],
+    "finance": ["money", "bank", "loan", "budget", "income", "savings", "expense", "investment"],
+}
+FILLER = [
+    "we", "usually", "think", "because", "family", "community", "every", "year", "often",
+    "really", "difficult", "better", "during", "season", "people", "village", "city", "help",
+    "price", "time", "work", "young", "older", "support", "change", "problem", "important",
+]
+
+
+@dataclass
+class DatasetSpec:
+    users: int = 1
+    agents_per_user: int = 2
+    conversations_per_agent: int = 500
+    # Number of user/agent exchanges after the intake questions
+    turns_per_conversation: int = 10
+    words_per_message: int = 25
+    completed_ratio: float = 0.8
+    days: int = 60
+    seed: int = 1234
+
+
+def make_sentence(rng: random.Random, purpose: str, words: int) -> str:
+    vocabulary = PURPOSES.get(purpose, FILLER)
+    picked = [rng.choice(vocabulary) if rng.random() < 0.25 else rng.choice(FILLER) for _ in range(words)]
+    picked[0] = picked[0].capitalize()
+    return " ".join(picked) + "."
+
+
+def make_transcript(rng: random.Random, purpose: str, turns: int, words_per_message: int = 25,
+                    started_at: Optional[datetime] = None, participant: Optional[Dict] = None) -> List[Dict]:
+    """Welcome, intake questions and answers, then `turns` free-form exchanges"""
+    started_at = started_at or datetime.utcnow()
+    participant = participant or {}
+    clock = started_at
+
+    def stamp() -> str:
+        nonlocal clock
+        clock += timedelta(seconds=rng.randint(5, 90))
+        return clock.isoformat()
+
+    messages = [{
+        "sender": "agent",
+        "message": f"Hello! I'm here to learn about your experiences with {purpose}. Could you please tell me your name?",
+        "timestamp": started_at.isoformat(),
+        "type": "welcome",
+    }]
+    intake = [
+        (f"My name is {participant.get('name', 'Alex')}", "Nice to meet you! Could you please tell me your age?"),
+        (f"I am {participant.get('age', 30)} years old", "Thank you! Could you please tell me your gender?"),
+        (participant.get("gender", "female"), "Great! Where are you located? Please tell me your city and country."),
+        (f"I live in {participant.get('location', 'Lima Peru')}",
+         f"Perfect! Finally, what specific topic about {purpose} would you like to discuss today?"),
+        (make_sentence(rng, purpose, 8), "That's really interesting! Could you tell me more?"),
+    ]
+    for user_text, agent_text in intake:
+        messages.append({"sender": "user", "message": user_text, "timestamp": stamp(), "type": "text"})
+        messages.append({"sender": "agent", "message": agent_text, "timestamp": stamp(), "type": "text"})
+    for _ in range(turns):
+        messages.append({"sender": "user", "message": make_sentence(rng, purpose, words_per_message),
+                         "timestamp": stamp(), "type": "text"})
+        messages.append({"sender": "agent", "message": make_sentence(rng, purpose, words_per_message // 2),
+                         "timestamp": stamp(), "type": "text"})
+    return messages
+
+
+def make_participant(rng: random.Random) -> Dict:
+    return {
+        "name": rng.choice(FIRST_NAMES),
+        "age": rng.randint(18, 80),
+        "gender": rng.choice(GENDERS),
+        "location": rng.choice(LOCATIONS),
+    }
+
+
+def create_user(db: Session, username: str) -> models.User:
+    user = models.User(
+        username=username,
+        email=f"{username}@example.com",
+        full_name=username.title(),
+        # Benchmarks never log in, so skip the bcrypt cost
+        hashed_password="!",
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def create_agent(db: Session, owner: models.User, purpose: str, name: str) -> models.Agent:
+    agent = models.Agent(
+        name=name,
+        purpose=purpose,
+        segment="synthetic",
+        knowledge=f"Background material about {purpose}. " * 20,
+        dataset_format={"fields": ["name", "age", "gender", "location", "topic"]},
+        system_prompt=f"You are a friendly interviewer collecting {purpose} experiences.",
+        user_prompt="Tell me about your experience.",
+        agent_link=str(uuid.uuid4()),
+        owner_id=owner.id,
+    )
+    db.add(agent)
+    db.commit()
+    db.refresh(agent)
+    return agent
+
+
+def make_conversation(rng: random.Random, agent: models.Agent, spec: DatasetSpec) -> models.Conversation:
+    participant = make_participant(rng)
+    created_at = datetime.utcnow() - timedelta(days=rng.uniform(0, spec.days))
+    transcript = make_transcript(rng, agent.purpose, spec.turns_per_conversation,
+                                 spec.words_per_message, created_at, participant)
+    completed = rng.random() < spec.completed_ratio
+    conversation = models.Conversation(
+        session_id=str(uuid.uuid4()),
+        agent_id=agent.id,
+        participant_name=participant["name"],
+        participant_age=participant["age"],
+        participant_gender=participant["gender"],
+        participant_location=participant["location"],
+        participant_info={"discussion_topic": transcript[9]["message"]},
+        full_conversation=transcript,
+        summary=None,
+        key_terms={"theme": agent.purpose},
+        created_at=created_at,
+        completed_at=datetime.fromisoformat(transcript[-1]["timestamp"]) if completed else None,
+    )
+    # Live writes maintain stats incrementally; generated rows get them up front
+    conversation_stats.compute_stats(conversation)
+    return conversation
+
+
+def _flush_batch(db: Session, conversations: List[models.Conversation]):
+    db.add_all(conversations)
+    db.flush()
+    for conversation in conversations:
+        db.add_all(search.message_rows(conversation, conversation.full_conversation))
+    db.commit()
+
+
+def populate(db: Session, spec: DatasetSpec, batch_size: int = 500) -> List[models.Agent]:
+    """Insert users, agents and conversations described by `spec`; returns the agents"""
+    rng = random.Random(spec.seed)
+    agents = []
+    purposes = list(PURPOSES)
+    for u in range(spec.users):
+        owner = create_user(db, f"bench_user_{u}")
+        for a in range(spec.agents_per_user):
+            agents.append(create_agent(db, owner, purposes[(u + a) % len(purposes)], f"Bench Agent {u}-{a}"))
+
+    for agent in agents:
+        pending = []
+        for _ in range(spec.conversations_per_agent):
+            pending.append(make_conversation(rng, agent, spec))
+            if len(pending) >= batch_size:
+                _flush_batch(db, pending)
+                pending = []
+        if pending:
+            _flush_batch(db, pending)
+    return agents
@@ -0,0 +1,102 @@
+"""
+Timing helpers and JSON result files.
+
+Each benchmark is run `repeat` times with `number` calls per repeat; the
+per-call min/median/mean of the repeats is recorded. Result files carry
+the git commit so runs from different commits can be compared.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def measure(fn: Callable[[], object], number: int = 1, repeat: int = 5, warmup: int = 1) -> Dict:
+    """Per-call timings (ms) of `fn` over `repeat` rounds of `number` calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    return {
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+class BenchmarkRun:
+    def __init__(self, meta: Optional[Dict] = None):
+        self.meta = {
+            "commit": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": datetime.utcnow().isoformat(),
+            **(meta or {}),
+        }
+        self.results: Dict[str, Dict] = {}
+
+    def bench(self, name: str, fn: Callable[[], object], number: int = 1, repeat: int = 5,
+              warmup: int = 1, **params) -> Dict:
+        result = measure(fn, number=number, repeat=repeat, warmup=warmup)
+        if params:
+            result["params"] = params
+        self.results[name] = result
+        print(f"{name:<55} {result['median_ms']:>12.4f} ms (min {result['min_ms']:.4f})")
+        return result
+
+    def record(self, name: str, result: Dict):
+        """Store a result measured outside `bench` (e.g. in a subprocess)"""
+        self.results[name] = result
+        print(f"{name:<55} {result.get('median_ms', 0):>12.4f} ms")
+
+    def to_dict(self) -> Dict:
+        return {"meta": self.meta, "results": self.results}
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        print(f"Saved results to {path}")
+
+
+def compare(baseline_path: str, current: Dict, threshold: float = 0.10) -> int:
+    """Print median deltas against a baseline file; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    base_results = baseline.get("results", {})
+    regressions = 0
+    print(f"\nComparison against {baseline_path} (commit {baseline.get('meta', {}).get('commit', '?')})")
+    for name, result in sorted(current["results"].items()):
+        old = base_results.get(name)
+        if not old or not old.get("median_ms"):
+            print(f"{name:<55} {'new':>12}")
+            continue
+        ratio = result["median_ms"] / old["median_ms"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:<55} {old['median_ms']:>10.4f} -> {result['median_ms']:.4f} ms ({ratio:.2f}x){flag}")
+    return regressions
@@ -0,0 +1,107 @@
+"""
+Cold-start guard based on `python -X importtime`.
+
+Imports a module in a fresh interpreter, reports the cumulative import time
+and the slowest top-level dependencies, and fails when a budget is exceeded
+or a module that must stay lazy (pandas by default) was imported.
+
+    python -m benchmarks.importtime --budget-ms 1500
+    python -m benchmarks.importtime --module app.main --forbid pandas --forbid numpy
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FORBIDDEN = ["pandas"]
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Rows of {module, self_us, cumulative_us, depth} from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        module = parts[2].rstrip()
+        rows.append({
+            "module": module.strip(),
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+            "depth": (len(module) - len(module.lstrip())) // 2,
+        })
+    return rows
+
+
+def measure_import(module: str) -> List[Dict]:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def report(module: str, runs: int = 5, top: int = 10) -> Dict:
+    """Median cumulative import time of `module` over `runs` fresh interpreters"""
+    totals = []
+    rows: List[Dict] = []
+    for _ in range(runs):
+        rows = measure_import(module)
+        target = next((row for row in rows if row["module"] == module), None)
+        totals.append(target["cumulative_us"] if target else sum(row["self_us"] for row in rows))
+    slowest = sorted(rows, key=lambda row: row["cumulative_us"], reverse=True)
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(totals) / 1000, 2),
+        "min_ms": round(min(totals) / 1000, 2),
+        "runs": runs,
+        "imported": sorted({row["module"] for row in rows}),
+        "slowest": [
+            {"module": row["module"], "cumulative_ms": round(row["cumulative_us"] / 1000, 2)}
+            for row in slowest[:top]
+        ],
+    }
+
+
+def check(result: Dict, budget_ms: Optional[float], forbidden: List[str]) -> List[str]:
+    problems = []
+    if budget_ms is not None and result["median_ms"] > budget_ms:
+        problems.append(f"import of {result['module']} took {result['median_ms']} ms (budget {budget_ms} ms)")
+    imported = set(result["imported"])
+    for name in forbidden:
+        if name in imported:
+            problems.append(f"{name} is imported eagerly by {result['module']}")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Import-time report and cold-start guard")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="Fail if the median import time exceeds this")
+    parser.add_argument("--forbid", action="append", help="Module that must not be imported (repeatable)")
+    args = parser.parse_args(argv)
+
+    result = report(args.module, runs=args.runs, top=args.top)
+    print(f"import {result['module']}: median {result['median_ms']} ms, min {result['min_ms']} ms "
+          f"over {result['runs']} runs ({len(result['imported'])} modules)")
+    for row in result["slowest"]:
+        print(f"  {row['cumulative_ms']:>10.2f} ms  {row['module']}")
+
+    problems = check(result, args.budget_ms, args.forbid if args.forbid is not None else DEFAULT_FORBIDDEN)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
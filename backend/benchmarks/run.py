@@ -0,0 +1,342 @@
+"""
+Run the hot-path benchmark suite against a fresh synthetic SQLite database.
+
+    python -m benchmarks.run --conversations 1000 --turns 20 --output bench.json
+    python -m benchmarks.run --compare bench.json      # after a change
+
+The database lives in a temporary directory and is discarded afterwards.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, geocoding, models, prompt_context, query_stats, serialization, timeseries, write_behind
+from app.database import Base
+from app.routers import analytics, conversations
+from benchmarks import datagen, importtime
+from benchmarks.harness import BenchmarkRun, compare
+
+EXTRACTION_SAMPLES = [
+    ("name", "My name is Maria Lopez"),
+    ("name", "Kwame"),
+    ("age", "I am 34 years old"),
+    ("age", "twenty something"),
+    ("gender", "I'm a woman"),
+    ("gender", "prefer not to say"),
+    ("location", "I live in Nairobi, Kenya"),
+    ("topic", "Access to clean water for our crops"),
+]
+
+
+def make_session_factory(directory: str):
+    engine = create_engine(
+        f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        connect_args={"check_same_thread": False},
+        json_serializer=serialization.dumps,
+        json_deserializer=serialization.loads,
+    )
+    # Same instrumentation as the application engine
+    query_stats.instrument_engine(engine)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def bench_extraction(run: BenchmarkRun):
+    def extract_all():
+        for field, message in EXTRACTION_SAMPLES:
+            conversations.extract_participant_data_from_message(message, field)
+
+    run.bench("extract_participant_data_from_message[8 samples]", extract_all, number=2000)
+
+
+def bench_summary_text(run: BenchmarkRun, turns: int):
+    rng = random.Random(7)
+    for size in sorted({turns, turns * 10}):
+        transcript = datagen.make_transcript(rng, "agriculture", size)
+        run.bench(f"extract_conversation_summary[turns={size}]",
+                  lambda t=transcript: analytics.extract_conversation_summary(t),
+                  number=200, turns=size)
+
+
+def bench_distributions(run: BenchmarkRun, Session, agent_id: int, conversations_count: int):
+    for fn in (crud.get_age_distribution, crud.get_gender_breakdown, crud.get_location_data):
+        def call(fn=fn):
+            with Session() as db:
+                fn(db=db, agent_id=agent_id)
+
+        run.bench(f"crud.{fn.__name__}[conversations={conversations_count}]", call,
+                  number=3, conversations=conversations_count)
+
+
+def bench_export(run: BenchmarkRun, Session, agent_id: int, owner_id: int, conversations_count: int):
+    def call():
+        with Session() as db:
+            owner = crud.get_user(db, owner_id)
+            analytics.export_all_conversations_csv(agent_id=agent_id, since=None, db=db, current_user=owner)
+
+    run.bench(f"export_all_conversations_csv[conversations={conversations_count}]", call,
+              number=1, repeat=3, conversations=conversations_count)
+
+
+def bench_geocoding(run: BenchmarkRun, Session, agent_id: int, conversations_count: int):
+    def lookup_uncached():
+        for location in datagen.LOCATIONS:
+            geocoding._geocode_normalized.__wrapped__(geocoding.normalize(location))
+
+    geocoding.get_gazetteer()
+    run.bench(f"geocode[uncached, {len(datagen.LOCATIONS)} locations]", lookup_uncached, number=200)
+
+    with Session() as db:
+        # First call geocodes and persists; the benchmark measures the steady state
+        geocoding.location_points(db, agent_id)
+
+    def call():
+        with Session() as db:
+            geocoding.location_points(db, agent_id)
+
+    run.bench(f"geocoding.location_points[conversations={conversations_count}]", call,
+              number=5, conversations=conversations_count)
+
+
+def bench_portfolio(run: BenchmarkRun, Session, owner_id: int, conversations_count: int):
+    with Session() as db:
+        agents = crud.get_agents_by_user(db, owner_id)
+        agent_ids = [agent.id for agent in agents]
+
+    def per_agent():
+        with Session() as db:
+            for agent_id in agent_ids:
+                crud.get_conversations_by_agent(db=db, agent_id=agent_id)
+                crud.get_age_distribution(db=db, agent_id=agent_id)
+                crud.get_gender_breakdown(db=db, agent_id=agent_id)
+                crud.get_location_data(db=db, agent_id=agent_id)
+
+    def portfolio():
+        with Session() as db:
+            crud.get_portfolio_analytics(db=db, agents=crud.get_agents_by_user(db, owner_id))
+
+    label = f"agents={len(agent_ids)}, conversations={conversations_count}/agent"
+    run.bench(f"dashboard scans per agent[{label}]", per_agent, number=1, repeat=3)
+    run.bench(f"crud.get_portfolio_analytics[{label}]", portfolio, number=3)
+
+
+def bench_timeseries(run: BenchmarkRun, Session, agent_id: int, conversations_count: int):
+    end = datetime.utcnow()
+    start = end - timedelta(days=datagen.DatasetSpec().days)
+    for granularity in ("hour", "day"):
+        def cold(granularity=granularity):
+            timeseries.bucket_cache.clear()
+            with Session() as db:
+                timeseries.get_timeseries(db, agent_id, start, end, granularity)
+
+        def warm(granularity=granularity):
+            with Session() as db:
+                timeseries.get_timeseries(db, agent_id, start, end, granularity)
+
+        run.bench(f"timeseries[{granularity}, cold, conversations={conversations_count}]", cold,
+                  number=3, conversations=conversations_count)
+        warm()
+        run.bench(f"timeseries[{granularity}, elapsed buckets cached]", warm, number=10)
+
+
+def bench_serialization(run: BenchmarkRun, history_sizes: List[int]):
+    """Per-turn JSON cost for each backend: decode the inbound frame, encode the
+    transcript for the JSON column and encode the outbound frame"""
+    rng = random.Random(13)
+    inbound = serialization.BACKENDS["stdlib"]["dumps"]({"message": "We mostly grow maize and beans", "type": "text"})
+    for size in history_sizes:
+        history = datagen.make_transcript(rng, "agriculture", max(0, size // 2 - 5))[:size]
+        frame = {"message": history[-1]["message"], "sender": "agent", "type": "text",
+                 "timestamp": history[-1]["timestamp"]}
+        for name, backend in sorted(serialization.BACKENDS.items()):
+            def turn(backend=backend, history=history):
+                backend["loads"](inbound)
+                backend["dumps"](history)
+                backend["dumps"](frame)
+
+            run.bench(f"json per turn[{name}, messages={len(history)}]", turn,
+                      number=200, backend=name, messages=len(history))
+
+
+def bench_prompt_context(run: BenchmarkRun, history_sizes: List[int]):
+    """Prompt assembly per turn and the resulting prompt size, which should stay
+    flat as the transcript grows"""
+    rng = random.Random(17)
+    knowledge = "\n\n".join(datagen.make_transcript(rng, "agriculture", 60)[i]["message"] * 4 for i in range(100))
+    for size in history_sizes:
+        history = datagen.make_transcript(rng, "agriculture", max(0, size // 2 - 5))[:size]
+        user_message = history[-1]["message"]
+        context_state = {}
+        # The rolling summary is built incrementally during a live interview
+        _, tokens = prompt_context.build_messages("You are an interviewer.", knowledge, history,
+                                                  user_message, context_state)
+        run.bench(f"prompt_context.build_messages[messages={len(history)}]",
+                  lambda history=history, user_message=user_message, context_state=context_state:
+                  prompt_context.build_messages("You are an interviewer.", knowledge, history,
+                                                user_message, context_state),
+                  number=200, messages=len(history), prompt_tokens=tokens)
+
+
+def bench_update_conversation(run: BenchmarkRun, Session, agent, history_sizes: List[int]):
+    rng = random.Random(11)
+    with Session() as db:
+        conversation = datagen.make_conversation(rng, agent, datagen.DatasetSpec(turns_per_conversation=0))
+        db.add(conversation)
+        db.commit()
+        conversation_id = conversation.id
+
+    for size in history_sizes:
+        # size messages = size // 2 exchanges beyond the intake flow
+        history = datagen.make_transcript(rng, agent.purpose, max(0, size // 2 - 5))[:size]
+
+        def call(history=history):
+            with Session() as db:
+                # Same shape as a live turn: full transcript plus the two new entries
+                crud.update_conversation(db=db, conversation_id=conversation_id, messages=list(history),
+                                         new_messages=history[-2:])
+
+        run.bench(f"crud.update_conversation[messages={len(history)}]", call,
+                  number=5, messages=len(history))
+
+
+def bench_write_behind(run: BenchmarkRun, Session, agent, session_counts: List[int], turns: int = 5):
+    """Concurrent sessions each storing `turns` turns: one commit per turn versus
+    group commits through the write-behind buffer"""
+    rng = random.Random(19)
+    for sessions in session_counts:
+        with Session() as db:
+            conversations = [datagen.make_conversation(rng, agent, datagen.DatasetSpec(turns_per_conversation=0))
+                             for _ in range(sessions)]
+            db.add_all(conversations)
+            db.commit()
+            conversation_ids = [conversation.id for conversation in conversations]
+        new_turns = datagen.make_transcript(rng, agent.purpose, turns)[-2 * turns:]
+
+        for mode in ("off", "group"):
+            buffer = write_behind.WriteBehindBuffer(session_factory=Session, mode=mode)
+
+            async def session(conversation_id, buffer=buffer, mode=mode):
+                history = []
+                for turn in range(turns):
+                    new_messages = new_turns[2 * turn:2 * turn + 2]
+                    history.extend(new_messages)
+                    if mode == "off":
+                        with Session() as db:
+                            crud.update_conversation(db=db, conversation_id=conversation_id, messages=list(history),
+                                                     new_messages=new_messages)
+                    else:
+                        await buffer.submit(conversation_id, history, new_messages)
+                    # Yield like a real turn awaiting the LLM and the socket
+                    await asyncio.sleep(0)
+
+            async def all_sessions():
+                await asyncio.gather(*(session(conversation_id) for conversation_id in conversation_ids))
+
+            run.bench(f"store turns[write_behind={mode}, sessions={sessions}, turns={turns}]",
+                      lambda: asyncio.run(all_sessions()), number=1, repeat=3,
+                      mode=mode, sessions=sessions, turns=sessions * turns)
+            buffer.close()
+
+
+def bench_conversation_summary(run: BenchmarkRun, Session, agent_id: int):
+    with Session() as db:
+        conversation_id = db.query(models.Conversation.id).filter(
+            models.Conversation.agent_id == agent_id
+        ).first()[0]
+    loop = asyncio.new_event_loop()
+
+    def call():
+        with Session() as db:
+            loop.run_until_complete(conversations.get_conversation_summary(conversation_id=conversation_id, db=db))
+
+    try:
+        run.bench("get_conversation_summary", call, number=20)
+    finally:
+        loop.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Backend hot-path microbenchmarks")
+    parser.add_argument("--conversations", type=int, default=500, help="Conversations per agent")
+    parser.add_argument("--agents", type=int, default=2)
+    parser.add_argument("--turns", type=int, default=10, help="Free-form exchanges per transcript")
+    parser.add_argument("--history-sizes", default="10,100,1000",
+                        help="Comma separated transcript sizes for update_conversation")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--only", help="Regex; run only benchmarks whose group matches")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold for --compare")
+    args = parser.parse_args(argv)
+
+    spec = datagen.DatasetSpec(
+        agents_per_user=args.agents,
+        conversations_per_agent=args.conversations,
+        turns_per_conversation=args.turns,
+        seed=args.seed,
+    )
+    run = BenchmarkRun(meta={"dataset": vars(spec)})
+    selected = re.compile(args.only) if args.only else None
+
+    def wanted(group: str) -> bool:
+        return selected is None or bool(selected.search(group))
+
+    with tempfile.TemporaryDirectory() as directory:
+        Session = make_session_factory(directory)
+        with Session() as db:
+            first = datagen.populate(db, spec)[0]
+            # Plain copy so it stays usable after the session closes
+            agent = SimpleNamespace(id=first.id, purpose=first.purpose, owner_id=first.owner_id)
+            agent_id, owner_id = agent.id, agent.owner_id
+
+        if wanted("extraction"):
+            bench_extraction(run)
+        if wanted("summary_text"):
+            bench_summary_text(run, args.turns)
+        if wanted("distributions"):
+            bench_distributions(run, Session, agent_id, args.conversations)
+        if wanted("geocoding"):
+            bench_geocoding(run, Session, agent_id, args.conversations)
+        if wanted("portfolio"):
+            bench_portfolio(run, Session, owner_id, args.conversations)
+        if wanted("timeseries"):
+            bench_timeseries(run, Session, agent_id, args.conversations)
+        if wanted("export"):
+            bench_export(run, Session, agent_id, owner_id, args.conversations)
+        if wanted("serialization"):
+            bench_serialization(run, [int(size) for size in args.history_sizes.split(",") if size])
+        if wanted("prompt_context"):
+            bench_prompt_context(run, [int(size) for size in args.history_sizes.split(",") if size])
+        if wanted("update_conversation"):
+            sizes = [int(size) for size in args.history_sizes.split(",") if size]
+            bench_update_conversation(run, Session, agent, sizes)
+        if wanted("write_behind"):
+            bench_write_behind(run, Session, agent, [10, 100])
+        if wanted("conversation_summary"):
+            bench_conversation_summary(run, Session, agent_id)
+
+    if wanted("importtime"):
+        result = importtime.report("app.main", runs=3)
+        run.record("import app.main (cold start)", {
+            key: result[key] for key in ("median_ms", "min_ms", "runs", "slowest")
+        })
+
+    if args.output:
+        run.save(args.output)
+    if args.compare:
+        regressions = compare(args.compare, run.to_dict(), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
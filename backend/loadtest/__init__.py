@@ -0,0 +1,8 @@
+"""
+Load testing tools for the Data Collection Agents API.
+
+- stub_llm: local OpenAI-compatible chat completions server with
+  configurable latency and error profiles
+- run: drives simulated participants through the full intake flow and
+  reports throughput and turn latency percentiles
+"""
@@ -0,0 +1,239 @@
+"""
+End-to-end load generator.
+
+Registers a throwaway user, creates agents through /agents/, then runs N
+concurrent participants. Each participant calls
+/conversations/start-direct/{agent_link} and drives
+/conversations/ws/{session_id} through the full intake flow (name, age,
+gender, location, topic) plus a number of free-form turns.
+
+    # terminal 1: stub upstream
+    python -m loadtest.stub_llm --port 9100 --latency-ms 300
+    # terminal 2: API pointed at the stub; every participant comes from one
+    # IP, so lift the per-IP admission limit
+    CEREBRAS_BASE_URL=http://127.0.0.1:9100/v1 RATE_LIMIT_IP_PER_MINUTE=100000 RATE_LIMIT_IP_BURST=10000 python run.py
+    # terminal 3: load
+    python -m loadtest.run --participants 100 --agents 4 --extra-turns 5
+
+Pass --start-stub to run the stub inside this process instead of
+terminal 1. Requires the `websockets` package.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+INTAKE_ANSWERS = [
+    ["My name is {name}", "I'm {name}", "{name}"],
+    ["I am {age} years old", "{age}", "I'm {age}"],
+    ["male", "female", "I am a woman", "non-binary"],
+    ["I live in {city}", "From {city}", "{city}"],
+    ["I want to talk about crop prices and soil health", "Access to doctors in rural areas",
+     "How my kids learn at school", "Saving money and budgeting"],
+]
+FREE_TURNS = [
+    "We usually plant in spring and harvest before the rains.",
+    "The nearest hospital is about two hours away by bus.",
+    "Most people in my community rely on their families for support.",
+    "Prices have gone up a lot over the last year.",
+    "I think better internet access would help the most.",
+]
+NAMES = ["Amina", "Carlos", "Mei", "John", "Priya", "Kofi", "Elena", "Omar"]
+CITIES = ["Nairobi, Kenya", "Lima, Peru", "Dhaka, Bangladesh", "Lagos, Nigeria", "Berlin, Germany"]
+
+
+@dataclass
+class LoadResult:
+    turn_latencies: List[float] = field(default_factory=list)
+    sessions_started: int = 0
+    sessions_completed: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def participant_script(extra_turns: int) -> List[str]:
+    values = {"name": random.choice(NAMES), "age": random.randint(18, 80), "city": random.choice(CITIES)}
+    script = [random.choice(options).format(**values) for options in INTAKE_ANSWERS]
+    script.extend(random.choice(FREE_TURNS) for _ in range(extra_turns))
+    return script
+
+
+async def setup_agents(client: httpx.AsyncClient, count: int) -> List[str]:
+    """Register a throwaway owner and create agents, returning their public links"""
+    username = f"loadtest_{uuid.uuid4().hex[:8]}"
+    password = uuid.uuid4().hex
+    response = await client.post("/auth/register", json={
+        "username": username, "email": f"{username}@example.com",
+        "password": password, "full_name": "Load Test",
+    })
+    response.raise_for_status()
+    response = await client.post("/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    links = []
+    for i in range(count):
+        response = await client.post("/agents/", headers=headers, json={
+            "name": f"Load Agent {i}",
+            "purpose": random.choice(["agriculture", "health", "education", "finance"]),
+            "segment": "load-test",
+            "knowledge": "Synthetic agent created by the load generator.",
+            "dataset_format": {"fields": ["name", "age", "gender", "location", "topic"]},
+            "system_prompt": "You are a friendly interviewer.",
+            "user_prompt": "Tell me about your experience.",
+        })
+        response.raise_for_status()
+        links.append(response.json()["agent_link"])
+    return links
+
+
+async def run_participant(client: httpx.AsyncClient, ws_base: str, agent_link: str,
+                          extra_turns: int, think_time: float, result: LoadResult):
+    import websockets
+
+    try:
+        response = await client.post(f"/conversations/start-direct/{agent_link}")
+        response.raise_for_status()
+    except Exception:
+        result.error("start")
+        return
+    result.sessions_started += 1
+    session_id = response.json()["session_id"]
+
+    try:
+        async with websockets.connect(f"{ws_base}/conversations/ws/{session_id}") as ws:
+            # connection_info + welcome
+            await ws.recv()
+            await ws.recv()
+            for message in participant_script(extra_turns):
+                if think_time:
+                    await asyncio.sleep(random.uniform(0, think_time))
+                started = time.perf_counter()
+                await ws.send(json.dumps({"message": message, "type": "text"}))
+                frame = json.loads(await ws.recv())
+                result.turn_latencies.append(time.perf_counter() - started)
+                if "error" in frame:
+                    result.error("turn")
+        result.sessions_completed += 1
+    except Exception as e:
+        result.error(type(e).__name__)
+
+
+async def run_load(args) -> dict:
+    result = LoadResult()
+    ws_base = args.base_url.replace("http://", "ws://").replace("https://", "wss://")
+    limits = httpx.Limits(max_connections=args.participants + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60.0, limits=limits) as client:
+        links = await setup_agents(client, args.agents)
+
+        semaphore = asyncio.Semaphore(args.concurrency or args.participants)
+
+        async def guarded(i: int):
+            if args.ramp_up:
+                await asyncio.sleep(args.ramp_up * i / args.participants)
+            async with semaphore:
+                await run_participant(client, ws_base, links[i % len(links)],
+                                      args.extra_turns, args.think_time, result)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(guarded(i) for i in range(args.participants)))
+        elapsed = time.perf_counter() - started
+
+    latencies_ms = [latency * 1000 for latency in result.turn_latencies]
+    return {
+        "participants": args.participants,
+        "agents": args.agents,
+        "sessions_started": result.sessions_started,
+        "sessions_completed": result.sessions_completed,
+        "turns": len(latencies_ms),
+        "elapsed_seconds": round(elapsed, 3),
+        "turns_per_second": round(len(latencies_ms) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies_ms), 2) if latencies_ms else 0.0,
+            "p50": round(percentile(latencies_ms, 50), 2),
+            "p95": round(percentile(latencies_ms, 95), 2),
+            "p99": round(percentile(latencies_ms, 99), 2),
+            "max": round(max(latencies_ms), 2) if latencies_ms else 0.0,
+        },
+        "errors": result.errors,
+    }
+
+
+def print_report(report: dict):
+    latency = report["latency_ms"]
+    print(f"Sessions: {report['sessions_completed']}/{report['sessions_started']} completed "
+          f"({report['participants']} participants, {report['agents']} agents)")
+    print(f"Turns:    {report['turns']} in {report['elapsed_seconds']}s "
+          f"-> {report['turns_per_second']} turns/sec")
+    print(f"Latency:  p50={latency['p50']}ms p95={latency['p95']}ms "
+          f"p99={latency['p99']}ms max={latency['max']}ms")
+    if report["errors"]:
+        print(f"Errors:   {report['errors']}")
+
+
+async def _main(args):
+    stub_server = None
+    if args.start_stub:
+        import uvicorn
+        from loadtest.stub_llm import create_app, profile_from_args
+
+        config = uvicorn.Config(create_app(profile_from_args(args)), host="127.0.0.1",
+                                port=args.stub_port, log_level="warning")
+        stub_server = uvicorn.Server(config)
+        stub_task = asyncio.create_task(stub_server.serve())
+        while not stub_server.started:
+            await asyncio.sleep(0.05)
+        print(f"Stub LLM listening on http://127.0.0.1:{args.stub_port}/v1 "
+              f"(start the API with CEREBRAS_BASE_URL pointing there)")
+    try:
+        report = await run_load(args)
+    finally:
+        if stub_server is not None:
+            stub_server.should_exit = True
+            await stub_task
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def main(argv: Optional[List[str]] = None):
+    from loadtest.stub_llm import add_profile_arguments
+
+    parser = argparse.ArgumentParser(description="Load test the conversation WebSocket flow")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--participants", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=0, help="Max simultaneous sessions (default: all)")
+    parser.add_argument("--agents", type=int, default=2)
+    parser.add_argument("--extra-turns", type=int, default=3, help="Free-form turns after the intake flow")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between turns (s)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which to start participants")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    parser.add_argument("--start-stub", action="store_true", help="Run the stub LLM in this process")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    add_profile_arguments(parser)
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+OpenAI-compatible stub for the Cerebras chat completions API.
+
+Start it and point the backend at it:
+
+    python -m loadtest.stub_llm --port 9100 --latency-ms 300 --jitter-ms 100 --error-rate 0.02
+    CEREBRAS_BASE_URL=http://127.0.0.1:9100/v1 python run.py
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class StubProfile:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    # Requests that hang for hang_ms, to exercise client timeouts
+    hang_rate: float = 0.0
+    hang_ms: float = 35000.0
+
+    def delay_seconds(self) -> float:
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+
+def create_app(profile: StubProfile) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+    app.state.profile = profile
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        app.state.requests += 1
+        roll = random.random()
+        if roll < profile.hang_rate:
+            await asyncio.sleep(profile.hang_ms / 1000)
+        else:
+            await asyncio.sleep(profile.delay_seconds())
+        if roll >= profile.hang_rate and roll < profile.hang_rate + profile.error_rate:
+            return JSONResponse(
+                status_code=profile.error_status,
+                content={"error": {"message": "stub upstream error", "type": "server_error"}},
+            )
+
+        messages = payload.get("messages", [])
+        last_user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        content = f"Thanks for sharing. You said: {last_user[:80]}. Could you tell me more?"
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/v1/models")
+    def list_models():
+        return {"object": "list", "data": [{"id": "llama3.1-8b", "object": "model"}]}
+
+    @app.get("/stats")
+    def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that stall for --hang-ms")
+    parser.add_argument("--hang-ms", type=float, default=35000.0)
+
+
+def profile_from_args(args) -> StubProfile:
+    return StubProfile(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate,
+        hang_ms=args.hang_ms,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(profile_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
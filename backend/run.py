@@ -1,13 +1,25 @@
+import argparse
+import os
+
 import uvicorn
-from app.main import app
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="127.0.0.1",
-        port=8000,
-        reload=True,
-        log_level="info",
-        ws_ping_interval=20,
-        ws_ping_timeout=20
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the API server")
+    parser.add_argument("--production", action="store_true", default=os.getenv("APP_ENV") == "production",
+                        help="multi-worker server with graceful session drain (see app/server.py)")
+    parser.add_argument("--workers", type=int, help="worker processes (production; default WEB_CONCURRENCY)")
+    args = parser.parse_args()
+
+    if args.production:
+        from app.server import serve, WEB_CONCURRENCY
+        serve(workers=args.workers or WEB_CONCURRENCY)
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host="127.0.0.1",
+            port=8000,
+            reload=True,
+            log_level="info",
+            ws_ping_interval=20,
+            ws_ping_timeout=20
+        )